@@ -0,0 +1,221 @@
+import re
+import string
+import sys
+import timeit
+
+# 中日韩文字的Unicode范围：CJK统一汉字及扩展A、兼容汉字、日文假名、韩文音节
+CJK_RANGES = '㐀-䶿一-鿿豈-﫿぀-ヿ가-힯'
+
+# 一次扫描取出所有单词，再统一转小写，和原来的 sub + lower + split + filter 得到的单词完全一致
+WORD_PATTERN = re.compile(r'\w+')
+# 把连续的中日韩文字和其它单词字符分开，'python编程' -> 'python', '编程'
+CJK_WORD_PATTERN = re.compile(r'[{0}]+|[^\W{0}]+'.format(CJK_RANGES))
+CJK_RUN = re.compile(r'^[{0}]+$'.format(CJK_RANGES))
+
+# 纯ASCII文本的快速路径：用bytes.translate把非单词字符换成空格，再在C代码里split
+_ASCII_WORD_BYTES = frozenset((string.ascii_letters + string.digits + '_').encode('ascii'))
+ASCII_WORD_TABLE = bytes(c if c in _ASCII_WORD_BYTES else ord(' ') for c in range(256))
+
+ENGLISH_STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if', 'in', 'into', 'is', 'it',
+    'no', 'not', 'of', 'on', 'or', 'such', 'that', 'the', 'their', 'then', 'there', 'these',
+    'they', 'this', 'to', 'was', 'will', 'with',
+])
+
+
+class Vocabulary(object):
+    """
+    单词和整数ID之间的双向映射。单词字符串经过sys.intern，整个索引中相同的单词只保留一份。
+    """
+
+    def __init__(self):
+        self.term_ids = {}
+        self.terms = []
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return term in self.term_ids
+
+    def get_id(self, term, add=True):
+        term_id = self.term_ids.get(term)
+        if term_id is None and add:
+            term = sys.intern(term)
+            term_id = len(self.terms)
+            self.term_ids[term] = term_id
+            self.terms.append(term)
+        return term_id
+
+    def get_term(self, term_id):
+        return self.terms[term_id]
+
+
+class StopwordFilter(object):
+    def __init__(self, stopwords=ENGLISH_STOPWORDS):
+        self.stopwords = frozenset(stopwords)
+
+    def __call__(self, tokens):
+        stopwords = self.stopwords
+        return [token for token in tokens if token not in stopwords]
+
+
+class SuffixStemmer(object):
+    """
+    简单的英文词干提取，按顺序去掉常见的后缀，词干至少保留min_stem个字符。
+    """
+
+    SUFFIXES = ('ational', 'ization', 'fulness', 'ousness', 'iveness',
+                'ement', 'ment', 'ness', 'ing', 'ies', 'ied', 'ed', 'ly', 'es', 's')
+
+    def __init__(self, min_stem=3):
+        self.min_stem = min_stem
+        self._cache = {}
+
+    def stem(self, token):
+        stem = self._cache.get(token)
+        if stem is None:
+            stem = token
+            for suffix in self.SUFFIXES:
+                if token.endswith(suffix) and len(token) - len(suffix) >= self.min_stem:
+                    stem = token[:-len(suffix)]
+                    if suffix in ('ies', 'ied'):
+                        stem += 'y'
+                    break
+            self._cache[token] = stem
+        return stem
+
+    def __call__(self, tokens):
+        return [self.stem(token) for token in tokens]
+
+
+class CJKBigramFilter(object):
+    """
+    中日韩文字之间没有空格，整句会被当成一个单词。这里把连续的中日韩文字切成重叠的二元组：
+    '我有一个梦想' -> '我有', '有一', '一个', '个梦', '梦想'；单个字保持不变。
+    需要配合Analyzer(cjk=True)使用，保证中日韩文字和其它字符已经被分开。
+    """
+
+    def __call__(self, tokens):
+        result = []
+        for token in tokens:
+            if len(token) > 1 and CJK_RUN.match(token):
+                result.extend(token[i:i + 2] for i in range(len(token) - 1))
+            else:
+                result.append(token)
+        return result
+
+
+class Analyzer(object):
+    """
+    文本分析器：预编译正则一次扫描分词、转小写，然后依次经过可插拔的filters。
+    默认配置和原来BOWEngine.parse_text_to_words的分词结果一致。
+    """
+
+    def __init__(self, filters=(), vocabulary=None, cjk=False):
+        """
+        :param filters:     list        依次作用在单词列表上的处理步骤，比如StopwordFilter、SuffixStemmer
+        :param vocabulary:  Vocabulary  给定时analyze_ids可以把单词映射成整数ID
+        :param cjk:         bool        是否把中日韩文字切成二元组
+        """
+        self.filters = list(filters)
+        self.vocabulary = vocabulary
+        self.pattern = WORD_PATTERN
+        if cjk:
+            self.pattern = CJK_WORD_PATTERN
+            self.filters.insert(0, CJKBigramFilter())
+
+    def tokenize(self, text):
+        # 只分词和转小写，不经过filters
+        if text.isascii():
+            return text.encode('ascii').translate(ASCII_WORD_TABLE).lower().decode('ascii').split()
+        # 含有非ASCII字符时用预编译的正则一次扫描完成分词。必须先分词再转小写：
+        # 'İ'.lower()是'i'加上一个组合附加符号，附加符号不属于\w，先转小写会把一个单词切成两半
+        tokens = self.pattern.findall(text)
+        if not tokens:
+            return []
+        # 转小写不会产生空格，拼起来一次转换比逐个单词调用lower快
+        return ' '.join(tokens).lower().split(' ')
+
+    def analyze(self, text):
+        # 保留顺序和重复的单词列表
+        tokens = self.tokenize(text)
+        for token_filter in self.filters:
+            tokens = token_filter(tokens)
+        return tokens
+
+    def terms(self, text):
+        # 去重后的单词集合，没有filters时直接从findall的结果构造set，不再生成中间列表
+        if not self.filters:
+            return set(self.tokenize(text))
+        return set(self.analyze(text))
+
+    def analyze_ids(self, text, add=True):
+        """
+        返回单词ID列表，add为False时（比如处理查询）跳过不在词表中的单词。
+        """
+        get_id = self._vocabulary().get_id
+        term_ids = [get_id(token, add) for token in self.analyze(text)]
+        return [term_id for term_id in term_ids if term_id is not None]
+
+    def term_ids(self, text, add=True):
+        """
+        返回去重后的单词ID集合，add为False时只要有一个单词不在词表中就返回None，供AND查询提前结束。
+        """
+        get_id = self._vocabulary().get_id
+        term_ids = set()
+        for term in self.terms(text):
+            term_id = get_id(term, add)
+            if term_id is None:
+                return None
+            term_ids.add(term_id)
+        return term_ids
+
+    def _vocabulary(self):
+        if self.vocabulary is None:
+            self.vocabulary = Vocabulary()
+        return self.vocabulary
+
+
+DEFAULT_ANALYZER = Analyzer()
+
+
+def legacy_parse_text_to_words(text):
+    # 原来BOWEngine.parse_text_to_words的实现，用于对比性能
+    text = re.sub(r'[^\w ]', ' ', text)
+    text = text.lower()
+    word_list = text.split(' ')
+    word_list = filter(None, word_list)
+    return set(word_list)
+
+
+def main():
+    texts = []
+    for file_path in ['1.txt', '2.txt', '3.txt', '4.txt', '5.txt']:
+        with open('./input/' + file_path, 'r') as fin:
+            texts.append(fin.read())
+    text = '\n'.join(texts) * 200
+
+    assert legacy_parse_text_to_words(text) == DEFAULT_ANALYZER.terms(text)
+    # 转小写会改变长度或者产生组合附加符号的字符
+    mixed_text = 'İstanbul İYİ Straße ΣΟΦΟΣ ǅemal naïve 我有一个梦想'
+    assert legacy_parse_text_to_words(mixed_text) == DEFAULT_ANALYZER.terms(mixed_text)
+
+    number = 20
+    legacy = timeit.timeit(lambda: legacy_parse_text_to_words(text), number=number) / number
+    current = timeit.timeit(lambda: DEFAULT_ANALYZER.terms(text), number=number) / number
+    print('text size: {} chars'.format(len(text)))
+    print('legacy parse_text_to_words: {:.3f} ms'.format(legacy * 1000))
+    print('Analyzer.terms:             {:.3f} ms ({:.2f}x)'.format(current * 1000, legacy / current))
+
+    chinese_text = '我有一个梦想，有一天我的四个孩子将生活在一个国家。' * 10000
+    legacy = timeit.timeit(lambda: legacy_parse_text_to_words(chinese_text), number=number) / number
+    current = timeit.timeit(lambda: DEFAULT_ANALYZER.terms(chinese_text), number=number) / number
+    print('non-ascii legacy: {:.3f} ms, Analyzer.terms: {:.3f} ms'.format(legacy * 1000, current * 1000))
+
+    chinese = Analyzer(filters=[StopwordFilter()], cjk=True)
+    print(chinese.analyze('我有一个梦想, I have a dream!'))
+
+
+if __name__ == '__main__':
+    main()
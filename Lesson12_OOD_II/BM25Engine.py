@@ -0,0 +1,169 @@
+import heapq
+import math
+from array import array
+from Lesson12_OOD_II.SearchEngineBase import SearchEngineBase
+from Lesson12_OOD_II.Analyzer import Analyzer, Vocabulary
+from Lesson12_OOD_II.PostingList import FrequencyPostingList
+
+
+class BM25Engine(SearchEngineBase):
+    """
+    基于BM25打分的排序检索引擎。
+    和BOWInvertedIndexEngine不同，这里保留了每个单词在文档中出现的次数和文档长度，
+    查询时返回得分最高的top_k个文档，而不是所有满足AND条件的文档。
+    """
+
+    def __init__(self, k1=1.2, b=0.75, analyzer=None):
+        """
+        :param k1:          float       词频饱和参数
+        :param b:           float       文档长度归一化参数
+        :param analyzer:    Analyzer    分词器，默认使用带有独立词表的Analyzer()
+        """
+        super(BM25Engine, self).__init__()
+        self.k1 = k1
+        self.b = b
+        self.analyzer = analyzer if analyzer is not None else Analyzer(vocabulary=Vocabulary())
+        # {单词ID: FrequencyPostingList}
+        self.inverted_index = {}
+        self.doc_ids = {}
+        self.doc_paths = []
+        # 每个文档的单词数，下标是文档ID
+        self.doc_lengths = array('I')
+        self.total_length = 0
+        self.min_length = 0
+
+    def get_doc_id(self, path):
+        if path not in self.doc_ids:
+            self.doc_ids[path] = len(self.doc_paths)
+            self.doc_paths.append(path)
+            self.doc_lengths.append(0)
+        return self.doc_ids[path]
+
+    def process_corpus(self, id, text):
+        doc_id = self.get_doc_id(id)
+        words = self.analyzer.analyze_ids(text)
+
+        term_freqs = {}
+        for term_id in words:
+            term_freqs[term_id] = term_freqs.get(term_id, 0) + 1
+
+        for term_id, freq in term_freqs.items():
+            if term_id not in self.inverted_index:
+                self.inverted_index[term_id] = FrequencyPostingList()
+            self.inverted_index[term_id].append(doc_id, freq)
+
+        self.total_length += len(words) - self.doc_lengths[doc_id]
+        self.doc_lengths[doc_id] = len(words)
+        # 只会变小不会变大，重复添加文档时仍然是一个合法的下界
+        self.min_length = len(words) if len(self.doc_paths) == 1 else min(self.min_length, len(words))
+
+    def idf(self, term_id):
+        doc_count = len(self.doc_paths)
+        doc_freq = len(self.inverted_index[term_id])
+        return math.log(1 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def term_score(self, idf, freq, length, avg_length):
+        norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+        return idf * freq * (self.k1 + 1) / (freq + norm)
+
+    def search(self, query, top_k=10):
+        return [path for path, _ in self.search_with_scores(query, top_k)]
+
+    def query_key(self, query):
+        # 得分只和查询的单词集合有关，单词顺序和重复都不影响结果
+        return frozenset(self.parse_text_to_words(query))
+
+    def search_with_scores(self, query, top_k=10, early_termination=True):
+        """
+        返回[(文件路径, BM25得分)]，按得分从高到低排列。
+        :param query:               str     查询语句，单词之间是OR的关系
+        :param top_k:               int     返回结果的数量
+        :param early_termination:   bool    是否使用WAND跳过不可能进入top_k的文档
+        :return:
+        """
+        if not self.doc_paths or top_k <= 0:
+            return []
+
+        avg_length = max(self.total_length / len(self.doc_paths), 1e-9)
+
+        # 每个查询单词一个游标：[游标, 频次列表, idf, 得分上界]
+        terms = []
+        # 不在词表中的单词不会命中任何文档，直接跳过
+        for term_id in set(self.analyzer.analyze_ids(query, add=False)):
+            # 多个引擎共用一个词表时，词表中的单词不一定出现在这个引擎的索引里
+            if term_id not in self.inverted_index:
+                continue
+            posting_list = self.inverted_index[term_id]
+            idf = self.idf(term_id)
+            # 单词频次最大、文档最短时得分最高，作为该单词的得分上界
+            upper_bound = self.term_score(idf, posting_list.max_freq, self.min_length, avg_length)
+            terms.append([posting_list.cursor(), posting_list.freqs, idf, upper_bound])
+
+        # 小顶堆，保存(得分, -文档ID)，堆顶是当前top_k中最差的结果
+        heap = []
+
+        while True:
+            terms = [term for term in terms if term[0].doc is not None]
+            if not terms:
+                break
+            terms.sort(key=lambda term: term[0].doc)
+
+            threshold = heap[0][0] if early_termination and len(heap) >= top_k else -1.0
+
+            # 找到pivot：按文档ID排序后，得分上界之和第一次超过阈值的位置
+            pivot = None
+            bound_sum = 0.0
+            for idx, term in enumerate(terms):
+                bound_sum += term[3]
+                if bound_sum > threshold:
+                    pivot = idx
+                    break
+
+            # 剩下的文档即使命中所有单词也进不了top_k，提前结束
+            if pivot is None:
+                break
+
+            pivot_doc = terms[pivot][0].doc
+            if terms[0][0].doc == pivot_doc:
+                # pivot之前的游标都已经对齐到pivot_doc，完整计算得分
+                length = self.doc_lengths[pivot_doc]
+                score = 0.0
+                for cursor, freqs, idf, _ in terms:
+                    if cursor.doc != pivot_doc:
+                        break
+                    score += self.term_score(idf, freqs[cursor.index], length, avg_length)
+                    cursor.next()
+
+                entry = (score, -pivot_doc)
+                if len(heap) < top_k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+            else:
+                # pivot之前的文档得分不可能超过阈值，直接跳到pivot_doc
+                for cursor, _, _, _ in terms[:pivot]:
+                    cursor.advance(pivot_doc)
+
+        heap.sort(reverse=True)
+        return [(self.doc_paths[-doc_id], score) for score, doc_id in heap]
+
+    def parse_text_to_words(self, text):
+        # 分词、转小写，保留单词的顺序和重复
+        return self.analyzer.analyze(text)
+
+
+def main(search_engine):
+    for file_path in ['1.txt', '2.txt', '3.txt', '4.txt', '5.txt']:
+        search_engine.add_corpus('./input/' + file_path)
+
+    while True:
+        query = input()
+        results = search_engine.search_with_scores(query)
+        print('found {} results(s):'.format(len(results)))
+        for result, score in results:
+            print('{:.4f} {}'.format(score, result))
+
+
+if __name__ == '__main__':
+    BM25_search_engine = BM25Engine()
+    main(BM25_search_engine)
@@ -1,17 +1,25 @@
-import re
 from Lesson12_OOD_II.SearchEngineBase import SearchEngineBase
+from Lesson12_OOD_II.Analyzer import Analyzer, Vocabulary
 
 
 class BOWEngine(SearchEngineBase):
-    def __init__(self):
+    def __init__(self, analyzer=None):
+        """
+        :param analyzer:    Analyzer    分词器，默认使用带有独立词表的Analyzer()
+        """
         super(BOWEngine, self).__init__()
+        self.analyzer = analyzer if analyzer is not None else Analyzer(vocabulary=Vocabulary())
+        # 每个文档只保存单词ID的集合，相同的单词在所有文档之间共用一个整数
         self.__id_to_words = {}
 
     def process_corpus(self, id, text):
-        self.__id_to_words[id] = self.parse_text_to_words(text)
+        self.__id_to_words[id] = self.analyzer.term_ids(text)
 
     def search(self, query):
-        query_words = self.parse_text_to_words(query)
+        query_words = self.analyzer.term_ids(query, add=False)
+        # 有单词从来没有出现过，AND查询不可能命中
+        if query_words is None:
+            return []
         results = []
 
         for id, words in self.__id_to_words.items():
@@ -20,6 +28,10 @@ class BOWEngine(SearchEngineBase):
 
         return results
 
+    def query_key(self, query):
+        # AND查询只看单词集合
+        return frozenset(self.parse_text_to_words(query))
+
     @staticmethod
     def query_match(query_words, words):
         for query_word in query_words:
@@ -28,18 +40,9 @@ class BOWEngine(SearchEngineBase):
 
         return True
 
-    @staticmethod
-    def parse_text_to_words(text):
-        # 使用正则表达式取出标点符号和换行符
-        text = re.sub(r'[^\w ]', ' ', text)
-        # 转为小写
-        text = text.lower()
-        # 生成所有单词的列表
-        word_list = text.split(' ')
-        # 去除空白词
-        word_list = filter(None, word_list)
-        # 返回单词的set
-        return set(word_list)
+    def parse_text_to_words(self, text):
+        # 分词、转小写，返回单词的set
+        return self.analyzer.terms(text)
 
 
 def main(search_engine):
@@ -55,7 +58,8 @@ def main(search_engine):
             print(result)
 
 
-BOW_search_engine = BOWEngine()
-main(BOW_search_engine)
+if __name__ == '__main__':
+    BOW_search_engine = BOWEngine()
+    main(BOW_search_engine)
 
 
@@ -1,69 +1,145 @@
-import re
+import os
+from array import array
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 from Lesson12_OOD_II.SearchEngineBase import SearchEngineBase
+from Lesson12_OOD_II.Analyzer import DEFAULT_ANALYZER
+from Lesson12_OOD_II.PostingList import PostingList, intersect
+
+# 流式分词时跨块携带的半个单词的最大长度，避免没有分隔符的输入让它无限增长
+MAX_TAIL_CHARS = 1 << 16
 
 
 class BOWInvertedIndexEngine(SearchEngineBase):
-    def __init__(self):
+    def __init__(self, analyzer=None):
+        """
+        :param analyzer:    Analyzer    分词器，默认为DEFAULT_ANALYZER；add_corpora会把它传给工作进程，需要可以pickle
+        """
         super(BOWInvertedIndexEngine, self).__init__()
+        self.analyzer = analyzer if analyzer is not None else DEFAULT_ANALYZER
         self.inverted_index = {}
+        # 文件路径和整数文档ID之间的双向映射，ID按照加入的顺序递增
+        self.doc_ids = {}
+        self.doc_paths = []
+        # 索引的版本号，每次写入都会加一，缓存用它来判断结果是否过期
+        self.generation = 0
+        # 可选的IntersectionCache，用于复用常见单词组合的交集
+        self.intersection_cache = None
+
+    def get_doc_id(self, path):
+        if path not in self.doc_ids:
+            self.doc_ids[path] = len(self.doc_paths)
+            self.doc_paths.append(path)
+        return self.doc_ids[path]
 
     def process_corpus(self, id, text):
+        doc_id = self.get_doc_id(id)
         words = self.parse_text_to_words(text)
         for word in words:
             if word not in self.inverted_index:
-                self.inverted_index[word] = []
-            self.inverted_index[word].append(id)
+                self.inverted_index[word] = PostingList()
+            self.inverted_index[word].append(doc_id)
+        self.generation += 1
+
+    def add_corpora(self, file_paths, workers=None):
+        """
+        并行建索引：先在主进程分配好文档ID，再把文件分批交给进程池分词，
+        每个进程返回自己那一批文档的局部倒序索引，最后按批次顺序合并到inverted_index。
+        :param file_paths:  list    文件路径列表
+        :param workers:     int     进程数，默认为CPU核数
+        :return:
+        """
+        workers = workers or os.cpu_count() or 1
+        docs = [(self.get_doc_id(file_path), file_path) for file_path in file_paths]
+        if not docs:
+            return
+
+        build = partial(build_partial_index, analyzer=self.analyzer)
+        if workers == 1:
+            self.merge_partial_index(build(docs))
+            return
+
+        # 每个进程分到若干批，批次小一些可以让各个进程的负载更均衡
+        batch_size = max(1, len(docs) // (workers * 4))
+        batches = [docs[i:i + batch_size] for i in range(0, len(docs), batch_size)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map按提交顺序返回结果，合并时文档ID保持递增
+            for partial_index in pool.map(build, batches):
+                self.merge_partial_index(partial_index)
+
+    def merge_partial_index(self, partial_index):
+        for word, doc_ids in partial_index.items():
+            if word not in self.inverted_index:
+                self.inverted_index[word] = PostingList()
+            self.inverted_index[word].extend(doc_ids)
+        self.generation += 1
 
     def search(self, query):
-        query_words = list(self.parse_text_to_words(query))
-        query_words_index = list()
-
-        for _ in query_words:
-            query_words_index.append(0)
+        query_words = self.parse_text_to_words(query)
+        if not query_words:
+            return []
 
         # 如果某一个查询单词的倒序索引为空，我们就立刻返回
         for query_word in query_words:
             if query_word not in self.inverted_index:
                 return []
 
-        result = []
-        while True:
-            # 首先，获得当前状态下所有倒序索引的index
-            current_ids = []
+        # 从最短的倒序索引出发，借助跳表求交集
+        posting_lists = self.plan_query(query_words)
+        doc_ids = intersect(posting_lists)
 
-            for idx, query_word in enumerate(query_words):
-                current_index = query_words_index[idx]
-                current_inverted_list = self.inverted_index[query_word]
+        if self.intersection_cache is not None and len(posting_lists) > 1:
+            cost = sum(len(self.inverted_index[query_word]) for query_word in query_words)
+            self.intersection_cache.offer(frozenset(query_words), PostingList.from_ids(doc_ids),
+                                          cost, self.generation)
 
-                # 已经遍历到了某一个倒序索引的末尾，结束serach
-                if current_index >= len(current_inverted_list):
-                    return result
+        return [self.doc_paths[doc_id] for doc_id in doc_ids]
 
-                current_ids.append(current_inverted_list[current_index])
+    def query_key(self, query):
+        # 查询结果只取决于单词集合，'I have a dream' 和 'dream a have I' 的key相同
+        return frozenset(self.parse_text_to_words(query))
 
-            # 然后，如果current_ids的所有元素都一样，那么表明这个单词在这个元素对应的文档中都出现了
-            if all(x == current_ids[0] for x in current_ids):
-                result.append(current_ids[0])
-                query_words_index = [x + 1 for x in query_words_index]
-                continue
+    def plan_query(self, query_words):
+        # 返回需要求交集的倒序索引，有缓存时优先使用缓存中已经算好的部分交集
+        if self.intersection_cache is None:
+            return [self.inverted_index[query_word] for query_word in query_words]
+        return self.intersection_cache.plan(query_words, self.inverted_index, self.generation)
 
-            # 如果不是，我们就把最小的元素加一
-            min_val = min(current_ids)
-            min_val_pos = current_ids.index(min_val)
-            query_words_index[min_val_pos] += 1
+    def parse_text_to_words(self, text):
+        # 分词、转小写，返回单词的set
+        return self.analyzer.terms(text)
 
     @staticmethod
-    def parse_text_to_words(text):
-        # 使用正则表达式去除标点符号和换行符
-        text = re.sub(r'[^\w ]', ' ', text)
-        # 转为小写
-        text = text.lower()
-        # 生成所有单词的列表
-        word_list = text.split(' ')
-        # 取出空白词汇
-        word_list = filter(None, word_list)
-        # 返回单词的set
-        return set(word_list)
+    def parse_file_to_words(file_path, analyzer=DEFAULT_ANALYZER, max_tail=MAX_TAIL_CHARS):
+        # 流式分词，每次只处理一块文本；块末尾可能是半个单词，留到下一块一起处理
+        words = set()
+        tail = ''
+        for chunk in SearchEngineBase.read_in_chunks(file_path):
+            text = tail + chunk
+            end = len(text)
+            while end and (text[end - 1].isalnum() or text[end - 1] == '_'):
+                end -= 1
+            if len(text) - end > max_tail:
+                # 没有分隔符的超长"单词"不再继续累积，直接在块边界处切开
+                end = len(text)
+            tail = text[end:]
+            words.update(analyzer.terms(text[:end]))
+        words.update(analyzer.terms(tail))
+        return words
+
+
+def build_partial_index(docs, analyzer=DEFAULT_ANALYZER):
+    """
+    在工作进程中对一批文档分词，返回{单词: array('Q', 文档ID)}形式的局部倒序索引。
+    docs中的文档ID是递增的，所以每个单词的文档ID列表也是有序的。
+    """
+    partial_index = {}
+    for doc_id, file_path in docs:
+        for word in BOWInvertedIndexEngine.parse_file_to_words(file_path, analyzer):
+            if word not in partial_index:
+                partial_index[word] = array('Q')
+            partial_index[word].append(doc_id)
+    return partial_index
 
 
 def main(search_engine):
@@ -79,5 +155,6 @@ def main(search_engine):
             print(result)
 
 
-BOWInvert_search_engine = BOWInvertedIndexEngine()
-main(BOWInvert_search_engine)
+if __name__ == '__main__':
+    BOWInvert_search_engine = BOWInvertedIndexEngine()
+    main(BOWInvert_search_engine)
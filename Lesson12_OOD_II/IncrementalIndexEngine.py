@@ -0,0 +1,264 @@
+import threading
+from Lesson12_OOD_II.SearchEngineBase import SearchEngineBase
+from Lesson12_OOD_II.Analyzer import DEFAULT_ANALYZER
+from Lesson12_OOD_II.PostingList import PostingList, intersect
+
+
+class Segment(object):
+    """
+    不可变的索引段，保存一段连续文档ID范围内的倒序索引。
+    段建好之后只有deleted（墓碑集合）会增加，被删除的文档在合并时才真正清理掉。
+    """
+
+    def __init__(self, inverted_index, doc_paths):
+        self.inverted_index = inverted_index
+        # {文档ID: 文件路径}
+        self.doc_paths = doc_paths
+        self.deleted = set()
+        self.min_doc = min(doc_paths) if doc_paths else 0
+        self.max_doc = max(doc_paths) if doc_paths else -1
+
+    @classmethod
+    def from_docs(cls, docs):
+        # docs: [(文档ID, 文件路径, 单词集合)]，文档ID递增
+        inverted_index = {}
+        doc_paths = {}
+        for doc_id, path, words in docs:
+            doc_paths[doc_id] = path
+            for word in words:
+                if word not in inverted_index:
+                    inverted_index[word] = PostingList()
+                inverted_index[word].append(doc_id)
+        return cls(inverted_index, doc_paths)
+
+    @classmethod
+    def merge(cls, segments, deleted):
+        """
+        把相邻的几个段合并成一个新段，同时丢掉deleted中的文档。
+        :param segments:    list    按文档ID排好序的段
+        :param deleted:     set     合并开始时这些段中所有被删除的文档ID
+        :return:
+        """
+        inverted_index = {}
+        doc_paths = {}
+        for segment in segments:
+            for doc_id, path in segment.doc_paths.items():
+                if doc_id not in deleted:
+                    doc_paths[doc_id] = path
+            for word, posting_list in segment.inverted_index.items():
+                live_ids = [doc_id for doc_id in posting_list if doc_id not in deleted]
+                if not live_ids:
+                    continue
+                if word not in inverted_index:
+                    inverted_index[word] = PostingList()
+                inverted_index[word].extend(live_ids)
+        return cls(inverted_index, doc_paths)
+
+    @property
+    def live_count(self):
+        return len(self.doc_paths) - len(self.deleted)
+
+    def search(self, query_words):
+        posting_lists = []
+        for query_word in query_words:
+            if query_word not in self.inverted_index:
+                return []
+            posting_lists.append(self.inverted_index[query_word])
+
+        deleted = self.deleted
+        return [doc_id for doc_id in intersect(posting_lists) if doc_id not in deleted]
+
+
+class IncrementalIndexEngine(SearchEngineBase):
+    """
+    支持更新和删除的倒序索引引擎。
+    新文档先进入内存中的写缓冲区，缓冲区满了之后冻结成一个不可变的段；
+    删除只是在段上打墓碑，更新等于删除加上重新加入。
+    段的数量按照分层(tiered)策略控制：同一层中积累了merge_factor个相邻的段，就在后台线程把它们合并成一个更大的段。
+    """
+
+    def __init__(self, buffer_size=1000, merge_factor=10, background_merge=True, analyzer=None):
+        super(IncrementalIndexEngine, self).__init__()
+        self.analyzer = analyzer if analyzer is not None else DEFAULT_ANALYZER
+        self.buffer_size = buffer_size
+        self.merge_factor = merge_factor
+        self.background_merge = background_merge
+
+        self.segments = []
+        # 写缓冲区 {文档ID: (文件路径, 单词集合)}
+        self._buffer = {}
+        # 每个文件路径当前有效的文档ID
+        self._live_ids = {}
+        self._next_doc_id = 0
+
+        self._lock = threading.RLock()
+        self._merge_condition = threading.Condition(self._lock)
+        self._merging = set()
+        self._merge_threads = []
+        self._merge_errors = []
+
+    def process_corpus(self, id, text):
+        words = self.analyzer.terms(text)
+        with self._lock:
+            # 同一个文件再次加入就是更新，先删除旧版本
+            if id in self._live_ids:
+                self._delete_doc(self._live_ids.pop(id))
+
+            doc_id = self._next_doc_id
+            self._next_doc_id += 1
+            self._live_ids[id] = doc_id
+            self._buffer[doc_id] = (id, words)
+
+            if len(self._buffer) >= self.buffer_size:
+                self.flush()
+
+    def update(self, id, text):
+        self.process_corpus(id, text)
+
+    def delete(self, id):
+        with self._lock:
+            if id not in self._live_ids:
+                return False
+            self._delete_doc(self._live_ids.pop(id))
+            return True
+
+    def _delete_doc(self, doc_id):
+        if doc_id in self._buffer:
+            del self._buffer[doc_id]
+            return
+
+        for segment in self.segments:
+            if segment.min_doc <= doc_id <= segment.max_doc:
+                segment.deleted.add(doc_id)
+                return
+
+    def flush(self):
+        # 把写缓冲区冻结成一个新的段，然后检查是否需要合并
+        with self._lock:
+            if not self._buffer:
+                return
+            docs = [(doc_id, path, words) for doc_id, (path, words) in sorted(self._buffer.items())]
+            self.segments.append(Segment.from_docs(docs))
+            self._buffer = {}
+            self._maybe_merge()
+
+    def _tier(self, segment):
+        # 段的层数是floor(log(有效文档数 / buffer_size, merge_factor))，用整数运算避免浮点误差
+        tier = 0
+        bound = self.buffer_size * self.merge_factor
+        while segment.live_count >= bound:
+            tier += 1
+            bound *= self.merge_factor
+        return tier
+
+    def _find_merge(self):
+        # 找到merge_factor个相邻的、处在同一层并且没有正在合并的段
+        run = []
+        for segment in self.segments:
+            if segment in self._merging:
+                run = []
+                continue
+            if run and self._tier(run[-1]) != self._tier(segment):
+                run = []
+            run.append(segment)
+            if len(run) == self.merge_factor:
+                return run
+        return None
+
+    def _maybe_merge(self):
+        while True:
+            candidates = self._find_merge()
+            if candidates is None:
+                return
+
+            self._merging.update(candidates)
+            if not self.background_merge:
+                self._merge(candidates)
+                continue
+
+            thread = threading.Thread(target=self._merge, args=(candidates,), daemon=True)
+            self._merge_threads.append(thread)
+            thread.start()
+
+    def _merge(self, candidates):
+        try:
+            with self._lock:
+                deleted = set()
+                for segment in candidates:
+                    deleted.update(segment.deleted)
+
+            # 合并过程不持有锁，查询和写入都不会被阻塞
+            merged = Segment.merge(candidates, deleted)
+
+            with self._lock:
+                # 合并期间新打的墓碑要转移到新段上
+                for segment in candidates:
+                    merged.deleted.update(segment.deleted - deleted)
+
+                start = self.segments.index(candidates[0])
+                self.segments[start:start + len(candidates)] = [merged]
+        except Exception as error:
+            if not self.background_merge:
+                raise
+            # 后台线程里的异常留给wait_for_merges抛出，原来的段保持不变
+            with self._lock:
+                self._merge_errors.append(error)
+            return
+        finally:
+            # 无论合并成功与否都要清掉标记，否则wait_for_merges会一直等下去
+            with self._lock:
+                self._merging.difference_update(candidates)
+                self._merge_condition.notify_all()
+
+        with self._lock:
+            # 合并出来的大段可能又凑满了上一层
+            self._maybe_merge()
+
+    def wait_for_merges(self):
+        # 等待所有后台合并结束，如果有合并失败，抛出异常
+        with self._merge_condition:
+            while self._merging:
+                self._merge_condition.wait()
+            self._merge_threads = [thread for thread in self._merge_threads if thread.is_alive()]
+            errors, self._merge_errors = self._merge_errors, []
+        if errors:
+            raise Exception('{} background merge(s) failed'.format(len(errors))) from errors[0]
+
+    def search(self, query):
+        query_words = self.analyzer.terms(query)
+        if not query_words:
+            return []
+
+        with self._lock:
+            # 段列表只会被整体替换，拿到快照之后就可以在锁外面查询
+            segments = list(self.segments)
+            results = [(doc_id, path) for doc_id, (path, words) in self._buffer.items()
+                       if query_words <= words]
+
+        for segment in segments:
+            results.extend((doc_id, segment.doc_paths[doc_id]) for doc_id in segment.search(query_words))
+
+        results.sort()
+        return [path for _, path in results]
+
+    def segment_sizes(self):
+        with self._lock:
+            return [segment.live_count for segment in self.segments], len(self._buffer)
+
+
+def main(search_engine):
+    for file_path in ['1.txt', '2.txt', '3.txt', '4.txt', '5.txt']:
+        search_engine.add_corpus('./input/' + file_path)
+    search_engine.flush()
+
+    while True:
+        query = input()
+        results = search_engine.search(query)
+        print('found {} results(s):'.format(len(results)))
+        for result in results:
+            print(result)
+
+
+if __name__ == '__main__':
+    incremental_search_engine = IncrementalIndexEngine(buffer_size=2, merge_factor=2)
+    main(incremental_search_engine)
@@ -0,0 +1,229 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from Lesson12_OOD_II.SearchEngineBase import SearchEngineBase
+from Lesson12_OOD_II.Analyzer import DEFAULT_ANALYZER
+from Lesson12_OOD_II.BOWInvertedindexEngine import BOWInvertedIndexEngine
+from Lesson12_OOD_II.PostingList import PostingList, intersect
+
+# 段文件的布局：
+#   header | posting blocks | doc table | term dictionary
+# header:       magic, version, skip_interval, 文档数, 单词数, 各部分的偏移
+# posting block: skip_docs(uint64 * n) | skip_offsets(uint64 * n) | varint编码的文档ID
+# 所有整数都按小端序存储，段文件可以在不同字节序的机器之间拷贝
+# doc table:    offsets(uint64 * (文档数 + 1)) | utf-8编码的文件路径
+# term dict:    按utf-8字节序排好的定长记录 | utf-8编码的单词
+MAGIC = b'BOWSEG01'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQQQQ')
+TERM_ENTRY = struct.Struct('<QIIQIIQQ')
+ALIGNMENT = 8
+
+
+def _pad(fout):
+    padding = -fout.tell() % ALIGNMENT
+    if padding:
+        fout.write(b'\0' * padding)
+
+
+def _pack_uint64s(values):
+    return struct.pack('<{}Q'.format(len(values)), *values)
+
+
+def _uint64s(buffer, start, count):
+    """
+    从段文件中读出count个小端序的uint64。
+    小端机器上直接返回mmap的视图，不拷贝；大端机器上拷贝一份并调整字节序。
+    :param buffer:  memoryview  段文件
+    :param start:   int         起始偏移
+    :param count:   int         个数
+    :return:        memoryview或者array('Q')
+    """
+    view = buffer[start:start + count * 8]
+    if sys.byteorder == 'little':
+        return view.cast('Q')
+    values = array('Q', bytes(view))
+    view.release()
+    values.byteswap()
+    return values
+
+
+def write_segment(engine, path):
+    """
+    把BOWInvertedIndexEngine的倒序索引写成一个段文件。
+    先写到临时文件再改名，读者不会看到写了一半的文件。
+    :param engine:  BOWInvertedIndexEngine  已经建好索引的引擎
+    :param path:    str                     段文件路径
+    :return:
+    """
+    terms = sorted(engine.inverted_index, key=lambda term: term.encode('utf-8'))
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'wb') as fout:
+        fout.write(b'\0' * HEADER.size)
+        _pad(fout)
+
+        # posting blocks
+        entries = []
+        for term in terms:
+            posting_list = engine.inverted_index[term]
+            postings_offset = fout.tell()
+            fout.write(_pack_uint64s(posting_list.skip_docs))
+            fout.write(_pack_uint64s(posting_list.skip_offsets))
+            fout.write(posting_list.data)
+            _pad(fout)
+            entries.append((posting_list, postings_offset))
+
+        # doc table
+        doc_table_offset = fout.tell()
+        encoded_paths = [doc_path.encode('utf-8') for doc_path in engine.doc_paths]
+        offset = 0
+        offsets = [offset]
+        for encoded_path in encoded_paths:
+            offset += len(encoded_path)
+            offsets.append(offset)
+        fout.write(_pack_uint64s(offsets))
+        fout.write(b''.join(encoded_paths))
+        _pad(fout)
+
+        # term dictionary
+        term_dict_offset = fout.tell()
+        encoded_terms = [term.encode('utf-8') for term in terms]
+        term_offset = 0
+        for encoded_term, (posting_list, postings_offset) in zip(encoded_terms, entries):
+            fout.write(TERM_ENTRY.pack(term_offset, len(encoded_term),
+                                       len(posting_list), posting_list.last,
+                                       len(posting_list.skip_docs), 0,
+                                       postings_offset, len(posting_list.data)))
+            term_offset += len(encoded_term)
+        terms_offset = fout.tell()
+        fout.write(b''.join(encoded_terms))
+
+        fout.seek(0)
+        fout.write(HEADER.pack(MAGIC, VERSION, PostingList.SKIP_INTERVAL,
+                               len(engine.doc_paths), len(terms),
+                               doc_table_offset, term_dict_offset, terms_offset))
+
+    os.replace(tmp_path, path)
+
+
+class SegmentReader(SearchEngineBase):
+    """
+    通过mmap读取段文件并回答查询。
+    所有数据都留在page cache里，按需读取，多个进程打开同一个段文件时共享同一份内存。
+    """
+
+    def __init__(self, path, analyzer=None):
+        """
+        :param path:        str         段文件路径
+        :param analyzer:    Analyzer    处理查询的分词器，需要和建索引时使用的一致
+        """
+        super(SegmentReader, self).__init__()
+        self.path = path
+        self.analyzer = analyzer if analyzer is not None else DEFAULT_ANALYZER
+        with open(path, 'rb') as fin:
+            self._mmap = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+
+        (magic, version, self.skip_interval, self.doc_count, self.term_count,
+         self._doc_table_offset, self._term_dict_offset, self._terms_offset) = HEADER.unpack_from(self._buffer)
+        if magic != MAGIC or version != VERSION:
+            raise Exception('{} is not a valid segment file'.format(path))
+        if self.skip_interval != PostingList.SKIP_INTERVAL:
+            raise Exception('segment skip interval {} does not match {}'.format(
+                self.skip_interval, PostingList.SKIP_INTERVAL))
+
+        self._doc_offsets = _uint64s(self._buffer, self._doc_table_offset, self.doc_count + 1)
+        self._doc_paths_offset = self._doc_table_offset + (self.doc_count + 1) * 8
+
+    def close(self):
+        if isinstance(self._doc_offsets, memoryview):
+            self._doc_offsets.release()
+        self._buffer.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # 还有get_posting_list返回的PostingList引用着段文件，等它们被回收后mmap会自动释放
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def process_corpus(self, id, text):
+        raise Exception('segment {} is read-only'.format(self.path))
+
+    def doc_path(self, doc_id):
+        start = self._doc_paths_offset + self._doc_offsets[doc_id]
+        end = self._doc_paths_offset + self._doc_offsets[doc_id + 1]
+        return bytes(self._buffer[start:end]).decode('utf-8')
+
+    def _term_entry(self, idx):
+        return TERM_ENTRY.unpack_from(self._buffer, self._term_dict_offset + idx * TERM_ENTRY.size)
+
+    def _term_at(self, entry):
+        start = self._terms_offset + entry[0]
+        return bytes(self._buffer[start:start + entry[1]])
+
+    def get_posting_list(self, term):
+        # 在定长的单词记录上二分查找
+        key = term.encode('utf-8')
+        low, high = 0, self.term_count
+        while low < high:
+            mid = (low + high) // 2
+            entry = self._term_entry(mid)
+            if self._term_at(entry) < key:
+                low = mid + 1
+            else:
+                high = mid
+
+        if low == self.term_count:
+            return None
+        entry = self._term_entry(low)
+        if self._term_at(entry) != key:
+            return None
+
+        _, _, length, last, skip_count, _, postings_offset, data_length = entry
+        skips_size = skip_count * 8
+        skip_docs = _uint64s(self._buffer, postings_offset, skip_count)
+        skip_offsets = _uint64s(self._buffer, postings_offset + skips_size, skip_count)
+        data_offset = postings_offset + 2 * skips_size
+        data = self._buffer[data_offset:data_offset + data_length]
+        return PostingList.from_buffers(data, skip_docs, skip_offsets, length, last)
+
+    def search(self, query):
+        query_words = self.analyzer.terms(query)
+        if not query_words:
+            return []
+
+        posting_lists = []
+        for query_word in query_words:
+            posting_list = self.get_posting_list(query_word)
+            if posting_list is None:
+                return []
+            posting_lists.append(posting_list)
+
+        return [self.doc_path(doc_id) for doc_id in intersect(posting_lists)]
+
+
+def main():
+    search_engine = BOWInvertedIndexEngine()
+    for file_path in ['1.txt', '2.txt', '3.txt', '4.txt', '5.txt']:
+        search_engine.add_corpus('./input/' + file_path)
+    write_segment(search_engine, './index.seg')
+
+    with SegmentReader('./index.seg') as reader:
+        while True:
+            query = input()
+            results = reader.search(query)
+            print('found {} results(s):'.format(len(results)))
+            for result in results:
+                print(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+import threading
+from array import array
+from collections import OrderedDict
+from itertools import combinations
+from Lesson12_OOD_II.PostingList import PostingList, intersect
+
+
+class CountMinSketch(object):
+    """
+    TinyLFU使用的频率估计器：depth行计数器，每行用不同的种子哈希，估计值取各行的最小值。
+    计数总数达到sample_size后所有计数器减半，让旧的热点逐渐冷却。
+    """
+
+    def __init__(self, width=4096, depth=4, sample_size=None):
+        # width取2的幂，用位运算代替取模
+        self.width = 1 << max(width - 1, 1).bit_length()
+        self.depth = depth
+        self.sample_size = sample_size or self.width * 10
+        self.rows = [array('H', bytes(2 * self.width)) for _ in range(depth)]
+        self.additions = 0
+
+    def _indexes(self, key):
+        mask = self.width - 1
+        return [hash((seed, key)) & mask for seed in range(self.depth)]
+
+    def increment(self, key):
+        for row, idx in zip(self.rows, self._indexes(key)):
+            if row[idx] < 0xffff:
+                row[idx] += 1
+
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._reset()
+
+    def estimate(self, key):
+        return min(row[idx] for row, idx in zip(self.rows, self._indexes(key)))
+
+    def _reset(self):
+        for row in self.rows:
+            for idx in range(self.width):
+                row[idx] >>= 1
+        self.additions //= 2
+
+
+class IntersectionCache(object):
+    """
+    缓存查询单词子集（主要是两两组合）求交集的结果，结果本身也是PostingList，可以直接参与后续的交集运算。
+    准入有两道门槛：
+    1. 代价：参与求交集的倒序索引总长度小于min_cost的组合算起来很便宜，不值得缓存；
+    2. 频率：用TinyLFU估计访问频率，缓存满时只有比LRU队尾更热的组合才能把它挤出去。
+    """
+
+    def __init__(self, size=256, max_bytes=16 << 20, min_cost=1000, min_frequency=2, max_pair_words=8):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.min_cost = min_cost
+        self.min_frequency = min_frequency
+        # 查询单词很多时，只在最稀有的几个单词里枚举两两组合
+        self.max_pair_words = max_pair_words
+        self.sketch = CountMinSketch(width=size * 16)
+
+        # frozenset(单词) -> (generation, PostingList)
+        self.cache = OrderedDict()
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.admissions = 0
+        self.rejections = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+
+    def get(self, key, generation):
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry is None or entry[0] != generation:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def offer(self, key, posting_list, cost, generation):
+        """
+        尝试把一个交集结果放入缓存，返回是否被接受。
+        :param key:             frozenset       参与求交集的单词
+        :param posting_list:    PostingList     交集结果
+        :param cost:            int             算出这个结果扫描过的倒序索引总长度
+        :param generation:      int             计算时索引的版本号
+        :return:
+        """
+        if cost < self.min_cost:
+            return False
+
+        nbytes = posting_list.nbytes()
+        if nbytes > self.max_bytes:
+            return False
+
+        with self._lock:
+            # 同一个组合的旧结果（索引版本已经过期）直接被替换，不需要再经过准入判断
+            replaced = self.cache.get(key)
+            count = len(self.cache)
+            total = self.nbytes
+            if replaced is not None:
+                count -= 1
+                total -= replaced[1].nbytes()
+
+            # 先从LRU队尾选出需要淘汰的条目，比较完频率之后再真正淘汰
+            victims = []
+            for victim, (_, victim_list) in self.cache.items():
+                if count < self.size and total + nbytes <= self.max_bytes:
+                    break
+                if victim == key:
+                    continue
+                victims.append(victim)
+                count -= 1
+                total -= victim_list.nbytes()
+
+            # TinyLFU：新条目必须比每一个被淘汰的条目都更常用
+            if victims and replaced is None:
+                frequency = self.sketch.estimate(key)
+                if max(self.sketch.estimate(victim) for victim in victims) >= frequency:
+                    self.rejections += 1
+                    return False
+
+            if replaced is not None:
+                self._remove(key)
+            for victim in victims:
+                self._remove(victim)
+            self.evictions += len(victims)
+
+            self.cache[key] = (generation, posting_list)
+            self.nbytes += nbytes
+            self.admissions += 1
+            return True
+
+    def _remove(self, key):
+        _, posting_list = self.cache.pop(key)
+        self.nbytes -= posting_list.nbytes()
+
+    def plan(self, query_words, inverted_index, generation):
+        """
+        为一次AND查询选出需要求交集的PostingList：
+        整个查询命中缓存就直接返回；否则尽量用缓存中的两两交集替换原始倒序索引，
+        对足够热并且足够贵的组合，顺便算出交集放进缓存。
+        调用方需要保证所有query_words都在inverted_index中。
+        """
+        full_key = frozenset(query_words)
+        with self._lock:
+            self.sketch.increment(full_key)
+        cached = self.get(full_key, generation)
+        if cached is not None:
+            return [cached]
+
+        words = sorted(query_words, key=lambda word: len(inverted_index[word]))
+        if len(words) < 3:
+            return [inverted_index[word] for word in words]
+
+        pairs = [frozenset(pair) for pair in combinations(words[:self.max_pair_words], 2)]
+        with self._lock:
+            for pair in pairs:
+                self.sketch.increment(pair)
+
+        # 代价高的组合优先，替换掉的扫描量最大
+        pairs.sort(key=lambda pair: -sum(len(inverted_index[word]) for word in pair))
+
+        remaining = set(words)
+        posting_lists = []
+        for pair in pairs:
+            if not pair <= remaining:
+                continue
+
+            posting_list = self.get(pair, generation)
+            if posting_list is None:
+                with self._lock:
+                    frequency = self.sketch.estimate(pair)
+                cost = sum(len(inverted_index[word]) for word in pair)
+                if frequency < self.min_frequency or cost < self.min_cost:
+                    continue
+
+                posting_list = PostingList()
+                posting_list.extend(intersect([inverted_index[word] for word in pair]))
+                self.offer(pair, posting_list, cost, generation)
+
+            posting_lists.append(posting_list)
+            remaining -= pair
+
+        posting_lists.extend(inverted_index[word] for word in words if word in remaining)
+        return posting_lists
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'admissions': self.admissions,
+                'rejections': self.rejections,
+                'evictions': self.evictions,
+                'entries': len(self.cache),
+                'bytes': self.nbytes,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
@@ -1,35 +1,122 @@
-import pylru
+import sys
+import threading
+from collections import OrderedDict
 from Lesson12_OOD_II.BOWInvertedindexEngine import BOWInvertedIndexEngine
 
 
+def sizeof(obj):
+    """
+    估算对象占用的字节数。sys.getsizeof只计算容器本身，list/tuple/set还要加上其中每个元素（比如路径字符串）的大小
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(map(sys.getsizeof, obj))
+    return size
+
+
 class LRUCache(object):
-    def __init__(self, size=32):
-        self.cache = pylru.lrucache(size)
+    """
+    线程安全的LRU缓存，同时限制条目数和占用的字节数。
+    每个条目记录写入时索引的版本号(generation)，读取时版本号不一致就视为过期并丢弃。
+    """
+
+    def __init__(self, size=32, max_bytes=1 << 20):
+        self.size = size
+        self.max_bytes = max_bytes
+        # key -> (generation, value, nbytes)
+        self.cache = OrderedDict()
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self._lock = threading.Lock()
+
+    def has(self, key, generation=None):
+        with self._lock:
+            return key in self.cache and self.cache[key][0] == generation
+
+    def get(self, key, generation=None, default=None):
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            if entry[0] != generation:
+                # 索引已经更新过，缓存的结果过期了
+                self._remove(key)
+                self.invalidations += 1
+                self.misses += 1
+                return default
+
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, generation=None, nbytes=None):
+        if nbytes is None:
+            nbytes = sizeof(key) + sizeof(value)
+        # 单个条目比整个缓存还大，不缓存
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self.cache:
+                # 不要用旧版本的结果覆盖新版本的结果
+                if generation is not None and self.cache[key][0] is not None and self.cache[key][0] > generation:
+                    return
+                self._remove(key)
+
+            self.cache[key] = (generation, value, nbytes)
+            self.nbytes += nbytes
+
+            while len(self.cache) > self.size or self.nbytes > self.max_bytes:
+                self._remove(next(iter(self.cache)))
+                self.evictions += 1
 
-    def has(self, key):
-        return key in self.cache
+    def clear(self):
+        with self._lock:
+            self.cache.clear()
+            self.nbytes = 0
 
-    def get(self, key):
-        return self.cache[key]
+    def _remove(self, key):
+        _, _, nbytes = self.cache.pop(key)
+        self.nbytes -= nbytes
 
-    def set(self, key, value):
-        self.cache[key] = value
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self.cache),
+                'bytes': self.nbytes,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
 
 
 class BOWInvertedIndexEngineWithCache(BOWInvertedIndexEngine, LRUCache):
-    def __init__(self):
-        super(BOWInvertedIndexEngineWithCache, self).__init__()
-        LRUCache.__init__(self)
+    def __init__(self, size=32, max_bytes=1 << 20, analyzer=None):
+        super(BOWInvertedIndexEngineWithCache, self).__init__(analyzer)
+        LRUCache.__init__(self, size, max_bytes)
 
     def search(self, query):
-        if self.has(query):
-            print('cache hit!')
-            return self.get(query)
+        # 用排好序的单词元组作为key，'I have a Dream!' 和 'dream a have i' 会命中同一个条目
+        key = tuple(sorted(self.parse_text_to_words(query)))
+        # 先读版本号再查询，如果查询期间有写入，写回的条目版本号偏旧，下次读取时自然会被丢弃
+        generation = self.generation
 
-        result = super(BOWInvertedIndexEngineWithCache, self).search(query)
-        self.set(query, result)
+        result = self.get(key, generation)
+        if result is None:
+            result = super(BOWInvertedIndexEngineWithCache, self).search(query)
+            self.set(key, result, generation)
 
-        return result
+        return list(result)
 
 
 def main(search_engine):
@@ -42,7 +129,9 @@ def main(search_engine):
         print('found {} results(s):'.format(len(results)))
         for result in results:
             print(result)
+        print(search_engine.stats())
 
 
-BOWInvert_cache_search_engine = BOWInvertedIndexEngineWithCache()
-main(BOWInvert_cache_search_engine)
+if __name__ == '__main__':
+    BOWInvert_cache_search_engine = BOWInvertedIndexEngineWithCache()
+    main(BOWInvert_cache_search_engine)
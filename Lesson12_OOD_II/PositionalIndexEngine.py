@@ -0,0 +1,160 @@
+import re
+from Lesson12_OOD_II.SearchEngineBase import SearchEngineBase
+from Lesson12_OOD_II.Analyzer import DEFAULT_ANALYZER
+from Lesson12_OOD_II.PostingList import PositionalPostingList, intersect
+
+# 查询语法：用双引号括起来的是短语，a NEAR/k b 表示两个单词相距不超过k个位置，其余单词之间是AND的关系
+QUERY_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+NEAR_OPERATOR = re.compile(r'^NEAR/(\d+)$')
+
+
+class PositionalIndexEngine(SearchEngineBase):
+    """
+    位置倒序索引引擎，除了文档ID还记录每个单词在文档中出现的位置，
+    可以回答精确短语查询和NEAR/k邻近查询，不需要像SimpleEngine那样扫描所有文本。
+    """
+
+    def __init__(self, analyzer=None):
+        super(PositionalIndexEngine, self).__init__()
+        self.analyzer = analyzer if analyzer is not None else DEFAULT_ANALYZER
+        self.inverted_index = {}
+        self.doc_ids = {}
+        self.doc_paths = []
+
+    def get_doc_id(self, path):
+        if path not in self.doc_ids:
+            self.doc_ids[path] = len(self.doc_paths)
+            self.doc_paths.append(path)
+        return self.doc_ids[path]
+
+    def process_corpus(self, id, text):
+        doc_id = self.get_doc_id(id)
+
+        positions = {}
+        for position, word in enumerate(self.parse_text_to_words(text)):
+            if word not in positions:
+                positions[word] = []
+            positions[word].append(position)
+
+        for word, word_positions in positions.items():
+            if word not in self.inverted_index:
+                self.inverted_index[word] = PositionalPostingList()
+            self.inverted_index[word].append(doc_id, word_positions)
+
+    def search(self, query):
+        phrases, nears = self.parse_query(query)
+
+        words = set()
+        for phrase in phrases:
+            words.update(phrase)
+        for left, right, _ in nears:
+            words.update((left, right))
+        if not words:
+            return []
+
+        # 先用文档ID求交集，得到同时包含所有单词的候选文档
+        posting_lists = []
+        for word in words:
+            if word not in self.inverted_index:
+                return []
+            posting_lists.append(self.inverted_index[word])
+        candidates = intersect(posting_lists)
+
+        # 再逐个候选文档检查位置
+        cursors = {word: self.inverted_index[word].cursor() for word in words}
+        results = []
+        for doc_id in candidates:
+            positions = {}
+            for word, cursor in cursors.items():
+                cursor.advance(doc_id)
+                positions[word] = self.inverted_index[word].positions_at(cursor.index)
+
+            if (all(self.match_phrase(phrase, positions) for phrase in phrases if len(phrase) > 1)
+                    and all(self.match_near(positions[left], positions[right], k) for left, right, k in nears)):
+                results.append(self.doc_paths[doc_id])
+
+        return results
+
+    def query_key(self, query):
+        # 按解析后的短语和NEAR条件合并查询，'"a b"' 和 'a b' 是不同的查询
+        phrases, nears = self.parse_query(query)
+        return tuple(tuple(phrase) for phrase in phrases), tuple(nears)
+
+    def parse_query(self, query):
+        """
+        把查询解析成短语列表和NEAR条件列表，普通单词当作只有一个单词的短语。
+        :return: ([[单词, ...], ...], [(单词, 单词, k), ...])
+        """
+        phrases = []
+        nears = []
+        tokens = QUERY_TOKEN.findall(query)
+
+        idx = 0
+        while idx < len(tokens):
+            quoted, bare = tokens[idx]
+            near = NEAR_OPERATOR.match(bare)
+            if near and phrases and phrases[-1] and idx + 1 < len(tokens):
+                next_quoted, next_bare = tokens[idx + 1]
+                right_words = self.parse_text_to_words(next_quoted or next_bare)
+                if right_words:
+                    # NEAR连接的是左边最后一个单词和右边第一个单词
+                    nears.append((phrases[-1][-1], right_words[0], int(near.group(1))))
+                    phrases.append(right_words)
+                idx += 2
+                continue
+
+            words = self.parse_text_to_words(quoted or bare)
+            if quoted:
+                phrases.append(words)
+            else:
+                phrases.extend([word] for word in words)
+            idx += 1
+
+        return [phrase for phrase in phrases if phrase], nears
+
+    @staticmethod
+    def match_phrase(phrase, positions):
+        # 短语的第i个单词出现在位置start + i，对每个单词的(位置 - i)求交集
+        starts = None
+        for offset, word in enumerate(phrase):
+            word_starts = {position - offset for position in positions[word]}
+            starts = word_starts if starts is None else starts & word_starts
+            if not starts:
+                return False
+        return True
+
+    @staticmethod
+    def match_near(left_positions, right_positions, k):
+        # 两个有序位置列表的归并，检查是否有一对位置相距不超过k
+        i = j = 0
+        while i < len(left_positions) and j < len(right_positions):
+            left, right = left_positions[i], right_positions[j]
+            if abs(left - right) <= k:
+                return True
+            if left < right:
+                i += 1
+            else:
+                j += 1
+        return False
+
+    def parse_text_to_words(self, text):
+        # 分词、转小写，保留单词的顺序和重复
+        return self.analyzer.analyze(text)
+
+
+def main(search_engine):
+    for file_path in ['1.txt', '2.txt', '3.txt', '4.txt', '5.txt']:
+        search_engine.add_corpus('./input/' + file_path)
+
+    while True:
+        # 例如："i have a dream"  或者  dream NEAR/3 today
+        query = input()
+        results = search_engine.search(query)
+        print('found {} results(s):'.format(len(results)))
+        for result in results:
+            print(result)
+
+
+if __name__ == '__main__':
+    positional_search_engine = PositionalIndexEngine()
+    main(positional_search_engine)
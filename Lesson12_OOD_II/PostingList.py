@@ -0,0 +1,344 @@
+from array import array
+from bisect import bisect_left
+
+
+def encode_varint(value, buffer):
+    # 每个字节存7位，最高位为1表示后面还有字节
+    while value >= 0x80:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def decode_varint(buffer, offset):
+    # 返回(数值, 下一个varint的偏移)
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+# 还没有跳表指针的列表共用这个空数组，真正需要跳表时才分配自己的数组
+_NO_SKIPS = array('Q')
+
+
+def _varint(value):
+    buffer = bytearray()
+    encode_varint(value, buffer)
+    return buffer
+
+
+class PostingList(object):
+    """
+    倒序索引中单个单词的文档列表。
+    文档ID是递增的整数，相邻ID之间的差值用varint编码存放在data中；
+    每隔SKIP_INTERVAL个文档记录一个跳表指针，用于在求交集时快速跳过大段数据。
+    大部分单词只出现在很少的文档中：只有一个文档时data为空，文档ID就是last；
+    短列表的data是不可变的bytes，超过INLINE_BYTES之后才换成bytearray；
+    文档数不超过SKIP_INTERVAL时也不分配跳表数组。
+    """
+
+    SKIP_INTERVAL = 64
+    INLINE_BYTES = 32
+
+    __slots__ = ('data', 'skip_docs', 'skip_offsets', 'length', 'last')
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.data = b''
+        # 跳表：第k个指针对应第(k+1)*SKIP_INTERVAL个文档所在的数据块
+        # skip_docs[k]是该块之前最后一个文档的ID，skip_offsets[k]是该块在data中的起始偏移
+        self.skip_docs = _NO_SKIPS
+        self.skip_offsets = _NO_SKIPS
+        self.length = 0
+        self.last = -1
+
+    def _rebuild(self, postings):
+        """
+        清空之后按顺序重新加入postings，postings是按文档ID排好序的 (文档ID, 附加数据...) 元组，
+        乱序插入时使用
+        """
+        self._reset()
+        for posting in postings:
+            self.append(*posting)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        cursor = self.cursor()
+        while cursor.doc is not None:
+            yield cursor.doc
+            cursor.next()
+
+    def __contains__(self, doc_id):
+        cursor = self.cursor()
+        cursor.advance(doc_id)
+        return cursor.doc == doc_id
+
+    def append(self, doc_id):
+        # 重复添加同一个文档，直接忽略
+        if doc_id == self.last:
+            return
+
+        # 乱序添加时退化为重建整个列表
+        if doc_id < self.last:
+            self.insert(doc_id)
+            return
+
+        if self.length == 0:
+            # 只有一个文档时不编码
+            self.last = doc_id
+            self.length = 1
+            return
+        if self.length == 1:
+            self.data = bytes(_varint(self.last))
+
+        if self.length % self.SKIP_INTERVAL == 0:
+            if self.skip_docs is _NO_SKIPS:
+                self.skip_docs = array('Q')
+                self.skip_offsets = array('Q')
+            self.skip_docs.append(self.last)
+            self.skip_offsets.append(len(self.data))
+
+        if type(self.data) is bytes:
+            if len(self.data) < self.INLINE_BYTES:
+                self.data += _varint(doc_id - self.last - 1)
+            else:
+                self.data = bytearray(self.data)
+                encode_varint(doc_id - self.last - 1, self.data)
+        else:
+            encode_varint(doc_id - self.last - 1, self.data)
+        self.last = doc_id
+        self.length += 1
+
+    def insert(self, doc_id):
+        doc_ids = list(self)
+        position = bisect_left(doc_ids, doc_id)
+        if position < len(doc_ids) and doc_ids[position] == doc_id:
+            return
+
+        doc_ids.insert(position, doc_id)
+        self._rebuild((doc_id,) for doc_id in doc_ids)
+
+    def extend(self, doc_ids):
+        for doc_id in doc_ids:
+            self.append(doc_id)
+
+    @classmethod
+    def from_ids(cls, doc_ids):
+        posting_list = cls()
+        posting_list.extend(sorted(set(doc_ids)))
+        return posting_list
+
+    @classmethod
+    def from_buffers(cls, data, skip_docs, skip_offsets, length, last):
+        # 直接包装已经编码好的数据，比如mmap出来的memoryview，不做任何拷贝
+        posting_list = cls.__new__(cls)
+        posting_list.data = data
+        posting_list.skip_docs = skip_docs
+        posting_list.skip_offsets = skip_offsets
+        posting_list.length = length
+        posting_list.last = last
+        return posting_list
+
+    def cursor(self):
+        return PostingCursor(self)
+
+    def nbytes(self):
+        return (len(self.data)
+                + self.skip_docs.itemsize * len(self.skip_docs)
+                + self.skip_offsets.itemsize * len(self.skip_offsets))
+
+
+class PostingCursor(object):
+    """
+    在PostingList上顺序前进的游标，doc为当前文档ID，遍历结束时为None。
+    """
+
+    def __init__(self, posting_list):
+        self.posting_list = posting_list
+        self.doc = None
+        # index是当前文档在列表中的序号
+        self.index = -1
+        self._prev = -1
+        self._offset = 0
+        self.next()
+
+    def next(self):
+        posting_list = self.posting_list
+        if self.index + 1 >= posting_list.length:
+            self.index = posting_list.length
+            self.doc = None
+            return None
+        if posting_list.length == 1:
+            # 只有一个文档的列表没有编码数据
+            self.index = 0
+            self.doc = self._prev = posting_list.last
+            return self.doc
+
+        delta, self._offset = decode_varint(posting_list.data, self._offset)
+        self._prev = self._prev + delta + 1
+        self.index += 1
+        self.doc = self._prev
+        return self.doc
+
+    def advance(self, target):
+        """
+        前进到第一个ID不小于target的文档，返回该文档ID，没有则返回None。
+        先在跳表上做galloping查找，再在数据块内线性解码。
+        """
+        if self.doc is None or self.doc >= target:
+            return self.doc
+
+        posting_list = self.posting_list
+        skip_docs = posting_list.skip_docs
+        interval = posting_list.SKIP_INTERVAL
+
+        # 当前所在的数据块之后的第一个跳表指针
+        low = (self.index + 1) // interval
+        if low < len(skip_docs) and skip_docs[low] < target:
+            # 指数增长步长，找到一个上界，然后二分
+            step = 1
+            high = low + 1
+            while high < len(skip_docs) and skip_docs[high] < target:
+                low = high
+                step <<= 1
+                high = low + step
+            high = min(high, len(skip_docs))
+            block = bisect_left(skip_docs, target, low, high) - 1
+
+            # 跳到该数据块的开头
+            self.index = (block + 1) * interval - 1
+            self._prev = skip_docs[block]
+            self._offset = posting_list.skip_offsets[block]
+            self.next()
+
+        while self.doc is not None and self.doc < target:
+            self.next()
+
+        return self.doc
+
+
+def intersect(posting_lists):
+    """
+    对多个PostingList求交集，返回文档ID的列表。
+    从最短的列表出发，其余列表通过advance跳到候选文档。
+    """
+    if not posting_lists:
+        return []
+
+    cursors = [posting_list.cursor() for posting_list in sorted(posting_lists, key=len)]
+    result = []
+    candidate = cursors[0].doc
+
+    while candidate is not None:
+        for cursor in cursors:
+            doc = cursor.advance(candidate)
+            if doc is None:
+                return result
+            if doc > candidate:
+                # 有列表跳过了候选文档，以新的文档作为候选重新开始
+                candidate = doc
+                break
+        else:
+            result.append(candidate)
+            candidate = cursors[0].next()
+            continue
+
+        candidate = cursors[0].advance(candidate)
+
+    return result
+
+
+class FrequencyPostingList(PostingList):
+    """
+    额外记录每个文档中单词出现次数(term frequency)的PostingList，
+    freqs和文档ID一一对应，可以通过游标的index取出。
+    """
+
+    __slots__ = ('freqs', 'max_freq')
+
+    def _reset(self):
+        super(FrequencyPostingList, self)._reset()
+        self.freqs = array('I')
+        self.max_freq = 0
+
+    def append(self, doc_id, freq=1):
+        if doc_id == self.last:
+            self.freqs[-1] = freq
+        elif doc_id < self.last:
+            self.insert(doc_id, freq)
+            return
+        else:
+            super(FrequencyPostingList, self).append(doc_id)
+            self.freqs.append(freq)
+        self.max_freq = max(self.max_freq, freq)
+
+    def insert(self, doc_id, freq=1):
+        postings = dict(self.items())
+        postings[doc_id] = freq
+        self._rebuild(sorted(postings.items()))
+
+    def items(self):
+        return zip(self, self.freqs)
+
+    def nbytes(self):
+        return super(FrequencyPostingList, self).nbytes() + self.freqs.itemsize * len(self.freqs)
+
+
+class PositionalPostingList(PostingList):
+    """
+    额外记录单词在每个文档中出现位置的PostingList。
+    所有文档的位置都用varint差值编码存放在同一个bytearray里，position_offsets[i]是第i个文档的起始偏移。
+    """
+
+    __slots__ = ('positions', 'position_offsets')
+
+    def _reset(self):
+        super(PositionalPostingList, self)._reset()
+        self.positions = bytearray()
+        self.position_offsets = array('Q', [0])
+
+    def append(self, doc_id, positions):
+        if doc_id <= self.last:
+            self.insert(doc_id, positions)
+            return
+
+        super(PositionalPostingList, self).append(doc_id)
+        prev = -1
+        for position in positions:
+            encode_varint(position - prev - 1, self.positions)
+            prev = position
+        self.position_offsets.append(len(self.positions))
+
+    def insert(self, doc_id, positions):
+        postings = dict(self.items())
+        postings[doc_id] = positions
+        self._rebuild(sorted(postings.items()))
+
+    def positions_at(self, index):
+        # 解码第index个文档中的所有位置，返回递增的列表
+        offset = self.position_offsets[index]
+        end = self.position_offsets[index + 1]
+        positions = []
+        prev = -1
+        while offset < end:
+            delta, offset = decode_varint(self.positions, offset)
+            prev = prev + delta + 1
+            positions.append(prev)
+        return positions
+
+    def items(self):
+        return [(doc_id, self.positions_at(index)) for index, doc_id in enumerate(self)]
+
+    def nbytes(self):
+        return (super(PositionalPostingList, self).nbytes() + len(self.positions)
+                + self.position_offsets.itemsize * len(self.position_offsets))
@@ -13,12 +13,31 @@ class SearchEngineBase(object):
 
         self.process_corpus(file_path, text)
 
+    def add_corpora(self, file_paths, workers=None):
+        # 批量加入文档，默认逐个调用add_corpus，子类可以覆盖实现并行建索引
+        for file_path in file_paths:
+            self.add_corpus(file_path)
+
+    @staticmethod
+    def read_in_chunks(file_path, chunk_size=1 << 20):
+        # 分块读取文件，避免一次性把很大的文件读进内存
+        with open(file_path, 'r') as fin:
+            while True:
+                chunk = fin.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
     def process_corpus(self, id, text):
         raise Exception('process_corpus not implemented')
 
     def search(self, query):
         raise Exception('search not implemented')
 
+    def query_key(self, query):
+        # 结果相同的查询返回相同的key，SearchServer据此合并同一批中的重复查询；默认只有完全相同的字符串才合并
+        return query
+
 
 class SimpleEngine(SearchEngineBase):
     def __init__(self):
@@ -49,6 +68,7 @@ def main(search_engine):
             print(result)
 
 
-simple_search_engine = SimpleEngine()
-main(simple_search_engine)
+if __name__ == '__main__':
+    simple_search_engine = SimpleEngine()
+    main(simple_search_engine)
 
@@ -0,0 +1,282 @@
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from Lesson12_OOD_II.BOWInvertedindexEngine import BOWInvertedIndexEngine
+
+# 进程池模式下，每个工作进程自己持有一个搜索引擎
+_worker_engine = None
+
+
+def _init_worker(engine_factory):
+    global _worker_engine
+    _worker_engine = engine_factory()
+
+
+def _search_in_worker(queries):
+    return search_distinct(_worker_engine, queries)
+
+
+def search_distinct(engine, queries):
+    """
+    依次执行一批查询，query_key相同的查询只计算一次。
+    在线程池或者进程池中调用，分词等工作不会占用事件循环。
+    :param engine:  SearchEngineBase    搜索引擎
+    :param queries: list                查询字符串列表
+    :return:        list                和queries一一对应的查询结果
+    """
+    results = {}
+    output = []
+    for query in queries:
+        key = engine.query_key(query)
+        if key not in results:
+            results[key] = engine.search(query)
+        output.append(results[key])
+    return output
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+class SearchServer(object):
+    """
+    基于asyncio的HTTP查询服务，可以包装任意SearchEngineBase子类。
+    GET /search?q=...  返回JSON格式的查询结果
+    GET /stats         返回请求数、批处理情况以及p50/p99延迟
+
+    在batch_window时间内到达的请求会被攒成一批，完全相同的查询字符串只发送一次；
+    每批查询交给线程池（或者进程池）执行，在那里再按引擎的query_key去重，不阻塞事件循环。
+    等待中的请求超过max_pending时直接返回503，正在执行的批次数量也有上限，避免请求无限堆积。
+    """
+
+    def __init__(self, search_engine=None, host='127.0.0.1', port=8080,
+                 batch_window=0.002, max_batch=64, max_pending=10000,
+                 workers=4, engine_factory=None):
+        """
+        :param search_engine:   SearchEngineBase    在线程池中使用的搜索引擎
+        :param batch_window:    float               攒批的时间窗口，单位秒
+        :param max_batch:       int                 每批最多的请求数
+        :param max_pending:     int                 排队请求数上限，超过则拒绝
+        :param workers:         int                 线程/进程数
+        :param engine_factory:  callable            给定时改用进程池，每个进程调用它构造自己的引擎
+        """
+        if search_engine is None and engine_factory is None:
+            raise Exception('either search_engine or engine_factory is required')
+
+        self.search_engine = search_engine
+        self.host = host
+        self.port = port
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.workers = workers
+        self.engine_factory = engine_factory
+
+        self.requests = 0
+        self.rejected = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.distinct_queries = 0
+        self.latencies = deque(maxlen=100000)
+
+        self._queue = None
+        self._executor = None
+        self._inflight = None
+        self._server = None
+        self._batcher = None
+        self._connections = set()
+
+    def _search_batch(self, queries):
+        return search_distinct(self.search_engine, queries)
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._inflight = asyncio.Semaphore(self.workers * 2)
+        if self.engine_factory is not None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 initializer=_init_worker,
+                                                 initargs=(self.engine_factory,))
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        self._batcher = asyncio.ensure_future(self._batch_loop())
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port,
+                                                  backlog=4096)
+        # 端口为0时由系统分配，记下真实端口
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        # 关闭所有空闲的keep-alive连接，让连接处理协程正常退出
+        for writer in list(self._connections):
+            writer.close()
+        while self._connections:
+            await asyncio.sleep(0.01)
+        await self._server.wait_closed()
+        self._batcher.cancel()
+        self._executor.shutdown(wait=False)
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def search(self, query):
+        """
+        把查询放进批处理队列，等待结果。队列已满时抛出asyncio.QueueFull。
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((query, future))
+        return await future
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # 正在执行的批次太多时在这里等待，新请求继续在队列中排队
+            await self._inflight.acquire()
+            asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            # 事件循环里只按原始字符串去重，不做分词
+            groups = {}
+            for query, future in batch:
+                groups.setdefault(query, []).append(future)
+            queries = list(groups)
+
+            self.batches += 1
+            self.batched_requests += len(batch)
+            self.distinct_queries += len(queries)
+
+            try:
+                if self.engine_factory is not None:
+                    results = await loop.run_in_executor(self._executor, _search_in_worker, queries)
+                else:
+                    results = await loop.run_in_executor(self._executor, self._search_batch, queries)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            for futures, result in zip(groups.values(), results):
+                for future in futures:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            self._inflight.release()
+
+    async def _handle_client(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode('latin-1').split()
+                if len(parts) < 3:
+                    await self._respond(writer, 400, {'error': 'bad request'}, False)
+                    break
+
+                method, target, version = parts[:3]
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                status, body = await self._dispatch(method, target)
+                await self._respond(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, method, target):
+        if method != 'GET':
+            return 405, {'error': 'method not allowed'}
+
+        url = urlsplit(target)
+        if url.path == '/stats':
+            return 200, self.stats()
+        if url.path != '/search':
+            return 404, {'error': 'not found'}
+
+        query = parse_qs(url.query).get('q', [''])[0]
+        start = time.perf_counter()
+        self.requests += 1
+        try:
+            results = await self.search(query)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return 503, {'error': 'server busy'}
+        except Exception as e:
+            return 500, {'error': str(e)}
+
+        self.latencies.append(time.perf_counter() - start)
+        return 200, {'query': query, 'count': len(results), 'results': results}
+
+    @staticmethod
+    async def _respond(writer, status, body, keep_alive):
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                   500: 'Internal Server Error', 503: 'Service Unavailable'}
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        head = ('HTTP/1.1 {} {}\r\n'
+                'Content-Type: application/json; charset=utf-8\r\n'
+                'Content-Length: {}\r\n'
+                'Connection: {}\r\n\r\n').format(status, reasons[status], len(payload),
+                                                 'keep-alive' if keep_alive else 'close')
+        writer.write(head.encode('latin-1') + payload)
+        await writer.drain()
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            'requests': self.requests,
+            'rejected': self.rejected,
+            'pending': self._queue.qsize() if self._queue is not None else 0,
+            'batches': self.batches,
+            'avg_batch_size': self.batched_requests / self.batches if self.batches else 0.0,
+            'distinct_queries': self.distinct_queries,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+        }
+
+
+def main():
+    search_engine = BOWInvertedIndexEngine()
+    for file_path in ['1.txt', '2.txt', '3.txt', '4.txt', '5.txt']:
+        search_engine.add_corpus('./input/' + file_path)
+
+    server = SearchServer(search_engine, port=8080)
+    print('serving on http://127.0.0.1:8080/search?q=i+have+a+dream')
+    asyncio.run(server.serve_forever())
+
+
+if __name__ == '__main__':
+    main()
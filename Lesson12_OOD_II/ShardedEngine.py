@@ -0,0 +1,269 @@
+import heapq
+import multiprocessing
+import time
+import zlib
+from multiprocessing.connection import wait
+from Lesson12_OOD_II.SearchEngineBase import SearchEngineBase
+from Lesson12_OOD_II.BOWInvertedindexEngine import BOWInvertedIndexEngine
+
+
+def _shard_worker(conn, engine_factory, search_method):
+    """
+    分片进程的主循环：持有自己的索引，按顺序处理管道里的命令。
+    命令格式：('add', 文件路径, 文本) / ('add_files', [文件路径]) / ('search', 查询ID, 查询, 参数) / ('stop',)
+    回复格式：(查询ID, 是否成功, 结果或错误, 耗时, [加入文档的错误])
+    分片进程只在查询时回复：加入文档出错时先把错误攒起来，随下一次查询的回复一起发回去。
+    如果出错时立即回复，主进程还在连续发送命令、没有读管道，两边会互相阻塞在send上。
+    """
+    engine = engine_factory()
+    search = getattr(engine, search_method)
+    add_errors = []
+
+    while True:
+        try:
+            command = conn.recv()
+        except EOFError:
+            break
+
+        if command[0] == 'add':
+            try:
+                engine.process_corpus(command[1], command[2])
+            except Exception as e:
+                add_errors.append('add {}: {!r}'.format(command[1], e))
+        elif command[0] == 'add_files':
+            # 逐个文件加入，一个文件出错不影响同一批的其它文件
+            for file_path in command[1]:
+                try:
+                    engine.add_corpora([file_path], workers=1)
+                except Exception as e:
+                    add_errors.append('add_files {}: {!r}'.format(file_path, e))
+        elif command[0] == 'search':
+            _, query_id, query, kwargs = command
+            start = time.perf_counter()
+            try:
+                reply = (query_id, True, search(query, **kwargs))
+            except Exception as e:
+                reply = (query_id, False, repr(e))
+            conn.send(reply + (time.perf_counter() - start, add_errors))
+            add_errors = []
+        elif command[0] == 'stop':
+            break
+
+    conn.close()
+
+
+class ShardStats(object):
+    def __init__(self):
+        self.queries = 0
+        self.failures = 0
+        self.add_failures = 0
+        self.timeouts = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        # 分片进程内部的查询耗时，和往返耗时的差就是管道和序列化的开销
+        self.total_search_time = 0.0
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'failures': self.failures,
+            'add_failures': self.add_failures,
+            'timeouts': self.timeouts,
+            'avg_ms': self.total_time / self.queries * 1000 if self.queries else 0.0,
+            'max_ms': self.max_time * 1000,
+            'avg_search_ms': self.total_search_time / self.queries * 1000 if self.queries else 0.0,
+        }
+
+
+class ShardedEngine(SearchEngineBase):
+    """
+    把文档按路径哈希分到N个工作进程，每个进程持有自己的索引。
+    查询时并发发给所有分片，再把各分片的结果合并：
+    merge='union'时按分片顺序拼接结果（BOW类引擎的AND查询）；
+    merge='topk'时各分片返回(路径, 得分)，合并出全局得分最高的top_k（配合BM25Engine.search_with_scores）。
+    各分片用自己的文档数和文档频率计算idf，文档足够多、哈希足够均匀时和全局统计量非常接近。
+    超时或者出错的分片会被记录下来，查询仍然返回其它分片的结果。
+    加入文档是异步的，分片进程出错时不会退出，错误随之后的查询结果一起收到，记录在add_errors中。
+    """
+
+    def __init__(self, num_shards=4, engine_factory=BOWInvertedIndexEngine, search_method='search',
+                 merge='union', timeout=5.0):
+        super(ShardedEngine, self).__init__()
+        if merge not in ('union', 'topk'):
+            raise Exception('unknown merge mode {}'.format(merge))
+
+        self.num_shards = num_shards
+        self.merge = merge
+        self.timeout = timeout
+        self.shard_stats = [ShardStats() for _ in range(num_shards)]
+        self.failed_shards = set()
+        # [(分片, 错误信息)]
+        self.add_errors = []
+
+        self._next_query_id = 0
+        self._conns = []
+        self._processes = []
+        for _ in range(num_shards):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_shard_worker,
+                                              args=(child_conn, engine_factory, search_method),
+                                              daemon=True)
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+
+    def shard_of(self, path):
+        # 用crc32而不是hash()，保证不同进程、不同次运行的分片结果一致
+        return zlib.crc32(str(path).encode('utf-8')) % self.num_shards
+
+    def _send(self, shard, command):
+        if shard in self.failed_shards:
+            return False
+        try:
+            self._conns[shard].send(command)
+            return True
+        except (BrokenPipeError, EOFError, OSError):
+            self.failed_shards.add(shard)
+            return False
+
+    def process_corpus(self, id, text):
+        self._send(self.shard_of(id), ('add', id, text))
+
+    def add_corpus(self, file_path):
+        # 由分片进程自己读文件，主进程不需要传输文本
+        self._send(self.shard_of(file_path), ('add_files', [file_path]))
+
+    def add_corpora(self, file_paths, workers=None):
+        batches = [[] for _ in range(self.num_shards)]
+        for file_path in file_paths:
+            batches[self.shard_of(file_path)].append(file_path)
+        # 各分片并行读取和建索引
+        for shard, batch in enumerate(batches):
+            if batch:
+                self._send(shard, ('add_files', batch))
+
+    def search(self, query, top_k=10):
+        return self.search_with_stats(query, top_k)['results']
+
+    def search_with_stats(self, query, top_k=10):
+        """
+        :return: {'results': 合并后的结果, 'failed_shards': [没有返回结果的分片], 'shard_ms': {分片: 往返耗时}}
+        """
+        query_id = self._next_query_id
+        self._next_query_id += 1
+        kwargs = {'top_k': top_k} if self.merge == 'topk' else {}
+
+        start = time.perf_counter()
+        pending = {}
+        for shard in range(self.num_shards):
+            if self._send(shard, ('search', query_id, query, kwargs)):
+                pending[self._conns[shard]] = shard
+
+        shard_results = {}
+        shard_ms = {}
+        failed = []
+        deadline = start + self.timeout
+        while pending:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+
+            for conn in wait(list(pending), remaining):
+                shard = pending[conn]
+                try:
+                    reply_query_id, ok, payload, search_time, add_errors = conn.recv()
+                except (EOFError, OSError):
+                    # 分片进程已经退出
+                    self.failed_shards.add(shard)
+                    self.shard_stats[shard].failures += 1
+                    failed.append(shard)
+                    del pending[conn]
+                    continue
+
+                # 之前加入文档时的错误，迟到的回复里也可能带着
+                self.shard_stats[shard].add_failures += len(add_errors)
+                self.add_errors.extend((shard, error) for error in add_errors)
+
+                # 之前超时的查询迟到的结果，丢弃
+                if reply_query_id != query_id:
+                    continue
+
+                elapsed = time.perf_counter() - start
+                stats = self.shard_stats[shard]
+                stats.queries += 1
+                stats.total_time += elapsed
+                stats.max_time = max(stats.max_time, elapsed)
+                stats.total_search_time += search_time
+                shard_ms[shard] = elapsed * 1000
+
+                if ok:
+                    shard_results[shard] = payload
+                else:
+                    stats.failures += 1
+                    failed.append(shard)
+                del pending[conn]
+
+        for shard in pending.values():
+            self.shard_stats[shard].timeouts += 1
+            failed.append(shard)
+        failed.extend(shard for shard in self.failed_shards if shard not in failed)
+
+        return {
+            'results': self._merge(shard_results, top_k),
+            'failed_shards': sorted(failed),
+            'shard_ms': shard_ms,
+        }
+
+    def _merge(self, shard_results, top_k):
+        if self.merge == 'union':
+            results = []
+            for shard in sorted(shard_results):
+                results.extend(shard_results[shard])
+            return results
+
+        # 各分片返回的结果已经按得分从高到低排好序
+        return heapq.nlargest(top_k, (result for results in shard_results.values() for result in results),
+                              key=lambda result: result[1])
+
+    def stats(self):
+        return {shard: stats.as_dict() for shard, stats in enumerate(self.shard_stats)}
+
+    def close(self):
+        for shard in range(self.num_shards):
+            self._send(shard, ('stop',))
+        for process in self._processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._conns:
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def main():
+    with ShardedEngine(num_shards=2) as search_engine:
+        search_engine.add_corpora(['./input/' + file_path
+                                   for file_path in ['1.txt', '2.txt', '3.txt', '4.txt', '5.txt']])
+
+        while True:
+            query = input()
+            response = search_engine.search_with_stats(query)
+            print('found {} results(s):'.format(len(response['results'])))
+            for result in response['results']:
+                print(result)
+            if response['failed_shards']:
+                print('WARNING: shards {} did not answer'.format(response['failed_shards']))
+            for shard, error in search_engine.add_errors:
+                print('WARNING: shard {} failed to add documents: {}'.format(shard, error))
+            del search_engine.add_errors[:]
+            print(search_engine.stats())
+
+
+if __name__ == '__main__':
+    main()
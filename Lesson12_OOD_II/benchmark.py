@@ -0,0 +1,174 @@
+import argparse
+import gc
+import itertools
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from Lesson12_OOD_II.SearchEngineBase import SimpleEngine
+from Lesson12_OOD_II.BOWEngine import BOWEngine
+from Lesson12_OOD_II.BOWInvertedindexEngine import BOWInvertedIndexEngine
+from Lesson12_OOD_II.LRUCache import BOWInvertedIndexEngineWithCache
+from Lesson12_OOD_II.BM25Engine import BM25Engine
+from Lesson12_OOD_II.PositionalIndexEngine import PositionalIndexEngine
+from Lesson12_OOD_II.SearchServer import percentile
+
+ENGINES = {
+    'SimpleEngine': SimpleEngine,
+    'BOWEngine': BOWEngine,
+    'BOWInvertedIndexEngine': BOWInvertedIndexEngine,
+    'BOWInvertedIndexEngineWithCache': BOWInvertedIndexEngineWithCache,
+    'BM25Engine': BM25Engine,
+    'PositionalIndexEngine': PositionalIndexEngine,
+}
+DEFAULT_ENGINES = ['SimpleEngine', 'BOWEngine', 'BOWInvertedIndexEngine', 'BOWInvertedIndexEngineWithCache']
+
+
+def zipf_weights(n, s):
+    # 排名第k的元素出现的概率正比于 1 / k^s，返回累积权重供random.choices使用
+    return list(itertools.accumulate(1.0 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def generate_corpus(num_docs, vocab_size, avg_doc_length, s=1.1, seed=0):
+    """
+    生成单词频率服从Zipf分布的合成语料，返回[(文档ID, 文本)]。
+    """
+    rng = random.Random(seed)
+    vocab = ['w{}'.format(i) for i in range(vocab_size)]
+    cum_weights = zipf_weights(vocab_size, s)
+
+    corpus = []
+    for doc_id in range(num_docs):
+        length = max(1, int(rng.expovariate(1.0 / avg_doc_length)))
+        words = rng.choices(vocab, cum_weights=cum_weights, k=length)
+        corpus.append(('doc{}'.format(doc_id), ' '.join(words)))
+    return corpus
+
+
+def generate_queries(num_queries, vocab_size, distinct_queries=1000, max_words=3, s=1.1, seed=1):
+    """
+    生成查询日志：先生成distinct_queries个不同的查询，再按Zipf分布抽样，热门查询会反复出现。
+    查询单词偏向常见词，但不像语料那样集中，避免几乎所有查询都落在最常见的几个单词上。
+    """
+    rng = random.Random(seed)
+    vocab = ['w{}'.format(i) for i in range(vocab_size)]
+    word_weights = zipf_weights(vocab_size, s / 2)
+
+    pool = []
+    for _ in range(distinct_queries):
+        length = rng.randint(1, max_words)
+        pool.append(' '.join(rng.choices(vocab, cum_weights=word_weights, k=length)))
+
+    return rng.choices(pool, cum_weights=zipf_weights(len(pool), s), k=num_queries)
+
+
+def build(engine_type, corpus):
+    search_engine = engine_type()
+    for doc_id, text in corpus:
+        search_engine.process_corpus(doc_id, text)
+    return search_engine
+
+
+def measure_memory(engine_type, corpus):
+    # 用tracemalloc统计建索引过程中净增加的内存，单独跑一遍，避免拖慢吞吐量的测量。
+    # 语料文本在测量之前已经生成，SimpleEngine只保存文本的引用，所以它的数字只包含字典本身
+    gc.collect()
+    tracemalloc.start()
+    search_engine = build(engine_type, corpus)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del search_engine
+    return current
+
+
+def run_engine(name, corpus, queries, memory=True):
+    engine_type = ENGINES[name]
+
+    gc.collect()
+    start = time.perf_counter()
+    search_engine = build(engine_type, corpus)
+    index_seconds = time.perf_counter() - start
+
+    latencies = []
+    total_results = 0
+    for query in queries:
+        start = time.perf_counter()
+        results = search_engine.search(query)
+        latencies.append(time.perf_counter() - start)
+        total_results += len(results)
+    latencies.sort()
+
+    report = {
+        'index_seconds': index_seconds,
+        'index_docs_per_second': len(corpus) / index_seconds if index_seconds else 0.0,
+        'queries': len(queries),
+        'query_p50_ms': percentile(latencies, 50) * 1000,
+        'query_p99_ms': percentile(latencies, 99) * 1000,
+        'query_mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        'queries_per_second': len(latencies) / sum(latencies) if sum(latencies) else 0.0,
+        'avg_results': total_results / len(queries) if queries else 0.0,
+    }
+    if hasattr(search_engine, 'stats'):
+        cache_stats = search_engine.stats()
+        report['cache_hit_ratio'] = cache_stats['hit_ratio']
+        report['cache_stats'] = cache_stats
+    if memory:
+        del search_engine
+        report['memory_bytes_per_doc'] = measure_memory(engine_type, corpus) / len(corpus)
+
+    return report
+
+
+def run(engine_names, num_docs=10000, vocab_size=50000, avg_doc_length=200,
+        num_queries=2000, distinct_queries=500, seed=0, memory=True):
+    corpus = generate_corpus(num_docs, vocab_size, avg_doc_length, seed=seed)
+    queries = generate_queries(num_queries, vocab_size, distinct_queries, seed=seed + 1)
+
+    results = {
+        'version': 1,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'config': {
+            'docs': num_docs,
+            'vocab_size': vocab_size,
+            'avg_doc_length': avg_doc_length,
+            'queries': num_queries,
+            'distinct_queries': distinct_queries,
+            'seed': seed,
+        },
+        'engines': {},
+    }
+    for name in engine_names:
+        results['engines'][name] = run_engine(name, corpus, queries, memory)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Lesson12 search engines on a synthetic Zipf corpus')
+    parser.add_argument('--engines', nargs='+', default=DEFAULT_ENGINES, choices=sorted(ENGINES))
+    parser.add_argument('--docs', type=int, default=10000)
+    parser.add_argument('--vocab', type=int, default=50000)
+    parser.add_argument('--doc-length', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--distinct-queries', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    results = run(args.engines, args.docs, args.vocab, args.doc_length, args.queries,
+                  args.distinct_queries, args.seed, not args.no_memory)
+
+    report = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as fout:
+            fout.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import pytest
+
+from Lesson12_OOD_II.Analyzer import Analyzer, Vocabulary, StopwordFilter, SuffixStemmer, DEFAULT_ANALYZER, \
+    legacy_parse_text_to_words
+from Lesson12_OOD_II.BOWEngine import BOWEngine
+from Lesson12_OOD_II.BOWInvertedindexEngine import BOWInvertedIndexEngine
+from Lesson12_OOD_II.BM25Engine import BM25Engine
+from Lesson12_OOD_II.PositionalIndexEngine import PositionalIndexEngine
+
+
+@pytest.mark.parametrize('text', [
+    'I have a dream, that one day... (every_valley) shall be exalted!',
+    'İstanbul İYİ',
+    'Straße ΣΟΦΟΣ.ΣΑΣ ǅemal',
+    'naïve café ȧb',
+    '我有一个梦想，I have a dream',
+    '',
+    '，。！',
+])
+def test_default_analyzer_matches_legacy(text):
+    assert DEFAULT_ANALYZER.terms(text) == legacy_parse_text_to_words(text)
+
+
+def test_dotted_capital_i_stays_one_token():
+    # 'İ'.lower()是'i'加上组合附加符号U+0307，先转小写再分词会把它切成两个单词
+    assert DEFAULT_ANALYZER.tokenize('İstanbul') == ['i̇stanbul']
+
+
+def test_filters():
+    analyzer = Analyzer(filters=[StopwordFilter(), SuffixStemmer()])
+    assert analyzer.analyze('The dreams of the nations') == ['dream', 'nation']
+    assert Analyzer(cjk=True).analyze('我有一个梦想 dream') == ['我有', '有一', '一个', '个梦', '梦想', 'dream']
+    assert Analyzer(cjk=True).analyze('python编程') == ['python', '编程']
+
+
+def test_vocabulary_interns_terms():
+    analyzer = Analyzer(vocabulary=Vocabulary())
+    first = analyzer.analyze_ids('dream today dream')
+    assert first == [0, 1, 0]
+    assert analyzer.analyze_ids('TODAY missing', add=False) == [1]
+    assert 'missing' not in analyzer.vocabulary
+
+    term = ''.join(['dr', 'eam'])
+    assert analyzer.vocabulary.get_term(analyzer.vocabulary.get_id(term)) is analyzer.vocabulary.get_term(0)
+    assert analyzer.term_ids('dream Dream today', add=False) == {0, 1}
+    assert analyzer.term_ids('dream missing', add=False) is None
+
+
+def test_engines_use_their_own_analyzer():
+    docs = {'a': 'The dreams of today', 'b': 'a dream of the day', 'c': 'the day after'}
+    analyzer = Analyzer(filters=[StopwordFilter(), SuffixStemmer()])
+    for engine_type in [BOWEngine, BOWInvertedIndexEngine, PositionalIndexEngine]:
+        engine = engine_type(analyzer=analyzer)
+        for path, text in docs.items():
+            engine.process_corpus(path, text)
+        assert sorted(engine.search('the dreaming')) == ['a', 'b'], engine_type
+        assert engine.search('missing') == []
+
+        default_engine = engine_type()
+        for path, text in docs.items():
+            default_engine.process_corpus(path, text)
+        assert sorted(default_engine.search('dream')) == ['b'], engine_type
+
+    bm25 = BM25Engine(analyzer=Analyzer(filters=[SuffixStemmer()], vocabulary=Vocabulary()))
+    for path, text in docs.items():
+        bm25.process_corpus(path, text)
+    assert sorted(bm25.search('dreams')) == ['a', 'b']
+    assert bm25.search('missing') == []
+
+
+def test_bm25_indexes_term_ids():
+    engine = BM25Engine()
+    engine.process_corpus('a', 'dream dream today')
+    engine.process_corpus('b', 'today')
+    vocabulary = engine.analyzer.vocabulary
+    assert set(engine.inverted_index) == {vocabulary.get_id('dream'), vocabulary.get_id('today')}
+    assert list(engine.inverted_index[vocabulary.get_id('dream')].freqs) == [2]
+    assert engine.search('Dream') == ['a']
+
+
+def test_cjk_analyzer_in_parallel_build(tmp_path):
+    texts = ['我有一个梦想', '有一天我的四个孩子', '梦想 dream', '一个国家']
+    paths = []
+    for i, text in enumerate(texts):
+        path = tmp_path / '{}.txt'.format(i)
+        path.write_text(text, encoding='utf-8')
+        paths.append(str(path))
+
+    serial = BOWInvertedIndexEngine(analyzer=Analyzer(cjk=True))
+    for path in paths:
+        serial.add_corpus(path)
+    parallel = BOWInvertedIndexEngine(analyzer=Analyzer(cjk=True))
+    parallel.add_corpora(paths, workers=2)
+    assert parallel.search('梦想') == serial.search('梦想') == [paths[0], paths[2]]
+    assert parallel.search('一个') == [paths[0], paths[3]]
+    assert BOWInvertedIndexEngine().search('梦想') == []
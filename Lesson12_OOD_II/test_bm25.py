@@ -0,0 +1,64 @@
+import math
+import random
+
+import pytest
+
+from Lesson12_OOD_II.BM25Engine import BM25Engine
+
+
+def _corpus(seed, num_docs=400, vocabulary=200):
+    rng = random.Random(seed)
+    words = ['t{}'.format(i) for i in range(vocabulary)]
+    # 单词频率大致服从Zipf分布，常见词和罕见词的得分上界差别很大，WAND才有东西可以跳过
+    weights = [1.0 / (i + 1) for i in range(vocabulary)]
+    return {'doc{}'.format(i): rng.choices(words, weights, k=rng.randrange(5, 120)) for i in range(num_docs)}
+
+
+def _exhaustive(docs, query, top_k, k1=1.2, b=0.75):
+    avg_length = sum(len(words) for words in docs.values()) / len(docs)
+    idfs = {}
+    for term in set(query):
+        doc_freq = sum(term in words for words in docs.values())
+        idfs[term] = math.log(1 + (len(docs) - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    scores = {}
+    for path, words in docs.items():
+        score = 0.0
+        for term, idf in idfs.items():
+            freq = words.count(term)
+            if not freq:
+                continue
+            score += idf * freq * (k1 + 1) / (freq + k1 * (1 - b + b * len(words) / avg_length))
+        if score > 0:
+            scores[path] = score
+    return scores, sorted(scores.items(), key=lambda item: -item[1])[:top_k]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_wand_matches_exhaustive_scoring(seed):
+    docs = _corpus(seed)
+    engine = BM25Engine()
+    for path, words in docs.items():
+        engine.process_corpus(path, ' '.join(words))
+
+    rng = random.Random(seed + 100)
+    for _ in range(20):
+        query = ['t{}'.format(rng.randrange(200)) for _ in range(rng.randrange(1, 5))]
+        top_k = rng.choice([1, 5, 10, 50])
+        scores, expected = _exhaustive(docs, query, top_k)
+        for early_termination in (True, False):
+            results = engine.search_with_scores(' '.join(query), top_k, early_termination=early_termination)
+            # 得分相同的文档之间的顺序取决于舍入误差，只比较得分，再检查每个文档的得分是对的
+            assert [score for _, score in results] == pytest.approx([score for _, score in expected])
+            assert len(set(path for path, _ in results)) == len(results)
+            for path, score in results:
+                assert score == pytest.approx(scores[path])
+
+
+def test_empty_cases():
+    engine = BM25Engine()
+    assert engine.search('anything') == []
+    engine.process_corpus('a', 'hello world')
+    assert engine.search('missing') == []
+    assert engine.search('hello', top_k=0) == []
+    assert engine.search('hello') == ['a']
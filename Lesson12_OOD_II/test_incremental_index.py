@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from Lesson12_OOD_II.IncrementalIndexEngine import IncrementalIndexEngine, Segment
+
+VOCABULARY = ['w{}'.format(i) for i in range(20)]
+
+
+def _check(engine, docs, rng, queries=30):
+    for _ in range(queries):
+        query = set(rng.sample(VOCABULARY, rng.randrange(1, 3)))
+        expected = sorted(path for path, words in docs.items() if query <= words)
+        assert sorted(engine.search(' '.join(query))) == expected
+
+
+@pytest.mark.parametrize('background_merge', [False, True])
+def test_updates_and_deletes_match_reference(background_merge):
+    rng = random.Random(0)
+    engine = IncrementalIndexEngine(buffer_size=8, merge_factor=3, background_merge=background_merge)
+    docs = {}
+    for step in range(1500):
+        path = 'doc{}'.format(rng.randrange(300))
+        if rng.random() < 0.2:
+            assert engine.delete(path) == (path in docs)
+            docs.pop(path, None)
+        else:
+            words = set(rng.sample(VOCABULARY, rng.randrange(1, 8)))
+            engine.update(path, ' '.join(words))
+            docs[path] = words
+        if step % 250 == 0:
+            _check(engine, docs, rng, queries=5)
+
+    engine.flush()
+    engine.wait_for_merges()
+    _check(engine, docs, rng)
+
+    sizes, buffered = engine.segment_sizes()
+    assert sum(sizes) + buffered == len(docs)
+    # 分层合并之后段的数量远小于冻结过的缓冲区数量
+    assert len(sizes) < 1500 // 8 // 3
+
+
+def test_merge_drops_tombstones():
+    segments = [Segment.from_docs([(0, 'a', {'x', 'y'}), (1, 'b', {'x'})]),
+                Segment.from_docs([(2, 'c', {'x', 'y'}), (3, 'd', {'y'})])]
+    merged = Segment.merge(segments, deleted={1, 2})
+    assert merged.doc_paths == {0: 'a', 3: 'd'}
+    assert list(merged.inverted_index['x']) == [0]
+    assert list(merged.inverted_index['y']) == [0, 3]
+    assert merged.deleted == set()
+
+
+def test_deletes_during_background_merge_are_kept():
+    engine = IncrementalIndexEngine(buffer_size=4, merge_factor=2, background_merge=True)
+    docs = {}
+    for i in range(200):
+        engine.process_corpus('doc{}'.format(i), 'common w{}'.format(i % 5))
+        docs['doc{}'.format(i)] = {'common', 'w{}'.format(i % 5)}
+        # 删除刚刚进入段、很可能正在后台合并的文档
+        if i % 3 == 0 and i:
+            engine.delete('doc{}'.format(i - 1))
+            docs.pop('doc{}'.format(i - 1))
+    engine.flush()
+    engine.wait_for_merges()
+    _check(engine, docs, random.Random(1))
+    assert sorted(engine.search('common')) == sorted(docs)
+
+
+class _Sized(object):
+    def __init__(self, live_count):
+        self.live_count = live_count
+
+
+def test_tier_uses_exact_integer_boundaries():
+    engine = IncrementalIndexEngine(buffer_size=1, merge_factor=10, background_merge=False)
+    # math.log(1000, 10) == 2.9999999999999996，浮点实现会把1000个文档的段放到第2层
+    assert [engine._tier(_Sized(size)) for size in [0, 1, 9, 10, 99, 100, 999, 1000, 1001]] == \
+        [0, 0, 0, 1, 1, 2, 2, 3, 3]
+    engine = IncrementalIndexEngine(buffer_size=7, merge_factor=3, background_merge=False)
+    assert [engine._tier(_Sized(size)) for size in [20, 21, 62, 63]] == [0, 1, 1, 2]
+
+
+def test_failed_background_merge_is_reported(monkeypatch):
+    def broken_merge(segments, deleted):
+        raise ValueError('disk full')
+
+    monkeypatch.setattr(Segment, 'merge', broken_merge)
+    engine = IncrementalIndexEngine(buffer_size=2, merge_factor=2, background_merge=True)
+    for i in range(8):
+        engine.process_corpus('doc{}'.format(i), 'common w{}'.format(i))
+    with pytest.raises(Exception, match='background merge') as excinfo:
+        engine.wait_for_merges()
+    assert isinstance(excinfo.value.__cause__, ValueError)
+    assert not engine._merging
+
+    # 合并失败时原来的段保持不变，查询结果仍然完整
+    assert sorted(engine.search('common')) == ['doc{}'.format(i) for i in range(8)]
+    engine.wait_for_merges()
+
+    monkeypatch.undo()
+    engine.process_corpus('doc8', 'common')
+    engine.flush()
+    engine.wait_for_merges()
+    assert sorted(engine.search('common')) == ['doc{}'.format(i) for i in range(9)]
@@ -0,0 +1,64 @@
+import random
+import struct
+
+from Lesson12_OOD_II.BOWInvertedindexEngine import BOWInvertedIndexEngine
+from Lesson12_OOD_II.IndexSegment import write_segment, SegmentReader
+from Lesson12_OOD_II.PostingList import PostingList
+
+
+def _engine(seed=0, num_docs=500):
+    rng = random.Random(seed)
+    # 常见词的倒序索引超过SKIP_INTERVAL，带有跳表；罕见词只有一两个文档
+    words = ['common', 'frequent'] + ['rare{}'.format(i) for i in range(300)]
+    engine = BOWInvertedIndexEngine()
+    for i in range(num_docs):
+        doc_words = rng.sample(words[2:], 3)
+        if rng.random() < 0.6:
+            doc_words.append('common')
+        if rng.random() < 0.3:
+            doc_words.append('frequent')
+        engine.process_corpus('doc{}'.format(i), ' '.join(doc_words))
+    return engine
+
+
+def test_write_and_mmap_read_round_trip(tmp_path):
+    engine = _engine()
+    path = str(tmp_path / 'index.seg')
+    write_segment(engine, path)
+
+    with SegmentReader(path) as reader:
+        assert reader.doc_count == len(engine.doc_paths)
+        assert reader.term_count == len(engine.inverted_index)
+        for doc_id, doc_path in enumerate(engine.doc_paths):
+            assert reader.doc_path(doc_id) == doc_path
+
+        for term, expected in engine.inverted_index.items():
+            posting_list = reader.get_posting_list(term)
+            assert list(posting_list) == list(expected)
+            assert list(posting_list.skip_docs) == list(expected.skip_docs)
+            assert list(posting_list.skip_offsets) == list(expected.skip_offsets)
+        assert reader.get_posting_list('missing') is None
+
+        for query in ['common', 'common frequent', 'rare7 common', 'rare1 rare2', 'missing common']:
+            assert reader.search(query) == engine.search(query)
+        del posting_list
+
+
+def test_skip_arrays_are_little_endian(tmp_path):
+    engine = _engine()
+    path = str(tmp_path / 'index.seg')
+    write_segment(engine, path)
+    expected = engine.inverted_index['common']
+    assert len(expected.skip_docs) >= len(expected) // PostingList.SKIP_INTERVAL > 0
+
+    with open(path, 'rb') as fin:
+        content = fin.read()
+    with SegmentReader(path) as reader:
+        terms = [reader._term_at(reader._term_entry(i)) for i in range(reader.term_count)]
+        entry = reader._term_entry(terms.index(b'common'))
+
+    skip_count, postings_offset = entry[4], entry[6]
+    skip_docs = struct.unpack_from('<{}Q'.format(skip_count), content, postings_offset)
+    skip_offsets = struct.unpack_from('<{}Q'.format(skip_count), content, postings_offset + skip_count * 8)
+    assert list(skip_docs) == list(expected.skip_docs)
+    assert list(skip_offsets) == list(expected.skip_offsets)
@@ -0,0 +1,120 @@
+import random
+
+from Lesson12_OOD_II.BOWInvertedindexEngine import BOWInvertedIndexEngine
+from Lesson12_OOD_II.IntersectionCache import CountMinSketch, IntersectionCache
+from Lesson12_OOD_II.PostingList import PostingList
+
+
+def _posting_list(size):
+    return PostingList.from_ids(range(0, size * 3, 3))
+
+
+def _heat(cache, key, times):
+    for _ in range(times):
+        cache.sketch.increment(key)
+
+
+def test_sketch_never_underestimates():
+    rng = random.Random(0)
+    sketch = CountMinSketch(width=64, depth=4, sample_size=1 << 30)
+    counts = {}
+    for _ in range(5000):
+        key = frozenset(['w{}'.format(int(rng.paretovariate(1.2)))])
+        sketch.increment(key)
+        counts[key] = counts.get(key, 0) + 1
+    assert sketch.width == 64
+    for key, count in counts.items():
+        assert sketch.estimate(key) >= count
+    assert sketch.estimate(frozenset(['missing'])) <= max(counts.values())
+
+
+def test_sketch_aging_halves_counters():
+    sketch = CountMinSketch(width=1024, depth=4, sample_size=100)
+    for _ in range(99):
+        sketch.increment('hot')
+    assert sketch.estimate('hot') == 99
+    sketch.increment('cold')
+    # 第100次计数触发老化，所有计数器减半
+    assert sketch.estimate('hot') == 49
+    assert sketch.estimate('cold') == 0
+    assert sketch.additions == 50
+
+
+def test_admission_compares_all_victims_before_evicting():
+    posting_list = _posting_list(1000)
+    nbytes = posting_list.nbytes()
+    cache = IntersectionCache(size=10, max_bytes=2 * nbytes, min_cost=0)
+    cold, hot, new = frozenset(['cold']), frozenset(['hot']), frozenset(['new'])
+    assert cache.offer(cold, posting_list, 0, 0)
+    assert cache.offer(hot, posting_list, 0, 0)
+    _heat(cache, hot, 5)
+    _heat(cache, new, 3)
+
+    # 新条目需要同时挤掉cold和hot，比hot冷，所以被拒绝，而且cold也不能被提前淘汰
+    assert not cache.offer(new, _posting_list(1900), 0, 0)
+    assert set(cache.cache) == {cold, hot}
+    assert cache.nbytes == 2 * nbytes
+    assert cache.stats()['evictions'] == 0 and cache.stats()['rejections'] == 1
+
+    # 只需要挤掉LRU队尾的cold时，新条目更热，可以进入缓存
+    assert cache.offer(new, posting_list, 0, 0)
+    assert set(cache.cache) == {hot, new}
+    assert cache.stats()['evictions'] == 1
+
+
+def test_hot_entry_evicts_several_victims():
+    posting_list = _posting_list(1000)
+    nbytes = posting_list.nbytes()
+    cache = IntersectionCache(size=10, max_bytes=3 * nbytes, min_cost=0)
+    keys = [frozenset(['w{}'.format(i)]) for i in range(3)]
+    for key in keys:
+        assert cache.offer(key, posting_list, 0, 0)
+    big = frozenset(['big'])
+    _heat(cache, big, 2)
+    assert cache.offer(big, _posting_list(1900), 0, 0)
+    assert list(cache.cache) == [keys[2], big]
+    assert cache.nbytes <= cache.max_bytes
+    assert cache.stats()['evictions'] == 2
+
+
+def test_stale_entry_is_replaced_without_admission():
+    posting_list = _posting_list(1000)
+    cache = IntersectionCache(size=1, min_cost=0)
+    key = frozenset(['a', 'b'])
+    assert cache.offer(key, posting_list, 0, 0)
+    assert cache.get(key, 1) is None
+    assert cache.offer(key, posting_list, 0, 1)
+    assert cache.get(key, 1) is posting_list
+
+    assert cache.offer(key, _posting_list(10), 0, 2)
+    assert len(cache.cache) == 1 and cache.nbytes == _posting_list(10).nbytes()
+
+
+def test_cost_and_size_thresholds():
+    cache = IntersectionCache(min_cost=100, max_bytes=64)
+    assert not cache.offer(frozenset(['a']), _posting_list(10), 99, 0)
+    assert not cache.offer(frozenset(['a']), _posting_list(1000), 100, 0)
+    assert not cache.cache
+
+
+def test_engine_results_unchanged_with_cache():
+    rng = random.Random(0)
+    words = ['w{}'.format(i) for i in range(8)]
+    engine = BOWInvertedIndexEngine()
+    for i in range(3000):
+        engine.process_corpus('doc{}'.format(i), ' '.join(rng.sample(words, rng.randrange(1, 7))))
+    expected = {}
+    queries = [' '.join(rng.sample(words, rng.randrange(2, 6))) for _ in range(20)]
+    for query in queries:
+        expected[query] = engine.search(query)
+
+    engine.intersection_cache = IntersectionCache(size=8, min_cost=100)
+    for _ in range(5):
+        for query in queries:
+            assert engine.search(query) == expected[query]
+    stats = engine.intersection_cache.stats()
+    assert stats['hits'] > 0 and stats['entries'] <= 8
+
+    engine.process_corpus('new', ' '.join(words))
+    for query in queries:
+        assert engine.search(query) == expected[query] + ['new']
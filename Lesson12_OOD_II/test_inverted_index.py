@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from Lesson12_OOD_II.SearchEngineBase import SearchEngineBase
+from Lesson12_OOD_II.BOWInvertedindexEngine import BOWInvertedIndexEngine
+
+
+def _write_corpus(tmp_path, num_docs=40, seed=0):
+    rng = random.Random(seed)
+    words = ['w{}'.format(i) for i in range(60)] + ['梦想', 'naïve']
+    paths = []
+    for i in range(num_docs):
+        path = tmp_path / '{}.txt'.format(i)
+        path.write_text(' '.join(rng.choices(words, k=rng.randrange(1, 200))) + '.\n', encoding='utf-8')
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # 用很小的块读取文件，让单词经常被块边界切开
+    read_in_chunks = SearchEngineBase.read_in_chunks
+    monkeypatch.setattr(SearchEngineBase, 'read_in_chunks',
+                        staticmethod(lambda file_path: read_in_chunks(file_path, chunk_size=7)))
+
+
+def _index(engine):
+    return {word: list(posting_list) for word, posting_list in engine.inverted_index.items()}
+
+
+@pytest.mark.parametrize('workers', [1, 2, 3])
+def test_add_corpora_matches_add_corpus(tmp_path, workers):
+    paths = _write_corpus(tmp_path)
+    serial = BOWInvertedIndexEngine()
+    for path in paths:
+        serial.add_corpus(path)
+
+    parallel = BOWInvertedIndexEngine()
+    parallel.add_corpora(paths, workers=workers)
+    assert parallel.doc_paths == serial.doc_paths
+    assert _index(parallel) == _index(serial)
+    for query in ['w1', 'w1 w2', '梦想 w3', 'naïve w0 w5', 'missing']:
+        assert parallel.search(query) == serial.search(query)
+
+
+def test_chunked_parse_matches_whole_text(tmp_path, small_chunks):
+    for path in _write_corpus(tmp_path, num_docs=5):
+        with open(path, 'r') as fin:
+            text = fin.read()
+        assert BOWInvertedIndexEngine.parse_file_to_words(path) == BOWInvertedIndexEngine().parse_text_to_words(text)
+
+
+def test_tail_without_separators_is_bounded(tmp_path, small_chunks):
+    path = tmp_path / 'long.txt'
+    path.write_text('a' * 1000 + ' end')
+    words = BOWInvertedIndexEngine.parse_file_to_words(str(path), max_tail=16)
+    assert 'end' in words
+    assert max(len(word) for word in words) <= 16 + 7
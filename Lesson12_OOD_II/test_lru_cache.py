@@ -0,0 +1,30 @@
+import sys
+
+from Lesson12_OOD_II.LRUCache import LRUCache, sizeof
+
+
+def test_sizeof_counts_elements():
+    paths = ['./input/{}.txt'.format(i) for i in range(100)]
+    assert sizeof(paths) == sys.getsizeof(paths) + sum(sys.getsizeof(path) for path in paths)
+    assert sizeof(tuple(paths)) > 5 * sys.getsizeof(tuple(paths))
+
+
+def test_byte_bound_counts_result_strings():
+    paths = ['./input/some/long/directory/{:04d}.txt'.format(i) for i in range(50)]
+    cache = LRUCache(size=100, max_bytes=3 * sizeof(paths))
+    for i in range(10):
+        cache.set(('word{}'.format(i),), list(paths))
+    assert cache.stats()['entries'] < 3
+    assert cache.nbytes <= cache.max_bytes
+
+
+def test_generation_invalidates_entries():
+    cache = LRUCache()
+    cache.set('key', ['a'], generation=1)
+    assert cache.get('key', generation=1) == ['a']
+    assert cache.get('key', generation=2) is None
+    assert cache.stats()['invalidations'] == 1
+
+    cache.set('key', ['new'], generation=3)
+    cache.set('key', ['old'], generation=2)
+    assert cache.get('key', generation=3) == ['new']
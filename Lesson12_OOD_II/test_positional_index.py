@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from Lesson12_OOD_II.PositionalIndexEngine import PositionalIndexEngine
+
+DOCS = {
+    'dream': 'I have a dream that one day',
+    'reversed': 'dream a have I',
+    'hamlet': 'to be or not to be',
+    'song': 'la la la land',
+    'gap': 'la x la land',
+    'near': 'alpha x x beta',
+    'today': 'I have a dream today',
+}
+
+
+@pytest.fixture(scope='module')
+def engine():
+    engine = PositionalIndexEngine()
+    for path, text in DOCS.items():
+        engine.process_corpus(path, text)
+    return engine
+
+
+def _contains_phrase(words, phrase):
+    return any(words[i:i + len(phrase)] == phrase for i in range(len(words) - len(phrase) + 1))
+
+
+def _within(words, left, right, k):
+    left_positions = [i for i, word in enumerate(words) if word == left]
+    right_positions = [i for i, word in enumerate(words) if word == right]
+    return any(abs(i - j) <= k for i in left_positions for j in right_positions)
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('"have a dream"', ['dream', 'today']),
+    ('"dream a have"', ['reversed']),
+    ('have a dream', ['dream', 'reversed', 'today']),
+    ('"to be"', ['hamlet']),
+    ('"to be or not to be"', ['hamlet']),
+    ('"be to"', []),
+])
+def test_phrases_are_order_sensitive(engine, query, expected):
+    assert engine.search(query) == expected
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('"la la"', ['song']),
+    ('"la la la"', ['song']),
+    ('"la la la la"', []),
+    ('"la la land"', ['song']),
+    ('"la land"', ['song', 'gap']),
+    ('"x la la"', []),
+])
+def test_repeated_terms_in_phrases(engine, query, expected):
+    assert engine.search(query) == expected
+
+
+@pytest.mark.parametrize('k, expected', [(2, []), (3, ['near']), (4, ['near'])])
+def test_near_distance_boundary(engine, k, expected):
+    # alpha和beta相距3个位置：NEAR/3命中，NEAR/2不命中，和单词的先后顺序无关
+    assert engine.search('alpha NEAR/{} beta'.format(k)) == expected
+    assert engine.search('beta NEAR/{} alpha'.format(k)) == expected
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('"have a dream" today', ['today']),
+    ('today "have a dream"', ['today']),
+    ('"a have" dream', ['reversed']),
+    ('"have a dream" NEAR/1 today', ['today']),
+    ('"have a dream" NEAR/1 one', []),
+    ('"have a dream" NEAR/2 one', ['dream']),
+    ('I "to be"', []),
+])
+def test_quoted_phrases_mixed_with_bare_terms(engine, query, expected):
+    assert engine.search(query) == expected
+
+
+def test_query_key_keeps_phrase_syntax(engine):
+    assert engine.query_key('"have a dream"') != engine.query_key('have a dream')
+    assert engine.query_key('"have a dream"') != engine.query_key('"dream a have"')
+    assert engine.query_key('dream NEAR/1 today') != engine.query_key('dream NEAR/2 today')
+    assert engine.query_key('dream NEAR/1 today') != engine.query_key('dream today')
+    assert engine.query_key('"Have a  dream!"') == engine.query_key('"have a dream"')
+
+
+def test_random_phrases_and_nears_match_brute_force():
+    rng = random.Random(0)
+    vocabulary = ['w{}'.format(i) for i in range(6)]
+    docs = {'doc{}'.format(i): rng.choices(vocabulary, k=rng.randrange(1, 30)) for i in range(200)}
+    engine = PositionalIndexEngine()
+    for path, words in docs.items():
+        engine.process_corpus(path, ' '.join(words))
+
+    for _ in range(100):
+        phrase = rng.choices(vocabulary, k=rng.randrange(1, 4))
+        expected = [path for path, words in docs.items() if _contains_phrase(words, phrase)]
+        assert engine.search('"{}"'.format(' '.join(phrase))) == expected
+
+        left, right = rng.sample(vocabulary, 2)
+        k = rng.randrange(0, 5)
+        expected = [path for path, words in docs.items() if _within(words, left, right, k)]
+        assert engine.search('{} NEAR/{} {}'.format(left, k, right)) == expected
@@ -0,0 +1,131 @@
+import random
+import tracemalloc
+from bisect import bisect_left
+
+import pytest
+
+from Lesson12_OOD_II.BOWInvertedindexEngine import BOWInvertedIndexEngine
+from Lesson12_OOD_II.PostingList import PostingList, FrequencyPostingList, PositionalPostingList, decode_varint, \
+    encode_varint, intersect
+
+
+def _random_ids(rng, size, universe):
+    return sorted(rng.sample(range(universe), size))
+
+
+def test_varint_round_trip():
+    buffer = bytearray()
+    values = [0, 1, 127, 128, 300, 1 << 20, (1 << 63) - 1]
+    for value in values:
+        encode_varint(value, buffer)
+    offset = 0
+    for value in values:
+        decoded, offset = decode_varint(buffer, offset)
+        assert decoded == value
+    assert offset == len(buffer)
+
+
+@pytest.mark.parametrize('size', [0, 1, 63, 64, 65, 1000])
+def test_round_trip_and_contains(size):
+    rng = random.Random(size)
+    doc_ids = _random_ids(rng, size, 100000)
+    posting_list = PostingList.from_ids(doc_ids)
+    assert list(posting_list) == doc_ids
+    assert len(posting_list) == size
+    for doc_id in doc_ids[::7]:
+        assert doc_id in posting_list
+    assert -5 not in posting_list and 100001 not in posting_list
+
+
+def test_advance_matches_bisect():
+    rng = random.Random(0)
+    doc_ids = _random_ids(rng, 5000, 200000)
+    posting_list = PostingList.from_ids(doc_ids)
+    targets = sorted(rng.randrange(210000) for _ in range(300))
+    cursor = posting_list.cursor()
+    for target in targets:
+        position = bisect_left(doc_ids, target)
+        expected = doc_ids[position] if position < len(doc_ids) else None
+        # 游标只能前进，target比当前文档小时停在当前文档
+        if cursor.doc is not None and cursor.doc > target:
+            expected = cursor.doc
+        assert cursor.advance(target) == expected
+        if expected is not None:
+            assert doc_ids[cursor.index] == expected
+
+
+def test_out_of_order_insert_and_duplicates():
+    posting_list = PostingList()
+    for doc_id in [5, 1, 9, 5, 3, 200, 0, 9]:
+        posting_list.append(doc_id)
+    assert list(posting_list) == [0, 1, 3, 5, 9, 200]
+
+    frequencies = FrequencyPostingList()
+    for doc_id, freq in [(2, 1), (7, 3), (4, 2)]:
+        frequencies.append(doc_id, freq)
+    assert list(frequencies.items()) == [(2, 1), (4, 2), (7, 3)]
+
+
+def test_out_of_order_insert_keeps_payloads():
+    frequencies = FrequencyPostingList()
+    for doc_id, freq in [(10, 1), (300, 2)] + [(i, i % 7 + 1) for i in range(0, 200, 3)]:
+        frequencies.append(doc_id, freq)
+    expected = sorted({10: 1, 300: 2, **{i: i % 7 + 1 for i in range(0, 200, 3)}}.items())
+    assert list(frequencies.items()) == expected
+    assert frequencies.max_freq == 7
+
+    positions = PositionalPostingList()
+    positions.append(5, [1, 4])
+    positions.append(2, [0, 9, 10])
+    positions.append(5, [3])
+    assert positions.items() == [(2, [0, 9, 10]), (5, [3])]
+
+
+def test_short_lists_stay_compact():
+    short = PostingList.from_ids([3, 70, 1000])
+    assert isinstance(short.data, bytes)
+    assert len(short.skip_docs) == 0 and len(short.skip_offsets) == 0
+
+    long = PostingList.from_ids(range(0, 3000, 3))
+    assert len(long.skip_docs) == len(long) // PostingList.SKIP_INTERVAL - (len(long) % 64 == 0)
+    assert list(long) == list(range(0, 3000, 3))
+    # 短列表共用的空跳表数组不能被长列表改写
+    assert len(short.skip_docs) == 0
+
+
+def test_singleton_lists_smaller_than_python_lists():
+    doc_ids = list(range(100000, 105000))
+    tracemalloc.start()
+    lists = [[doc_id] for doc_id in doc_ids]
+    list_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    postings = [PostingList.from_ids([doc_id]) for doc_id in doc_ids]
+    posting_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(lists) == len(postings)
+    assert posting_bytes < list_bytes * 1.5
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_intersect_matches_set_intersection(seed):
+    rng = random.Random(seed)
+    lists = [_random_ids(rng, rng.randrange(1, 3000), 20000) for _ in range(rng.randrange(1, 5))]
+    expected = sorted(set.intersection(*map(set, lists)))
+    assert intersect([PostingList.from_ids(doc_ids) for doc_ids in lists]) == expected
+    assert intersect([]) == []
+
+
+def test_engine_search_matches_exhaustive_and():
+    rng = random.Random(1)
+    vocabulary = ['w{}'.format(i) for i in range(30)]
+    docs = {'doc{}'.format(i): set(rng.sample(vocabulary, rng.randrange(1, 20))) for i in range(300)}
+    engine = BOWInvertedIndexEngine()
+    for path, words in docs.items():
+        engine.process_corpus(path, ' '.join(words))
+
+    for _ in range(50):
+        query = set(rng.sample(vocabulary, rng.randrange(1, 4)))
+        expected = [path for path, words in docs.items() if query <= words]
+        assert engine.search(' '.join(query)) == expected
@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+from Lesson12_OOD_II.BOWInvertedindexEngine import BOWInvertedIndexEngine
+from Lesson12_OOD_II.PositionalIndexEngine import PositionalIndexEngine
+from Lesson12_OOD_II.SearchServer import SearchServer, percentile
+
+DOCS = {
+    'a': 'i have a dream today',
+    'b': 'today i have a dream',
+    'c': 'dream of a day i have',
+}
+
+
+class CountingEngine(BOWInvertedIndexEngine):
+    def __init__(self):
+        super(CountingEngine, self).__init__()
+        self.searched = []
+
+    def search(self, query):
+        self.searched.append(query)
+        return super(CountingEngine, self).search(query)
+
+
+def _build(engine):
+    for path, text in DOCS.items():
+        engine.process_corpus(path, text)
+    return engine
+
+
+def _run_batch(engine, queries):
+    # 把所有查询放进同一个攒批窗口，返回每个查询的结果和服务器
+    async def run():
+        server = SearchServer(engine, port=0, batch_window=0.5, max_batch=len(queries))
+        await server.start()
+        try:
+            return await asyncio.gather(*[server.search(query) for query in queries]), server
+        finally:
+            await server.stop()
+
+    return asyncio.run(run())
+
+
+def test_positional_queries_in_one_batch_do_not_collide():
+    engine = _build(PositionalIndexEngine())
+    queries = ['"have a dream"', '"dream a have"', 'dream have a', 'dream NEAR/1 today', 'dream NEAR/0 today']
+    results, server = _run_batch(engine, queries)
+    assert results == [engine.search(query) for query in queries]
+    assert results[0] == ['a', 'b'] and results[1] == []
+    assert server.batches == 1 and server.distinct_queries == len(queries)
+
+
+def test_equivalent_queries_are_computed_once():
+    engine = _build(CountingEngine())
+    queries = ['I have a dream', 'dream a have I', 'I have a dream', 'today dream', 'Dream, today!']
+    results, server = _run_batch(engine, queries)
+    assert results == [engine.search(query) for query in queries]
+    assert results[0] == results[1] == ['a', 'b', 'c']
+    assert results[3] == results[4] == ['a', 'b']
+    # 完全相同的字符串在事件循环里合并，其余的在线程池里按单词集合合并
+    assert server.distinct_queries == 4
+    assert len(engine.searched) == 2 + len(queries)
+
+
+async def _get(port, target):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write('GET {} HTTP/1.1\r\nConnection: close\r\n\r\n'.format(target).encode('latin-1'))
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body.decode('utf-8'))
+
+
+def test_http_search_and_stats():
+    async def run():
+        server = SearchServer(_build(BOWInvertedIndexEngine()), port=0)
+        await server.start()
+        try:
+            search = await _get(server.port, '/search?q=dream+today')
+            missing = await _get(server.port, '/missing')
+            stats = await _get(server.port, '/stats')
+            return search, missing, stats
+        finally:
+            await server.stop()
+
+    (status, body), (missing_status, _), (stats_status, stats) = asyncio.run(run())
+    assert status == 200 and body == {'query': 'dream today', 'count': 2, 'results': ['a', 'b']}
+    assert missing_status == 404
+    assert stats_status == 200 and stats['requests'] == 1 and stats['batches'] == 1
+
+
+def test_engine_errors_become_500():
+    class BrokenEngine(BOWInvertedIndexEngine):
+        def search(self, query):
+            raise ValueError('index corrupted')
+
+    async def run():
+        server = SearchServer(BrokenEngine(), port=0)
+        await server.start()
+        try:
+            return await _get(server.port, '/search?q=dream')
+        finally:
+            await server.stop()
+
+    assert asyncio.run(run()) == (500, {'error': 'index corrupted'})
+
+
+def test_percentile():
+    values = [float(i) for i in range(101)]
+    assert percentile([], 50) == 0.0
+    assert percentile(values, 0) == 0.0
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile(values, 100) == 100.0
@@ -0,0 +1,55 @@
+import os
+
+from Lesson12_OOD_II.BOWInvertedindexEngine import BOWInvertedIndexEngine
+from Lesson12_OOD_II.ShardedEngine import ShardedEngine
+
+INPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'input')
+FILES = [os.path.join(INPUT, name) for name in ['1.txt', '2.txt', '3.txt', '4.txt', '5.txt']]
+
+
+def test_sharded_union_matches_single_engine():
+    engine = BOWInvertedIndexEngine()
+    engine.add_corpora(FILES, workers=1)
+    with ShardedEngine(num_shards=2) as sharded:
+        sharded.add_corpora(FILES)
+        for query in ['the', 'little', 'dream of']:
+            response = sharded.search_with_stats(query)
+            assert sorted(response['results']) == sorted(engine.search(query))
+            assert response['failed_shards'] == []
+
+
+def test_shard_survives_add_errors():
+    with ShardedEngine(num_shards=2) as sharded:
+        missing = [os.path.join(INPUT, 'missing_{}.txt'.format(i)) for i in range(4)]
+        sharded.add_corpora(missing)
+        sharded.process_corpus(None, None)
+        sharded.add_corpora(FILES)
+
+        response = sharded.search_with_stats('the')
+        assert response['failed_shards'] == []
+        assert response['results']
+        assert len(sharded.add_errors) >= 2
+        assert sum(stats['add_failures'] for stats in sharded.stats().values()) == len(sharded.add_errors)
+
+
+def test_bad_file_does_not_drop_its_batch():
+    engine = BOWInvertedIndexEngine()
+    engine.add_corpora(FILES, workers=1)
+    with ShardedEngine(num_shards=1) as sharded:
+        missing = os.path.join(INPUT, 'missing.txt')
+        sharded.add_corpora(FILES[:2] + [missing] + FILES[2:])
+        assert sorted(sharded.search('the')) == sorted(engine.search('the'))
+        assert len(sharded.add_errors) == 1 and 'missing.txt' in sharded.add_errors[0][1]
+
+
+def test_many_add_errors_do_not_block_the_pipe():
+    # 出错的命令足够多时，旧的实现里错误回复会填满管道，主进程和分片进程互相阻塞在send上
+    with ShardedEngine(num_shards=2) as sharded:
+        for i in range(5000):
+            sharded.process_corpus('doc{}'.format(i), None)
+        sharded.add_corpora(FILES)
+        response = sharded.search_with_stats('the')
+        assert response['failed_shards'] == []
+        assert response['results']
+        assert len(sharded.add_errors) == 5000
+        assert sum(stats['add_failures'] for stats in sharded.stats().values()) == 5000
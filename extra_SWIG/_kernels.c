@@ -0,0 +1,135 @@
+/*
+ * kernels.c的Python接口。参数通过buffer协议传入，numpy数组、array.array、bytearray都可以直接使用，
+ * 不复制数据，也不依赖numpy的头文件；输出数组由调用方分配好传进来。
+ * 数组必须是C连续的：double数组格式为'd'，信号数组格式为'b'（int8）。
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include "kernels.h"
+
+static int get_buffer(PyObject *obj, Py_buffer *view, const char *format, int writable, const char *name) {
+    int flags = PyBUF_C_CONTIGUOUS | PyBUF_FORMAT | (writable ? PyBUF_WRITABLE : 0);
+    if (PyObject_GetBuffer(obj, view, flags) < 0) return -1;
+    if (view->ndim != 1 || view->format == NULL || strcmp(view->format, format) != 0) {
+        PyErr_Format(PyExc_TypeError, "%s must be a 1-d contiguous array with format '%s'", name, format);
+        PyBuffer_Release(view);
+        return -1;
+    }
+    return 0;
+}
+
+static int check_length(Py_buffer *view, Py_ssize_t n, const char *name) {
+    if (view->shape[0] != n) {
+        PyErr_Format(PyExc_ValueError, "%s has length %zd, expected %zd", name, view->shape[0], n);
+        return -1;
+    }
+    return 0;
+}
+
+static PyObject *py_cross_signal(PyObject *self, PyObject *args) {
+    PyObject *a_obj, *b_obj, *out_obj;
+    double rtol;
+    Py_buffer a, b, out;
+    Py_ssize_t n;
+    if (!PyArg_ParseTuple(args, "OOdO", &a_obj, &b_obj, &rtol, &out_obj)) return NULL;
+    if (get_buffer(a_obj, &a, "d", 0, "series1") < 0) return NULL;
+    if (get_buffer(b_obj, &b, "d", 0, "series2") < 0) goto fail_a;
+    if (get_buffer(out_obj, &out, "b", 1, "out") < 0) goto fail_b;
+    n = a.shape[0];
+    if (check_length(&b, n, "series2") < 0 || check_length(&out, n, "out") < 0) goto fail_out;
+
+    Py_BEGIN_ALLOW_THREADS
+    cross_signal((const double *) a.buf, (const double *) b.buf, (long) n, rtol, (signed char *) out.buf);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&out);
+    PyBuffer_Release(&b);
+    PyBuffer_Release(&a);
+    Py_RETURN_NONE;
+
+fail_out:
+    PyBuffer_Release(&out);
+fail_b:
+    PyBuffer_Release(&b);
+fail_a:
+    PyBuffer_Release(&a);
+    return NULL;
+}
+
+static PyObject *py_position_signal(PyObject *self, PyObject *args) {
+    PyObject *signal_obj, *out_obj, *state_obj;
+    Py_buffer signal, out, state;
+    Py_ssize_t n;
+    if (!PyArg_ParseTuple(args, "OOO", &signal_obj, &out_obj, &state_obj)) return NULL;
+    if (get_buffer(signal_obj, &signal, "b", 0, "signal") < 0) return NULL;
+    if (get_buffer(out_obj, &out, "b", 1, "out") < 0) goto fail_signal;
+    if (get_buffer(state_obj, &state, "b", 1, "state") < 0) goto fail_out;
+    n = signal.shape[0];
+    if (check_length(&out, n, "out") < 0 || check_length(&state, n, "state") < 0) goto fail_state;
+
+    Py_BEGIN_ALLOW_THREADS
+    position_signal((const signed char *) signal.buf, (long) n, (signed char *) out.buf, (signed char *) state.buf);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&state);
+    PyBuffer_Release(&out);
+    PyBuffer_Release(&signal);
+    Py_RETURN_NONE;
+
+fail_state:
+    PyBuffer_Release(&state);
+fail_out:
+    PyBuffer_Release(&out);
+fail_signal:
+    PyBuffer_Release(&signal);
+    return NULL;
+}
+
+static PyObject *py_trailing_stop(PyObject *self, PyObject *args) {
+    PyObject *close_obj, *signal_obj, *out_obj;
+    double stop;
+    Py_buffer close, signal, out;
+    Py_ssize_t n;
+    if (!PyArg_ParseTuple(args, "OOdO", &close_obj, &signal_obj, &stop, &out_obj)) return NULL;
+    if (get_buffer(close_obj, &close, "d", 0, "close") < 0) return NULL;
+    if (get_buffer(signal_obj, &signal, "b", 0, "signal") < 0) goto fail_close;
+    if (get_buffer(out_obj, &out, "b", 1, "out") < 0) goto fail_signal;
+    n = close.shape[0];
+    if (check_length(&signal, n, "signal") < 0 || check_length(&out, n, "out") < 0) goto fail_out;
+
+    Py_BEGIN_ALLOW_THREADS
+    trailing_stop((const double *) close.buf, (const signed char *) signal.buf, (long) n, stop,
+                  (signed char *) out.buf);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&out);
+    PyBuffer_Release(&signal);
+    PyBuffer_Release(&close);
+    Py_RETURN_NONE;
+
+fail_out:
+    PyBuffer_Release(&out);
+fail_signal:
+    PyBuffer_Release(&signal);
+fail_close:
+    PyBuffer_Release(&close);
+    return NULL;
+}
+
+static PyMethodDef KernelsMethods[] = {
+    {"cross_signal", py_cross_signal, METH_VARARGS,
+     "cross_signal(series1, series2, rtol, out): crossover signal, +1 up / -1 down"},
+    {"position_signal", py_position_signal, METH_VARARGS,
+     "position_signal(signal, out, state): long-only position state machine"},
+    {"trailing_stop", py_trailing_stop, METH_VARARGS,
+     "trailing_stop(close, signal, stop, out): position state machine with a trailing stop"},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef kernelsmodule = {
+    PyModuleDef_HEAD_INIT, "_kernels", "C kernels for path-dependent backtest loops", -1, KernelsMethods
+};
+
+PyMODINIT_FUNC PyInit__kernels(void) {
+    return PyModule_Create(&kernelsmodule);
+}
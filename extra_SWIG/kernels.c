@@ -0,0 +1,71 @@
+#include <math.h>
+#include "kernels.h"
+
+/*
+ * 均线交叉信号，和utils.crossover_vector相同：
+ * series1在第i-2到第i-1个时刻之间从下方穿过series2时out[i]为+1，从上方穿过时为-1。
+ * 比较时留出rtol的相对误差，避免浮点误差引起的假交叉；NaN不会产生交叉。
+ */
+void cross_signal(const double *series1, const double *series2, long n, double rtol, signed char *out) {
+    long i;
+    for (i = 0; i < n && i < 2; i++) out[i] = 0;
+    for (i = 2; i < n; i++) {
+        double a0 = series1[i - 2], b0 = series2[i - 2], a1 = series1[i - 1], b1 = series2[i - 1];
+        double tol0 = rtol * fmax(fabs(a0), fabs(b0));
+        double tol1 = rtol * fmax(fabs(a1), fabs(b1));
+        if (a0 < b0 - tol0 && a1 > b1 + tol1) out[i] = 1;
+        else if (b0 < a0 - tol0 && b1 > a1 + tol1) out[i] = -1;
+        else out[i] = 0;
+    }
+}
+
+/*
+ * 只做多的仓位状态机：空仓时的买入信号开仓，持仓时的卖出信号平仓，其它信号忽略。
+ * out是实际执行的信号，state是每个时刻执行之后的仓位（1持仓，0空仓）。
+ */
+void position_signal(const signed char *signal, long n, signed char *out, signed char *state) {
+    long i;
+    signed char held = 0;
+    for (i = 0; i < n; i++) {
+        signed char s = 0;
+        if (!held && signal[i] > 0) {
+            s = 1;
+            held = 1;
+        } else if (held && signal[i] < 0) {
+            s = -1;
+            held = 0;
+        }
+        out[i] = s;
+        state[i] = held;
+    }
+}
+
+/*
+ * 带移动止损的仓位状态机：在position_signal的基础上，持仓期间记录开仓以来的最高收盘价，
+ * 上一个收盘价比最高价回落超过stop（比如0.05表示5%）时平仓。开仓价按开仓时刻的收盘价计算。
+ */
+void trailing_stop(const double *close, const signed char *signal, long n, double stop, signed char *out) {
+    long i;
+    signed char held = 0;
+    double peak = 0.0;
+    for (i = 0; i < n; i++) {
+        signed char s = 0;
+        if (held) {
+            int stopped = 0;
+            if (i > 0) {
+                double price = close[i - 1];
+                if (price > peak) peak = price;
+                stopped = price <= peak * (1.0 - stop);
+            }
+            if (stopped || signal[i] < 0) {
+                s = -1;
+                held = 0;
+            }
+        } else if (signal[i] > 0) {
+            s = 1;
+            held = 1;
+            peak = close[i];
+        }
+        out[i] = s;
+    }
+}
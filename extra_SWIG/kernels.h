@@ -0,0 +1,16 @@
+#ifndef KERNELS_H
+#define KERNELS_H
+
+/*
+ * 回测中依赖路径、无法向量化的循环。所有函数一次处理整段数组，
+ * 第i个输出只使用第i-1个及之前的价格（入场价除外），和Strategy.next(i)看到的数据一致。
+ * 信号：+1 买入，-1 卖出，0 不操作。
+ */
+
+void cross_signal(const double *series1, const double *series2, long n, double rtol, signed char *out);
+
+void position_signal(const signed char *signal, long n, signed char *out, signed char *state);
+
+void trailing_stop(const double *close, const signed char *signal, long n, double stop, signed char *out);
+
+#endif
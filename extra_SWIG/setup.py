@@ -4,4 +4,7 @@ from distutils.core import setup, Extension
 
 example_module = Extension('_example', sources=['example_wrap.c', 'example.c'])
 
-setup(name='example', ext_modules=[example_module], py_modules=["example"])
+# 回测用的C内核，直接用buffer协议读写numpy数组，不经过SWIG
+kernels_module = Extension('_kernels', sources=['_kernels.c', 'kernels.c'], extra_compile_args=['-O3'])
+
+setup(name='example', ext_modules=[example_module, kernels_module], py_modules=["example"])
@@ -1,93 +1,67 @@
-import copy
 import json
 import ssl
 import time
 import websocket
 
-
-class OrderBook(object):
-
-    BID = 'bid'
-    ASKS = 'ask'
-
-    def __init__(self, limit=20):
-
-        self.limit = limit
-
-        # (price, amount)
-        self.bids = {}
-        self.asks = {}
-
-        self.bids_sorted = []
-        self.asks_sorted = []
-
-    def insert(self, price, amount, direction):
-        if direction == self.BID:
-            if amount == 0:
-                if price in self.bids:
-                    del self.bids[price]
-
-            else:
-                self.bids[price] = amount
-
-        elif direction == self.ASKS:
-            if amount == 0:
-                if price in self.asks:
-                    del self.asks[price]
-
-            else:
-                self.asks[price] = amount
-
-        else:
-            print('WARNING: unknow direction {}'.format(direction))
-
-    def sort_and_truncate(self):
-        # sort
-        self.bids_sorted = sorted([(price, amount) for price, amount in self.bids.items()], reverse=True)
-        self.asks_sorted = sorted([(price, amount) for price, amount in self.asks.items()])
-
-        # truncate
-        self.bids_sorted = self.bids_sorted[:self.limit]
-        self.asks_sorted = self.asks_sorted[:self.limit]
-
-        # copy back to bids and asks
-        self.bids = dict(self.bids_sorted)
-        self.asks = dict(self.asks_sorted)
-
-    def get_copy_of_bids_and_asks(self):
-        return copy.deepcopy(self.bids_sorted), copy.deepcopy(self.asks_sorted)
+from orderbook import OrderBook
+from snapshots import SnapshotSink
 
 
 class Crawler:
-    def __init__(self, symbol, output_file):
+    def __init__(self, symbol, output_file, signal=None, sink=None, journal=None):
+        """
+        :param signal:  增量策略，比如SmaCross.live()，每次orderbook更新后用买一卖一的中间价更新
+        :param sink:    SnapshotSink    快照的写入方式，默认在后台线程中按JSON行追加到output_file；
+                                        False表示不保存快照
+        :param journal: JournalWriter   不为None时另外记录原始增量，任意时刻的订单簿都可以由journal.Journal恢复；
+                                        快照仍然照常写入output_file，只用日志时传入sink=False
+        """
         self.orderbook = OrderBook(limit=10)
         self.output_file = output_file
+        self.signal = signal
+        self.journal = journal
+        self._last_ts = 0
+        if sink is None:
+            sink = SnapshotSink(output_file)
+        self.sink = None if sink is False else sink
 
         self.ws = websocket.WebSocketApp(
             'wss://api.gemini.com/v1/marketdata/{}'.format(symbol),
             on_message=lambda ws, message: self.on_message(message)
         )
-        self.ws.run_forever(sslopt={'cert_reqs': ssl.CERT_NONE})
+        try:
+            self.ws.run_forever(sslopt={'cert_reqs': ssl.CERT_NONE})
+        finally:
+            # sink.close会抛出写线程中的错误，日志要在各自的finally中关闭，保证缓冲的增量写入磁盘
+            try:
+                if self.sink is not None:
+                    self.sink.close()
+            finally:
+                if self.journal is not None:
+                    self.journal.close()
 
     def on_message(self, message):
         # 对收到的信息进行处理，然后送给orderbook
         data = json.loads(message)
+        # 日志要求时间戳递增，系统时钟被往回调整时沿用上一个时间戳
+        ts = self._last_ts = max(int(time.time() * 1000), self._last_ts)
+        if self.journal is not None:
+            self.journal.append_message(ts, data['events'])
         for event in data['events']:
             price, amount, direction = float(event['price']), float(event['remaining']), event['side']
             self.orderbook.insert(price, amount, direction)
 
-        # 整理orderbook, 排序，只选取我们需要的前几个
-        self.orderbook.sort_and_truncate()
+        # 实时更新策略信号，只用到最新的价格，不需要重新计算历史
+        mid_price = self.orderbook.mid_price
+        if self.signal is not None and mid_price is not None:
+            action = self.signal.update(mid_price)
+            if action:
+                print('{} signal at {}'.format('BUY' if action > 0 else 'SELL', mid_price))
 
-        # 输出到文件
-        with open(self.output_file, 'a+') as f:
+        # 输出到文件，编码和写入都在sink的后台线程中进行，不阻塞接收消息
+        if self.sink is not None:
             bids, asks = self.orderbook.get_copy_of_bids_and_asks()
-            output = {
-                'bids': bids,
-                'asks': asks,
-                'ts': int(time.time() * 1000)
-            }
-            f.write(json.dumps(output) + '\n')
+            self.sink.write(ts, bids, asks)
 
 
 if __name__ == '__main__':
@@ -1,8 +1,18 @@
 import pandas as pd
 import numpy as np
 import abc
+from os import path
 from typing import Callable
 from utils import assert_msg, crossover, SMA, read_file
+from vectorized import simulate_signals
+from indicators import DEFAULT_REGISTRY
+from streaming import SmaCrossSignal
+from datastore import ColumnStore
+from orders import OrderSimulator, BUY, SELL, MARKET, LIMIT, STOP, TRADE_DTYPE
+from stats import compute_stats, periods_per_year, trade_log
+import kernels
+import optimizer
+import walkforward
 
 
 class Strategy(metaclass=abc.ABCMeta):
@@ -12,16 +22,19 @@ class Strategy(metaclass=abc.ABCMeta):
     Strategy.init Strategy.next
     """
 
-    def __init__(self, broker, data):
+    def __init__(self, broker, data, indicator_cache=None):
         """
         构造策略对象。
-        :param broker:      ExchangeAPI     交易API接口，用于模拟交易
-        :param data:        list            行情数据
+        :param broker:          ExchangeAPI     交易API接口，用于模拟交易
+        :param data:            list            行情数据
+        :param indicator_cache: IndicatorRegistry   指标缓存，默认使用全局的DEFAULT_REGISTRY
         """
         self._indicators = []
+        self._indicator_cache = DEFAULT_REGISTRY if indicator_cache is None else indicator_cache
         self._broker = broker  # type: _Broker
         self._data = data  # type: _Data
         self._tick = 0
+        self._signal = None
 
     def I(self, func: Callable, *args) -> np.ndarray:
         """
@@ -30,18 +43,35 @@ class Strategy(metaclass=abc.ABCMeta):
         例如计算滑动平均：
         def init():
             self.sma = self.I(utils.SMA, self.data.Close, N)
+        返回的数组来自指标缓存，在多次回测之间共享，是只读的；需要原地修改时先copy()。
         :param func:
         :param args:
         :return:
         """
-        value = func(*args)
-        value = np.asarray(value)
+        # 同样的函数、数据和参数只计算一次，多次回测（比如参数优化）时直接取缓存的结果
+        value = self._indicator_cache.compute(func, *args)
         assert_msg(value.shape[-1] == len(self._data.Close), '指示器长度必须和data长度相同')
 
         self._indicators.append(value)
 
         return value
 
+    def set_signal(self, signal):
+        """
+        设置整段历史的交易信号，供向量化回测使用。一般在init中调用：
+        signal[i]为+1表示在第i步买入，-1表示卖出，0表示不操作，
+        和在next(i)中调用buy/sell的效果相同。
+        :param signal:  np.ndarray  和data等长的信号数组
+        :return:
+        """
+        signal = np.asarray(signal)
+        assert_msg(signal.shape[-1] == len(self._data.Close), '信号长度必须和data长度相同')
+        self._signal = signal
+
+    @property
+    def signal(self):
+        return self._signal
+
     @property
     def tick(self):
         return self._tick
@@ -66,11 +96,11 @@ class Strategy(metaclass=abc.ABCMeta):
         """
         pass
 
-    def buy(self):
-        self._broker.buy()
+    def buy(self, size=None, limit=None, stop=None, valid=None):
+        return self._broker.buy(size, limit, stop, valid)
 
-    def sell(self):
-        self._broker.sell()
+    def sell(self, size=None, limit=None, stop=None, valid=None):
+        return self._broker.sell(size, limit, stop, valid)
 
     @property
     def data(self):
@@ -88,6 +118,8 @@ class ExchangeAPI:
         self._position = 0
         self._cash = cash
         self._i = 0
+        # 成交记录：(订单编号, 时刻, 方向, 数量, 价格, 手续费)，没有订单，编号记为-1
+        self._trades = []
 
     @property
     def cash(self):
@@ -121,6 +153,14 @@ class ExchangeAPI:
         """
         return self._data.Close[self._i]
 
+    @property
+    def commission(self):
+        """
+        返回手续费率
+        :return:
+        """
+        return self._commission
+
     @property
     def market_value(self):
         """
@@ -129,23 +169,130 @@ class ExchangeAPI:
         """
         return self._cash + self._position * self.current_price
 
-    def buy(self):
+    @property
+    def trades(self):
+        """
+        返回所有成交记录，结构化数组，字段见orders.TRADE_DTYPE
+        :return:
+        """
+        return np.array(self._trades, dtype=TRADE_DTYPE)
+
+    def buy(self, size=None, limit=None, stop=None, valid=None):
         """
         用当前账户剩余资金，按照市场价格全部买入
         :return:
         """
-        self._position = float(self._cash / (self.current_price * (1 + self._commission)))
+        self._check_order(size, limit, stop, valid)
+        price = float(self.current_price)
+        self._position = float(self._cash / (price * (1 + self._commission)))
         self._cash = 0.0
+        if self._position > 0:
+            self._record(BUY, self._position, price)
 
-    def sell(self):
+    def sell(self, size=None, limit=None, stop=None, valid=None):
         """
         卖出当前账户剩余持仓
         :return:
         """
-        self._cash += float(self._position * self.current_price * (1 - self._commission))
+        self._check_order(size, limit, stop, valid)
+        price = float(self.current_price)
+        if self._position > 0:
+            self._record(SELL, self._position, price)
+        self._cash += float(self._position * price * (1 - self._commission))
         self._position = 0.0
 
+    def _record(self, side, size, price):
+        self._trades.append((-1, self._i, side, size, price, size * price * self._commission))
+
+    @staticmethod
+    def _check_order(size, limit, stop, valid):
+        assert_msg(size is None and limit is None and stop is None and valid is None,
+                   'ExchangeAPI只支持按收盘价全仓成交，指定数量、限价单和止损单请使用SimulatedExchange')
+
+    def next(self, tick):
+        self._i = tick
+
+    def restore(self, cash, position, tick, trades=None):
+        """
+        用向量化回测算出的账户状态和成交记录更新交易所对象
+        :return:
+        """
+        self._cash = float(cash)
+        self._position = float(position)
+        self._i = tick
+        if trades is not None:
+            self._trades = trades.tolist()
+
+
+class SimulatedExchange(ExchangeAPI):
+    """
+    带订单撮合的交易所。buy/sell不再立即按收盘价成交，而是提交订单，从下一个时刻开始按OHLC撮合，
+    支持市价单、限价单、止损单、滑点和按成交量的部分成交，撮合规则见orders.OrderSimulator。
+    滑点和成交量比例是类属性，可以通过继承修改：
+    class MyExchange(SimulatedExchange):
+        slippage = 0.0005
+        participation = 0.1
+    """
+
+    # 市价单和止损单成交价格的滑点比例
+    slippage = 0.0
+
+    # 每个时刻最多成交这个时刻成交量的比例，None表示不限制
+    participation = None
+
+    def __init__(self, data, cash, commission):
+        super(SimulatedExchange, self).__init__(data, cash, commission)
+        self._simulator = OrderSimulator(data.Open.values, data.High.values, data.Low.values, data.Close.values,
+                                         data.Volume.values, commission, self.slippage, self.participation)
+
+    @property
+    def orders(self):
+        """
+        返回所有订单，结构化数组，字段见orders.ORDER_DTYPE
+        :return:
+        """
+        return self._simulator.orders
+
+    @property
+    def trades(self):
+        """
+        返回所有成交记录，结构化数组，字段见orders.TRADE_DTYPE
+        :return:
+        """
+        return self._simulator.trades
+
+    def buy(self, size=None, limit=None, stop=None, valid=None):
+        """
+        提交买单。只给size是市价单，给了limit是限价单，给了stop是止损单
+        :param size:    float   买入数量，None表示用全部现金
+        :param limit:   float   限价
+        :param stop:    float   触发价
+        :param valid:   int     有效的时刻数，None表示一直有效
+        :return:        int     订单编号
+        """
+        return self._submit(BUY, size, limit, stop, valid)
+
+    def sell(self, size=None, limit=None, stop=None, valid=None):
+        """
+        提交卖单，参数和buy相同，size为None表示卖出全部持仓
+        :return:        int     订单编号
+        """
+        return self._submit(SELL, size, limit, stop, valid)
+
+    def cancel(self, order_id):
+        return self._simulator.cancel(order_id)
+
+    def _submit(self, side, size, limit, stop, valid):
+        assert_msg(limit is None or stop is None, '不支持同时指定限价和触发价')
+        if limit is not None:
+            return self._simulator.submit(self._i, side, size, LIMIT, limit, valid)
+        if stop is not None:
+            return self._simulator.submit(self._i, side, size, STOP, stop, valid)
+        return self._simulator.submit(self._i, side, size, MARKET, None, valid)
+
     def next(self, tick):
+        # 先用这个时刻的行情撮合之前的挂单，再移动到这个时刻
+        self._cash, self._position = self._simulator.match(tick, self._cash, self._position)
         self._i = tick
 
 
@@ -161,6 +308,9 @@ class SmaCross(Strategy):
         self.sma1 = self.I(SMA, self.data.Close, self.fast)
         self.sma2 = self.I(SMA, self.data.Close, self.slow)
 
+        # 向量化回测使用的信号，和next中逐个tick的判断结果相同
+        self.set_signal(kernels.cross_signal(self.sma1, self.sma2))
+
     def next(self, tick):
         # 如果此时快线刚好越过慢线，买入全部
         if crossover(self.sma1[:tick], self.sma2[:tick]):
@@ -174,40 +324,84 @@ class SmaCross(Strategy):
         else:
             pass
 
+    @classmethod
+    def live(cls):
+        """
+        返回实盘使用的增量版本，每个新价格O(1)更新均线，判断逻辑和next相同
+        :return:    SmaCrossSignal
+        """
+        return SmaCrossSignal(cls.fast, cls.slow)
+
+
+class SmaCrossTrailingStop(Strategy):
+    """
+    均线金叉买入，死叉或者价格从持仓以来的最高价回落stop时卖出。
+    止损依赖持仓期间的最高价，没法用数组运算表示，整段信号在init中由C内核一次算出（见kernels.trailing_stop），
+    next只读取算好的信号。
+    """
+
+    fast = 10
+    slow = 20
+
+    # 从最高价回落的止损比例
+    stop = 0.05
+
+    def init(self):
+        self.sma1 = self.I(SMA, self.data.Close, self.fast)
+        self.sma2 = self.I(SMA, self.data.Close, self.slow)
+        self.set_signal(kernels.trailing_stop(self.data.Close.values, kernels.cross_signal(self.sma1, self.sma2),
+                                              self.stop))
+
+    def next(self, tick):
+        if self.signal[tick] > 0:
+            self.buy()
+        elif self.signal[tick] < 0:
+            self.sell()
+
 
 class Backtest:
     """
     Backtest回测类，用于读取历史行情数据、执行策略、模拟交易并估计 收益。
     初始化的时候调用Backtest.run来时回测 instance,
-    or `backtesting.backtesting.Backtest.optimize` to optimize it.
+    或者调用Backtest.optimize在多组策略参数中寻找最优的一组。
     """
 
+    # 前warmup个时刻只用来计算指标，从这里开始交易
+    warmup = 100
+
     def __init__(self,
                  data: pd.DataFrame,
                  strategy_type: type(Strategy),
                  broker_type: type(ExchangeAPI),
                  cash: float = 10000,
-                 commission: float = .0
+                 commission: float = .0,
+                 indicator_cache=None
                  ):
         """
         构造回测对象。
         需要的参数包括：历史数据，策略对象，初始资金数量，手续费率等。
         初始化过程包括检测输入类型，填充数据空值等。
-        :param data:            pd.DataFrame    pandas.DataFrame格式的历史OHLCV数据
+        :param data:            pd.DataFrame    pandas.DataFrame格式的历史OHLCV数据，也可以是ColumnStore列存储
         :param strategy_type:   type(Exchange)  交易所API类型，负责执行买卖操作以及账户状态的维护
         :param broker_type:     type(Strategy)  策略类型
         :param cash:            float           初始资金数量
         :param commission:      float           每次交易手续费率。如2%的手续费，次数为0.02
+        :param indicator_cache: IndicatorRegistry   传给策略的指标缓存
         """
         assert_msg(issubclass(strategy_type, Strategy), 'strategy_type不是一个Strategy类型')
         assert_msg(issubclass(broker_type, ExchangeAPI), 'strategy_type不是一个Strategy类型')
         assert_msg(isinstance(commission, float), 'commission不是浮点数值类型')
 
+        # 列存储只读取回测需要的OHLCV列
+        if isinstance(data, ColumnStore):
+            data = data.to_frame(columns=[column for column in ('Open', 'High', 'Low', 'Close', 'Volume')
+                                          if column in data.columns])
+
         data = data.copy(False)
 
-        # 如果没有Volumn列，填充NaN
-        if 'Volumne' not in data:
-            data['Volumne'] = np.nan
+        # 如果没有Volume列，填充NaN
+        if 'Volume' not in data:
+            data['Volume'] = np.nan
 
         # 验证OHLC数据模式
         assert_msg(len(data.columns & {'Open', 'High', 'Low', 'Close', 'Volume'}) == 5,
@@ -226,43 +420,167 @@ class Backtest:
 
         # 利用数据，初始化交易所对象和策略对象
         self._data = data  # type: pd.DataFrame
+        self._strategy_type = strategy_type
+        self._broker_type = broker_type
+        self._cash = cash
+        self._commission = commission
+        self._indicator_cache = indicator_cache
         self._broker = broker_type(data, cash, commission)
-        self._strategy = strategy_type(self._broker, self._data)
+        self._strategy = strategy_type(self._broker, self._data, indicator_cache)
         self._results = None
+        # 每个时刻的现金和持仓，以及交易所的成交记录，由run记录
+        self._cash_curve = None
+        self._position_curve = None
+        self._fills = None
+        self._start = 0
+        self._periods = periods_per_year(data.index)
+
+    @property
+    def data(self):
+        return self._data
+
+    @property
+    def strategy_type(self):
+        return self._strategy_type
+
+    @property
+    def broker_type(self):
+        return self._broker_type
+
+    @property
+    def cash(self):
+        return self._cash
+
+    @property
+    def commission(self):
+        return self._commission
+
+    @property
+    def equity(self):
+        """
+        最近一次run的市值曲线
+        :return:    pd.Series
+        """
+        if self._cash_curve is None:
+            return None
+        return pd.Series(self._cash_curve + self._position_curve * self._data.Close.values, index=self._data.index)
 
-    def run(self):
+    @property
+    def trades(self):
+        """
+        最近一次run的交易记录，由交易所的实际成交得到（成交价格包含滑点），字段见stats.TRADE_LOG_DTYPE
+        :return:    np.ndarray
+        """
+        if self._fills is None:
+            return None
+        return trade_log(self._fills)
+
+    def run(self, mode='loop', **params):
         """
         运行回测，迭代历史数据，执行模拟交易并返回回测结果。
         Run the backtest. Returns `pd.Series` with results and statistics.
         Keyword arguments are interpreted as strategy parameters.
+        :param mode:    str     'loop'逐个tick调用Strategy.next，作为参考实现；
+                                'vectorized'使用策略在init中设置的信号数组一次算出全部结果
+        :param params:  策略参数，比如 fast=5, slow=30，覆盖策略类上的默认值
         :return:
         """
-        strategy = self._strategy
-        broker = self._broker
+        # 每次run都用新的交易所和策略对象，重复回测（比如参数优化）时不会带上一次的现金、持仓和订单
+        broker = self._broker = self._broker_type(self._data, self._cash, self._commission)
+        strategy = self._strategy = self._strategy_type(broker, self._data, self._indicator_cache)
+
+        for name, value in params.items():
+            assert_msg(hasattr(strategy, name), '策略{}没有参数{}'.format(type(strategy).__name__, name))
+            setattr(strategy, name, value)
 
         # 策略初始化
         strategy.init()
 
         # 设定回测开始和结束位置
-        start = 100
+        start = self.warmup
         end = len(self._data)
 
-        # 回测主循环，更新市场状态，然后执行策略
-        for i in range(start, end):
-            # 注意要先把市场状态移动到第i时刻，然后再执行策略。
-            broker.next(i)
-            strategy.next(i)
+        if mode == 'vectorized':
+            assert_msg(strategy.signal is not None, '向量化回测需要策略在init中调用set_signal')
+            assert_msg(not isinstance(broker, SimulatedExchange), 'SimulatedExchange的订单撮合只支持loop模式')
+            result = simulate_signals(self._data.Close.values, strategy.signal,
+                                      broker.initial_cash, broker.commission, start, end)
+            broker.restore(result['cash'][end - 1], result['position'][end - 1], end - 1, result['trades'])
+            cash, position = result['cash'], result['position']
+        elif mode == 'loop':
+            # 预先分配现金和持仓曲线，回测过程中逐个时刻填入
+            cash = np.empty(end)
+            position = np.empty(end)
+            cash[:start] = broker.cash
+            position[:start] = broker.position
+
+            # 回测主循环，更新市场状态，然后执行策略
+            for i in range(start, end):
+                # 注意要先把市场状态移动到第i时刻，然后再执行策略。
+                broker.next(i)
+                strategy.next(i)
+                cash[i] = broker.cash
+                position[i] = broker.position
+        else:
+            raise Exception('未知的回测模式：{}'.format(mode))
+
+        self._cash_curve = cash
+        self._position_curve = position
+        self._fills = broker.trades
+        self._start = start
 
         # 完成策略执行之后，计算结果并返回
-        self._results = self._compute_results(broker)
+        self._results = self._compute_results(broker, cash, position, start, self._fills)
         return self._results
 
-    def _compute_results(self, broker):
-        s = pd.Series()
-        s['初始市值'] = broker.initial_cash
-        s['结束市值'] = broker.market_value
-        s['收益'] = broker.market_value - broker.initial_cash
-        return s
+    def optimize(self, maximize='收益', constraint=None, method='grid', max_tries=None, prune=None,
+                 workers=None, mode='vectorized', random_state=None, cache_dir=None, **param_ranges):
+        """
+        在param_ranges给出的参数组合上并行回测，返回按maximize从高到低排序的结果表。例如：
+        Backtest(data, SmaCross, ExchangeAPI).optimize(fast=range(5, 30, 5), slow=range(10, 100, 10),
+                                                       constraint=lambda p: p['fast'] < p['slow'])
+        各参数的含义见optimizer.optimize。
+        :return:    pd.DataFrame
+        """
+        return optimizer.optimize(self, param_ranges, maximize=maximize, constraint=constraint, method=method,
+                                  max_tries=max_tries, prune=prune, workers=workers, mode=mode,
+                                  random_state=random_state, cache_dir=cache_dir)
+
+    def walk_forward(self, train, test, step=None, anchored=False, maximize='收益', constraint=None, workers=None,
+                     mode='vectorized', cache_dir=None, **param_ranges):
+        """
+        滚动窗口回测：每train个时刻优化一次参数，用接下来的test个时刻检验。例如：
+        table, returns = Backtest(data, SmaCross, ExchangeAPI).walk_forward(
+            5000, 1000, fast=range(5, 30, 5), slow=range(10, 100, 10))
+        各参数的含义见walkforward.walk_forward，returns可以传给walkforward.monte_carlo估计结果的分布。
+        :return:    (pd.DataFrame, pd.Series)
+        """
+        return walkforward.walk_forward(self, param_ranges, train, test, step=step, anchored=anchored,
+                                        maximize=maximize, constraint=constraint, workers=workers, mode=mode,
+                                        cache_dir=cache_dir)
+
+    def _compute_results(self, broker, cash, position, start, fills=None):
+        # 一次构造Series，逐项赋值在参数优化反复回测时开销很大
+        results = {
+            '初始市值': broker.initial_cash,
+            '结束市值': broker.market_value,
+            '收益': broker.market_value - broker.initial_cash,
+        }
+        results.update(compute_stats(cash, position, self._data.Close.values, start, self._periods, fills))
+        return pd.Series(results)
+
+
+def check_equivalence(data, strategy_type, broker_type, cash=10000.0, commission=.0):
+    """
+    分别用逐tick循环和向量化两种模式回测，检查结果是否一致
+    :return:    (循环模式结果, 向量化模式结果)
+    """
+    loop = Backtest(data, strategy_type, broker_type, cash, commission).run(mode='loop')
+    vectorized = Backtest(data, strategy_type, broker_type, cash, commission).run(mode='vectorized')
+    assert_msg(np.allclose(loop.values.astype(float), vectorized.values.astype(float), rtol=1e-9, atol=1e-6,
+                           equal_nan=True),
+               '向量化回测结果和循环回测不一致：\n{}\n{}'.format(loop, vectorized))
+    return loop, vectorized
 
 
 def main():
@@ -270,6 +588,27 @@ def main():
     ret = Backtest(BTCUSD, SmaCross, ExchangeAPI, 10000.0, 0.003).run()
     print(ret)
 
+    # 直接用列存储回测，不经过CSV解析
+    store = ColumnStore.open(path.join(path.dirname(path.abspath(__file__)), 'BTCUSD_GEMINI.csv'))
+    print(Backtest(store, SmaCross, ExchangeAPI, 10000.0, 0.003).run())
+
+    _, ret = check_equivalence(BTCUSD, SmaCross, ExchangeAPI, 10000.0, 0.003)
+    print(ret)
+
+    # 按下一个时刻的开盘价成交，考虑滑点
+    class SlippageExchange(SimulatedExchange):
+        slippage = 0.0005
+
+    backtest = Backtest(BTCUSD, SmaCross, SlippageExchange, 10000.0, 0.003)
+    print(backtest.run())
+
+    _, ret = check_equivalence(BTCUSD, SmaCrossTrailingStop, ExchangeAPI, 10000.0, 0.003)
+    print(ret)
+
+    table = Backtest(BTCUSD, SmaCross, ExchangeAPI, 10000.0, 0.003).optimize(
+        fast=range(5, 50, 5), slow=range(10, 200, 10), constraint=lambda params: params['fast'] < params['slow'])
+    print(table.head(10))
+
 
 if __name__ == '__main__':
     main()
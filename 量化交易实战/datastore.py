@@ -0,0 +1,239 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from utils import assert_msg
+
+# 列存储的格式版本，格式变化时旧的缓存会被重新生成
+STORE_VERSION = 2
+INDEX_FILE = '_index.npy'
+META_FILE = 'meta.json'
+# 多个进程同时生成同一个存储时，改名重试的次数
+BUILD_ATTEMPTS = 10
+
+
+def default_store_path(csv_path, cache_dir=None):
+    """
+    CSV文件对应的列存储目录：cache_dir为None时和CSV文件放在一起，否则放在cache_dir下
+    """
+    if cache_dir is None:
+        return csv_path + '.columns'
+    return os.path.join(cache_dir, os.path.basename(csv_path) + '.columns')
+
+
+def _source_signature(csv_path):
+    # 用CSV文件的大小和修改时间判断缓存是否过期
+    stat = os.stat(csv_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _tz_to_json(tz):
+    """
+    时区保存成名字（比如'Asia/Shanghai'），固定时差（CSV中的'+08:00'）保存成相对UTC的分钟数
+    """
+    if tz is None:
+        return None
+    name = getattr(tz, 'zone', None) or getattr(tz, 'key', None)
+    if name is not None:
+        return name
+    return int(tz.utcoffset(None).total_seconds() // 60)
+
+
+def _tz_from_json(value):
+    if isinstance(value, int):
+        return timezone(timedelta(minutes=value))
+    return value
+
+
+def build_store(csv_path, store_path=None):
+    """
+    把CSV行情转换成列存储：每一列一个.npy文件，时间索引单独一个文件，按时间升序排列。
+    字符串列（比如Symbol）保存成整数编码加上取值列表；带时区的时间索引按UTC保存，时区记在meta中。
+    先写到唯一的临时目录再改名，其它进程或线程不会读到写了一半的存储；
+    多个进程同时生成同一个存储时，改名失败的一方直接使用先完成的那一份。
+    :return:    str     存储目录
+    """
+    store_path = store_path or default_store_path(csv_path)
+    parent = os.path.dirname(os.path.abspath(store_path))
+    os.makedirs(parent, exist_ok=True)
+    data = pd.read_csv(csv_path, index_col=0, parse_dates=True, infer_datetime_format=True)
+    assert_msg(isinstance(data.index, pd.DatetimeIndex), '第一列必须是时间')
+    data = data.sort_index(kind='mergesort')
+
+    tmp_path = tempfile.mkdtemp(prefix=os.path.basename(store_path) + '.', suffix='.tmp', dir=parent)
+    try:
+        _write_store(tmp_path, data, csv_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    for _ in range(BUILD_ATTEMPTS):
+        try:
+            # 目标目录不存在时改名是原子的，已经存在（非空）时会失败
+            os.replace(tmp_path, store_path)
+            return store_path
+        except OSError:
+            pass
+        if ColumnStore.is_fresh(csv_path, store_path):
+            # 其它进程已经生成了同样的存储，直接使用
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return store_path
+        # 过期的旧存储先原子地改名移开再删除，正在生成的其它进程不会看到删了一半的目录
+        stale_path = tempfile.mkdtemp(prefix=os.path.basename(store_path) + '.', suffix='.old', dir=parent)
+        try:
+            os.replace(store_path, stale_path)
+        except OSError:
+            pass
+        shutil.rmtree(stale_path, ignore_errors=True)
+
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    assert_msg(False, '列存储生成失败：{}'.format(store_path))
+
+
+def _write_store(tmp_path, data, csv_path):
+    columns = []
+    for i, name in enumerate(data.columns):
+        column = data[name]
+        file_name = 'col{}.npy'.format(i)
+        meta = {'name': name, 'file': file_name}
+        if pd.api.types.is_numeric_dtype(column):
+            np.save(os.path.join(tmp_path, file_name), column.values.astype(np.float64))
+        else:
+            codes, categories = pd.factorize(column.astype(str))
+            np.save(os.path.join(tmp_path, file_name), codes.astype(np.int32))
+            meta['categories'] = list(categories)
+        columns.append(meta)
+
+    # 带时区的索引.values是UTC时间
+    np.save(os.path.join(tmp_path, INDEX_FILE), data.index.values.astype('datetime64[ns]'))
+    with open(os.path.join(tmp_path, META_FILE), 'w') as fout:
+        json.dump({
+            'version': STORE_VERSION,
+            'rows': len(data),
+            'index_name': data.index.name,
+            'index_tz': _tz_to_json(data.index.tz),
+            'columns': columns,
+            'source': _source_signature(csv_path),
+        }, fout, ensure_ascii=False)
+
+
+class ColumnStore(object):
+    """
+    只读的列存储。所有列用np.load(mmap_mode='r')映射，打开时不读取数据；
+    按时间范围取数据时先在时间索引上二分查找，只有选中的行才会从磁盘读进来。
+    """
+
+    def __init__(self, store_path):
+        with open(os.path.join(store_path, META_FILE), 'r') as fin:
+            self.meta = json.load(fin)
+        assert_msg(self.meta['version'] == STORE_VERSION, '列存储版本不一致：{}'.format(store_path))
+
+        self.path = store_path
+        self.tz = _tz_from_json(self.meta['index_tz'])
+        self.index = np.load(os.path.join(store_path, INDEX_FILE), mmap_mode='r')
+        self._columns = {}
+        self._categories = {}
+        for column in self.meta['columns']:
+            self._columns[column['name']] = np.load(os.path.join(store_path, column['file']), mmap_mode='r')
+            if 'categories' in column:
+                self._categories[column['name']] = np.array(column['categories'], dtype=object)
+
+    @classmethod
+    def open(cls, csv_path, store_path=None):
+        """
+        打开CSV对应的列存储，不存在或者CSV更新过时先重新生成
+        """
+        store_path = store_path or default_store_path(csv_path)
+        if not cls.is_fresh(csv_path, store_path):
+            build_store(csv_path, store_path)
+        return cls(store_path)
+
+    @staticmethod
+    def is_fresh(csv_path, store_path):
+        try:
+            with open(os.path.join(store_path, META_FILE), 'r') as fin:
+                meta = json.load(fin)
+        except (OSError, ValueError):
+            return False
+        return meta.get('version') == STORE_VERSION and meta.get('source') == _source_signature(csv_path)
+
+    def __len__(self):
+        return self.meta['rows']
+
+    @property
+    def columns(self):
+        return [column['name'] for column in self.meta['columns']]
+
+    def column(self, name, start=None, end=None):
+        """
+        返回一列数据。数值列是映射文件的只读视图，不会复制；字符串列还原成字符串数组。
+        """
+        rows = self.rows_between(start, end)
+        values = self._columns[name][rows]
+        if name in self._categories:
+            return self._categories[name][values]
+        return values
+
+    def rows_between(self, start=None, end=None):
+        """
+        时间在[start, end]之间的行，返回slice
+        """
+        lo = 0 if start is None else int(np.searchsorted(self.index, self._datetime64(start), 'left'))
+        hi = len(self) if end is None else int(np.searchsorted(self.index, self._datetime64(end), 'right'))
+        return slice(lo, hi)
+
+    def _datetime64(self, value):
+        # 索引带时区时按UTC保存，不带时区的时间视为索引时区的本地时间
+        value = pd.Timestamp(value)
+        if self.tz is not None:
+            if value.tz is None:
+                value = value.tz_localize(self.tz)
+            value = value.tz_convert('UTC').tz_localize(None)
+        return np.datetime64(value, 'ns')
+
+    def to_frame(self, start=None, end=None, columns=None):
+        """
+        把[start, end]时间范围内的数据转换成DataFrame，格式和pd.read_csv读出来的相同（按时间升序）
+        """
+        rows = self.rows_between(start, end)
+        index = pd.DatetimeIndex(self.index[rows], name=self.meta['index_name'])
+        if self.tz is not None:
+            index = index.tz_localize('UTC').tz_convert(self.tz)
+        names = self.columns if columns is None else columns
+        return pd.DataFrame({name: self.column(name, start, end) for name in names}, index=index)
+
+
+def load(csv_path, start=None, end=None, columns=None, cache_dir=None):
+    return ColumnStore.open(csv_path, default_store_path(csv_path, cache_dir)).to_frame(start, end, columns)
+
+
+def main():
+    csv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BTCUSD_GEMINI.csv')
+
+    start = time.perf_counter()
+    pd.read_csv(csv_path, index_col=0, parse_dates=True, infer_datetime_format=True)
+    csv_seconds = time.perf_counter() - start
+
+    build_store(csv_path)
+    start = time.perf_counter()
+    data = ColumnStore.open(csv_path).to_frame()
+    store_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    window = ColumnStore.open(csv_path).to_frame('2019-01-01', '2019-01-31')
+    slice_seconds = time.perf_counter() - start
+
+    print('rows: {}'.format(len(data)))
+    print('pd.read_csv:        {:.1f} ms'.format(csv_seconds * 1000))
+    print('ColumnStore full:   {:.1f} ms'.format(store_seconds * 1000))
+    print('ColumnStore slice:  {:.1f} ms ({} rows)'.format(slice_seconds * 1000, len(window)))
+
+
+if __name__ == '__main__':
+    main()
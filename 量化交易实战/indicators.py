@@ -0,0 +1,383 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# _window_sums分块的最小长度，streaming.SMA按同样的分块增量计算
+SUM_BLOCK = 1024
+
+
+def _as_float_array(values):
+    return np.asarray(values, dtype=np.float64)
+
+
+def _window_sums(values, n, squares=False):
+    """
+    用累积和计算每个长度为n的窗口的和（以及平方和）。
+    直接对价格求累积和，累积和会越来越大，两个累积和相减时舍入误差也随之变大。
+    所以把序列分成长度不小于n的块，每个值先减去所在块的第一个值（基准值）再累加，
+    窗口和再加上基准值部分：窗口最多跨两个块，基准值部分可以直接算出来。
+    窗口中含有NaN时结果为NaN，和pandas rolling(n)的默认行为一致。
+    values可以是二维数组（时间 × 品种），沿第0维计算，所有品种一起算，不需要逐列循环。
+    :return:    (基准值, 相对基准值的窗口和, 相对基准值的窗口平方和或None)，
+                第0维长度都是len(values) - n + 1，第i个元素对应以第i + n - 1个值结尾的窗口，
+                基准值是窗口结尾所在块的基准值
+    """
+    length = len(values)
+    block = max(n, SUM_BLOCK)
+    # 把只有第0维的数组变形成可以和values广播的形状
+    column = (-1,) + (1,) * (values.ndim - 1)
+
+    missing = np.isnan(values)
+    has_missing = missing.any()
+    if has_missing:
+        # NaN所在的窗口最后都会被置为NaN，这里用前一个有效值填充，只是为了让基准值和偏差保持正常
+        filled = np.where(missing, 0, np.arange(length).reshape(column))
+        np.maximum.accumulate(filled, axis=0, out=filled)
+        values = np.take_along_axis(values, filled, axis=0)
+        values = np.where(np.isnan(values), 0.0, values)
+
+    reference = np.repeat(values[::block], block, axis=0)[:length]
+    deviations = values - reference
+    sums = np.zeros((length + 1,) + values.shape[1:])
+    np.cumsum(deviations, axis=0, out=sums[1:])
+    window_sum = sums[n:] - sums[:-n]
+    bases = reference[n - 1:]
+
+    window_square = None
+    if squares:
+        square_sums = np.zeros((length + 1,) + values.shape[1:])
+        np.cumsum(deviations * deviations, axis=0, out=square_sums[1:])
+        window_square = square_sums[n:] - square_sums[:-n]
+
+    # 跨块的窗口只有每个块开头的n-1个，第i个窗口有head = block_start - i个元素落在前一个块中，
+    # 把它们换算到结尾所在块的基准值上
+    block_starts = np.arange(block, length, block)
+    if len(block_starts) and n > 1:
+        head = np.arange(1, n)
+        crossing = (block_starts[:, None] - head).ravel()
+        head = np.tile(head, len(block_starts))
+        delta = np.repeat(reference[block_starts - 1] - reference[block_starts], n - 1, axis=0)
+        valid = crossing < length - n + 1
+        crossing, head, delta = crossing[valid], head[valid].reshape(column), delta[valid]
+
+        window_sum[crossing] += head * delta
+        if squares:
+            # (d + delta)^2 = d^2 + 2 * delta * d + delta^2，d是相对前一个块基准值的偏差
+            head_sum = sums[crossing + head.ravel()] - sums[crossing]
+            window_square[crossing] += 2 * delta * head_sum + head * delta * delta
+
+    if has_missing:
+        missing_count = np.zeros((length + 1,) + values.shape[1:], dtype=np.intp)
+        np.cumsum(missing, axis=0, out=missing_count[1:])
+        window_missing = missing_count[n:] - missing_count[:-n] > 0
+        window_sum[window_missing] = np.nan
+        if squares:
+            window_square[window_missing] = np.nan
+
+    return bases, window_sum, window_square
+
+
+def _fill_constant_windows(result, values, n, fill=None):
+    """
+    窗口内所有值都相同的位置直接取原值（fill为None时）或者fill，
+    避免累积和相减产生的微小误差让两条均线看起来交叉。
+    """
+    if n <= 1:
+        return
+    repeated = values[1:] == values[:-1]
+    # 大部分价格序列很少出现连续相等的值，不可能有长度为n的常数段时直接返回
+    if repeated.sum(axis=0).max() < n - 1:
+        return
+
+    if values.ndim == 1:
+        changed = np.flatnonzero(~repeated) + 1
+        run_starts = np.r_[0, changed]
+        run_ends = np.r_[changed, len(values)]
+        for i in np.flatnonzero(run_ends - run_starts >= n):
+            start, end = run_starts[i] + n - 1, run_ends[i]
+            result[start:end] = values[start:end] if fill is None else fill
+        return
+
+    # 二维时统计窗口内相邻值相等的次数，等于n-1说明整个窗口都相同
+    counts = np.zeros((len(values),) + values.shape[1:], dtype=np.intp)
+    np.cumsum(repeated, axis=0, out=counts[1:])
+    constant = np.zeros(values.shape, dtype=bool)
+    constant[n - 1:] = counts[n - 1:] - counts[:len(values) - n + 1] == n - 1
+    result[constant] = values[constant] if fill is None else fill
+
+
+def sma(values, n):
+    """
+    简单滑动平均，和 pd.Series(values).rolling(n).mean() 相同，前n-1个位置为NaN。
+    :param values:  array-like  价格序列，二维数组时每一列是一个品种
+    :param n:       int         窗口大小
+    :return:        np.ndarray
+    """
+    values = _as_float_array(values)
+    result = np.full(values.shape, np.nan)
+    if n <= 0 or n > len(values):
+        return result
+    if n == 1:
+        return values.copy()
+
+    bases, window_sum, _ = _window_sums(values, n)
+    result[n - 1:] = bases + window_sum / n
+
+    _fill_constant_windows(result, values, n)
+    return result
+
+
+def rolling_var(values, n, ddof=1):
+    """
+    滑动方差，和 pd.Series(values).rolling(n).var(ddof=ddof) 相同
+    """
+    values = _as_float_array(values)
+    result = np.full(values.shape, np.nan)
+    if n <= ddof or n > len(values):
+        return result
+
+    _, window_sum, window_square = _window_sums(values, n, squares=True)
+    result[n - 1:] = np.maximum((window_square - window_sum * window_sum / n) / (n - ddof), 0.0)
+
+    _fill_constant_windows(result, values, n, 0.0)
+    return result
+
+
+def rolling_std(values, n, ddof=1):
+    """
+    滑动标准差，和 pd.Series(values).rolling(n).std(ddof=ddof) 相同
+    """
+    return np.sqrt(rolling_var(values, n, ddof))
+
+
+def _rolling_extreme(values, n, reduce):
+    values = _as_float_array(values)
+    result = np.full(values.shape, np.nan)
+    if 0 < n <= len(values):
+        result[n - 1:] = reduce(np.lib.stride_tricks.sliding_window_view(values, n, axis=0), axis=-1)
+    return result
+
+
+def rolling_min(values, n):
+    """
+    滑动最小值，和 pd.Series(values).rolling(n).min() 相同
+    """
+    return _rolling_extreme(values, n, np.min)
+
+
+def rolling_max(values, n):
+    """
+    滑动最大值，和 pd.Series(values).rolling(n).max() 相同
+    """
+    return _rolling_extreme(values, n, np.max)
+
+
+def vwap(prices, volumes, n=None):
+    """
+    成交量加权平均价 sum(price * volume) / sum(volume)
+    :param n:   int     窗口大小，为None时从第一个值开始累计
+    """
+    prices = _as_float_array(prices)
+    volumes = _as_float_array(volumes)
+    turnover = np.zeros((len(prices) + 1,) + prices.shape[1:])
+    volume = np.zeros((len(prices) + 1,) + prices.shape[1:])
+    np.cumsum(prices * volumes, axis=0, out=turnover[1:])
+    np.cumsum(volumes, axis=0, out=volume[1:])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if n is None:
+            return turnover[1:] / volume[1:]
+        result = np.full(prices.shape, np.nan)
+        if 0 < n <= len(prices):
+            result[n - 1:] = (turnover[n:] - turnover[:-n]) / (volume[n:] - volume[:-n])
+        return result
+
+
+def ema(values, n):
+    """
+    指数滑动平均，alpha = 2 / (n + 1)，和 pd.Series(values).ewm(span=n, adjust=False).mean() 相同。
+    递推式 e[t] = (1 - alpha) * e[t-1] + alpha * x[t] 展开后是加权累积和，
+    权重(1 - alpha)^-t增长很快，所以分块计算，每块的权重不超过1e100。
+    开头的NaN保持为NaN；中间有NaN时（二维数组有任何NaN时）退回pandas实现。
+    """
+    values = _as_float_array(values)
+    result = np.full(values.shape, np.nan)
+    if values.ndim == 1:
+        valid = np.flatnonzero(~np.isnan(values))
+        if not len(valid):
+            return result
+        first = valid[0]
+        if len(valid) != len(values) - first:
+            return pd.Series(values).ewm(span=n, adjust=False).mean().values
+    else:
+        if np.isnan(values).any():
+            return pd.DataFrame(values).ewm(span=n, adjust=False).mean().values
+        first = 0
+    if first == len(values):
+        return result
+
+    alpha = 2.0 / (n + 1)
+    decay = 1.0 - alpha
+    if decay == 0.0:
+        result[first:] = values[first:]
+        return result
+
+    column = (-1,) + (1,) * (values.ndim - 1)
+    block = max(1, int(100 * np.log(10) / -np.log(decay)))
+    # 第一个值就是初始的e，等价于前一个e等于x[0]
+    previous = values[first]
+    for start in range(first, len(values), block):
+        x = values[start:start + block]
+        powers = (decay ** np.arange(len(x))).reshape(column)
+        result[start:start + len(x)] = powers * (decay * previous + alpha * np.cumsum(x / powers, axis=0))
+        previous = result[start + len(x) - 1]
+    return result
+
+
+def _function_name(func):
+    name = '{}.{}'.format(getattr(func, '__module__', ''), getattr(func, '__qualname__', repr(func)))
+    # lambda和局部函数的名字不能唯一确定函数，不写入磁盘缓存
+    if '<lambda>' in name or '<locals>' in name:
+        return None
+    return name
+
+
+class IndicatorRegistry(object):
+    """
+    指标缓存，键由 函数、数据指纹、参数 组成，同样的指标在多次回测之间只计算一次。
+    内存中按LRU淘汰，总大小不超过max_bytes；给定cache_dir时同时把结果保存成.npy文件，
+    不同进程、不同次运行之间也可以复用。
+    缓存的数组是只读的，多个策略共享同一份结果，原地修改会抛出ValueError，需要修改时先copy()。
+    """
+
+    def __init__(self, max_bytes=64 << 20, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self._cache = OrderedDict()
+        self._nbytes = 0
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+    def fingerprint(self, arg):
+        """
+        数组按内容计算摘要，相同内容的数组不论是否是同一个对象都得到相同的指纹；
+        其它参数带上类型，True、1和1.0相等并且哈希值相同，但是可能得到不同的指标，不能共用一个键。
+        自己持有数据的只读数组内容不会改变，按内存地址记住它的指纹，不用每次重新计算摘要；
+        视图即使是只读的，底层的数据也可能被别的数组修改，每次都重新计算。
+        """
+        if isinstance(arg, tuple):
+            return (tuple, tuple(self.fingerprint(item) for item in arg))
+        if not isinstance(arg, (np.ndarray, pd.Series)):
+            return (type(arg), arg)
+
+        arg = np.asarray(arg)
+        address = None
+        if not arg.flags.writeable and arg.base is None:
+            address = (arg.__array_interface__['data'][0], arg.shape, arg.strides, arg.dtype.str)
+            with self._lock:
+                known = self._fingerprints.get(address)
+            if known is not None:
+                return known[1]
+
+        contiguous = np.ascontiguousarray(arg)
+        digest = hashlib.blake2b(contiguous.view(np.uint8), digest_size=16).hexdigest()
+        fingerprint = ('array', arg.shape, arg.dtype.str, digest)
+        if address is not None:
+            with self._lock:
+                if len(self._fingerprints) >= 64:
+                    self._fingerprints.clear()
+                # 同时保存数组本身，保证这个地址在记录存在期间不会被别的数组复用
+                self._fingerprints[address] = (arg, fingerprint)
+        return fingerprint
+
+    def compute(self, func, *args):
+        """
+        返回func(*args)的结果，已经计算过时直接从缓存中取。
+        参数中有不能作为键的对象（比如list、DataFrame）时不使用缓存，直接计算。
+        使用缓存时返回的是共享的只读数组，调用方需要修改时先copy()。
+        """
+        fingerprints = tuple(self.fingerprint(arg) for arg in args)
+        key = (func,) + fingerprints
+        try:
+            hash(key)
+        except TypeError:
+            return np.asarray(func(*args))
+
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        path = self._disk_path(func, fingerprints)
+        if path is not None and os.path.exists(path):
+            value = np.load(path)
+            self.disk_hits += 1
+        else:
+            value = np.array(func(*args))
+            if path is not None:
+                # 先写临时文件再改名，其它进程不会读到写了一半的文件
+                tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+                with open(tmp_path, 'wb') as fout:
+                    np.save(fout, value)
+                os.replace(tmp_path, path)
+
+        value.setflags(write=False)
+        self._set(key, value)
+        return value
+
+    def _disk_path(self, func, fingerprints):
+        if self.cache_dir is None:
+            return None
+        name = _function_name(func)
+        if name is None:
+            return None
+        digest = hashlib.blake2b(repr((name,) + fingerprints).encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, digest + '.npy')
+
+    def _set(self, key, value):
+        with self._lock:
+            if key in self._cache or value.nbytes > self.max_bytes:
+                return
+            self._cache[key] = value
+            self._nbytes += value.nbytes
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._fingerprints.clear()
+            self._nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._cache),
+                'nbytes': self._nbytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'disk_hits': self.disk_hits,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Strategy.I默认使用的全局缓存
+DEFAULT_REGISTRY = IndicatorRegistry()
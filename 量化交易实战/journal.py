@@ -0,0 +1,355 @@
+import bisect
+import os
+import struct
+import time
+
+import numpy as np
+
+from utils import assert_msg
+from orderbook import OrderBook, snapshot_messages
+
+# 增量记录：时间戳(毫秒) 价格 剩余数量 方向(0买 1卖)，定长，可以直接映射成numpy数组
+EVENT_DTYPE = np.dtype([('ts', '<i8'), ('price', '<f8'), ('remaining', '<f8'), ('side', 'i1')])
+SIDES = {'bid': 0, 'ask': 1}
+
+# 检查点：时间戳 检查点之前的增量条数 买单档数 卖单档数，再接每一档的 价格、数量(float64)，买单在前
+_CHECKPOINT = struct.Struct('<qqII')
+
+
+def checkpoint_path(path):
+    return path + '.ckpt'
+
+
+def _scan_checkpoints(path):
+    """
+    读取检查点文件中每个检查点的位置，最后不完整的检查点（写到一半时进程退出）忽略
+    :return:    (list, int)     [(时间戳, 增量条数, 文件偏移, 买单档数, 卖单档数)]，以及有效部分的长度
+    """
+    checkpoints = []
+    if not os.path.exists(path):
+        return checkpoints, 0
+    with open(path, 'rb') as fin:
+        data = fin.read()
+    offset = 0
+    while offset + _CHECKPOINT.size <= len(data):
+        ts, events, num_bids, num_asks = _CHECKPOINT.unpack_from(data, offset)
+        end = offset + _CHECKPOINT.size + 16 * (num_bids + num_asks)
+        if end > len(data):
+            break
+        checkpoints.append((ts, events, offset, num_bids, num_asks))
+        offset = end
+    return checkpoints, offset
+
+
+def apply_events(prices, amounts, event_prices, event_amounts):
+    """
+    把一批增量合并进一侧的档位，同一个价格以最后一次更新为准（last-write-wins），数量为0的档位删除。
+    全部是数组运算：拼接之后按价格去重，取每个价格最后出现的位置。
+    :return:    (np.ndarray, np.ndarray)    合并之后的价格（升序）和数量
+    """
+    all_prices = np.concatenate([prices, event_prices])
+    all_amounts = np.concatenate([amounts, event_amounts])
+    if not len(all_prices):
+        return all_prices, all_amounts
+    # 反转之后每个价格第一次出现的位置，就是原序列中最后一次出现的位置
+    unique, first = np.unique(all_prices[::-1], return_index=True)
+    last_amounts = all_amounts[len(all_prices) - 1 - first]
+    keep = last_amounts != 0
+    return unique[keep], last_amounts[keep]
+
+
+class JournalWriter(object):
+    """
+    只追加的订单簿增量日志。每条行情消息中的原始增量（价格、剩余数量、方向）按定长记录追加到path，
+    每checkpoint_interval条增量在 path.ckpt 中写一次完整的订单簿，回放时从最近的检查点开始。
+    增量先攒在预先分配的数组中，满了以后一次写入。
+    """
+
+    def __init__(self, path, checkpoint_interval=100000, buffer_size=4096):
+        """
+        :param path:                str     增量日志文件，已经存在时接着写
+        :param checkpoint_interval: int     每多少条增量写一次检查点
+        :param buffer_size:         int     攒够多少条增量写一次文件
+        """
+        assert_msg(checkpoint_interval > 0 and buffer_size > 0, 'checkpoint_interval和buffer_size必须大于0')
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+
+        self._buffer = np.zeros(buffer_size, dtype=EVENT_DTYPE)
+        self._buffered = 0
+        # 写检查点需要完整的订单簿，这里只用dict保存，写检查点时才排序
+        self._books = ({}, {})
+        self._last_ts = None
+
+        # 接着已有的日志写：去掉进程退出时写了一半的记录，从日志中恢复订单簿
+        self._events = 0
+        self._last_checkpoint = 0
+        if os.path.exists(path):
+            self._events = os.path.getsize(path) // EVENT_DTYPE.itemsize
+            os.truncate(path, self._events * EVENT_DTYPE.itemsize)
+            checkpoints, valid = _scan_checkpoints(checkpoint_path(path))
+            if os.path.exists(checkpoint_path(path)):
+                os.truncate(checkpoint_path(path), valid)
+            # 检查点里记录的增量条数超过日志长度的（日志没写完就退出了）也不再使用
+            while checkpoints and checkpoints[-1][1] > self._events:
+                checkpoints.pop()
+                os.truncate(checkpoint_path(path), checkpoints[-1][2] if checkpoints else 0)
+            if checkpoints:
+                self._last_checkpoint = checkpoints[-1][1]
+            if self._events:
+                journal = Journal(path)
+                for side, (prices, amounts) in enumerate(journal.levels_at()):
+                    self._books[side].update(zip(prices.tolist(), amounts.tolist()))
+                self._last_ts = int(journal.events['ts'][-1])
+                journal.close()
+
+        self._file = open(path, 'ab')
+        self._checkpoint_file = open(checkpoint_path(path), 'ab')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def events(self):
+        return self._events + self._buffered
+
+    def append(self, ts, price, remaining, side):
+        """
+        追加一条增量
+        :param ts:          int     毫秒时间戳，不能比上一条早
+        :param price:       float   价格
+        :param remaining:   float   这个价格剩余的数量，0表示这一档被撤空
+        :param side:        str     'bid' / 'ask'，其它值忽略
+        """
+        if side not in SIDES:
+            # 和OrderBook.insert一样只给出警告，不影响同一条消息中的其它增量
+            print('WARNING: unknow direction {}'.format(side))
+            return
+        assert_msg(self._last_ts is None or ts >= self._last_ts, '增量的时间戳必须递增')
+        self._last_ts = ts
+        side = SIDES[side]
+        self._buffer[self._buffered] = (ts, price, remaining, side)
+        self._buffered += 1
+
+        book = self._books[side]
+        if remaining == 0:
+            book.pop(price, None)
+        else:
+            book[price] = remaining
+
+        if self._buffered == len(self._buffer):
+            self._flush_events()
+        if self.events - self._last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def append_message(self, ts, events):
+        """
+        追加一条交易所消息中的所有增量，events的格式和websocket消息中的相同
+        """
+        for event in events:
+            self.append(ts, float(event['price']), float(event['remaining']), event['side'])
+
+    def checkpoint(self):
+        """
+        把当前完整的订单簿写成一个检查点
+        """
+        self._flush_events()
+        bids = sorted(self._books[0].items(), reverse=True)
+        asks = sorted(self._books[1].items())
+        values = [value for level in bids for value in level] + [value for level in asks for value in level]
+        self._checkpoint_file.write(_CHECKPOINT.pack(self._last_ts or 0, self._events, len(bids), len(asks)) +
+                                    struct.pack('<{}d'.format(len(values)), *values))
+        self._checkpoint_file.flush()
+        self._last_checkpoint = self._events
+
+    def flush(self):
+        self._flush_events()
+
+    def close(self):
+        if self._file is not None:
+            self._flush_events()
+            self._file.close()
+            self._checkpoint_file.close()
+            self._file = None
+
+    def _flush_events(self):
+        if self._buffered:
+            self._buffer[:self._buffered].tofile(self._file)
+            self._file.flush()
+            self._events += self._buffered
+            self._buffered = 0
+
+
+class Journal(object):
+    """
+    读取JournalWriter写的日志。增量映射成只读的numpy数组，不读进内存；
+    恢复某个时刻的订单簿时，先找到这个时刻之前最近的检查点，再用数组运算合并之后的增量。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        size = os.path.getsize(path) // EVENT_DTYPE.itemsize
+        self.events = np.memmap(path, dtype=EVENT_DTYPE, mode='r', shape=(size,)) if size \
+            else np.zeros(0, dtype=EVENT_DTYPE)
+        # 时间戳单独复制成连续数组，二分查找时不用每次从结构化数组中取出这一列
+        self._ts = np.ascontiguousarray(self.events['ts'])
+        checkpoints, _ = _scan_checkpoints(checkpoint_path(path))
+        self._checkpoints = [checkpoint for checkpoint in checkpoints if checkpoint[1] <= size]
+        self._checkpoint_events = [checkpoint[1] for checkpoint in self._checkpoints]
+        self._checkpoint_file = open(checkpoint_path(path), 'rb') if self._checkpoints else None
+
+    def close(self):
+        if self._checkpoint_file is not None:
+            self._checkpoint_file.close()
+            self._checkpoint_file = None
+        self.events = self._ts = None
+
+    def __len__(self):
+        return len(self.events)
+
+    def _load_checkpoint(self, k):
+        _, events, offset, num_bids, num_asks = self._checkpoints[k]
+        self._checkpoint_file.seek(offset + _CHECKPOINT.size)
+        values = np.frombuffer(self._checkpoint_file.read(16 * (num_bids + num_asks)), dtype='<f8').reshape(-1, 2)
+        # 检查点中买单从高到低，内部统一用升序
+        bids, asks = values[:num_bids][::-1], values[num_bids:]
+        return events, [(bids[:, 0], bids[:, 1]), (asks[:, 0], asks[:, 1])]
+
+    def _replay(self, state, begin, end):
+        # 把第begin到end条增量合并进state，每一侧一次数组运算
+        events = self.events[begin:end]
+        sides = events['side']
+        return [apply_events(prices, amounts, events['price'][sides == side], events['remaining'][sides == side])
+                for side, (prices, amounts) in enumerate(state)]
+
+    def _position(self, ts):
+        # 时间戳不超过ts的增量条数
+        if ts is None:
+            return len(self.events)
+        return int(np.searchsorted(self._ts, ts, 'right'))
+
+    def levels_at(self, ts=None):
+        """
+        恢复时间戳为ts时（包括这一毫秒的所有增量）订单簿的全部档位
+        :param ts:  int     毫秒时间戳，None表示日志的结尾
+        :return:    list    [(买单价格, 数量), (卖单价格, 数量)]，价格都是升序
+        """
+        end = self._position(ts)
+        k = bisect.bisect_right(self._checkpoint_events, end) - 1
+        if k >= 0:
+            begin, state = self._load_checkpoint(k)
+        else:
+            empty = np.zeros(0)
+            begin, state = 0, [(empty, empty), (empty, empty)]
+        return self._replay(state, begin, end)
+
+    def book_at(self, ts=None, limit=20, window=OrderBook.WINDOW):
+        """
+        恢复时间戳为ts时的订单簿，limit和window的含义见OrderBook
+        :return:    OrderBook
+        """
+        (bid_prices, bid_amounts), asks = self.levels_at(ts)
+        return OrderBook.from_levels((bid_prices[::-1], bid_amounts[::-1]), asks, limit, window)
+
+    def replay(self, timestamps):
+        """
+        依次恢复一组递增时间戳上的订单簿档位，每一步只合并两个时间戳之间的增量
+        :return:    generator   每个时间戳一个 levels_at 格式的结果
+        """
+        timestamps = list(timestamps)
+        assert_msg(all(a <= b for a, b in zip(timestamps, timestamps[1:])), '时间戳必须递增')
+        if not timestamps:
+            return
+        state = self.levels_at(timestamps[0])
+        position = self._position(timestamps[0])
+        yield state
+        for ts in timestamps[1:]:
+            end = self._position(ts)
+            state = self._replay(state, position, end)
+            position = end
+            yield state
+
+
+def _random_events(num_events, levels=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    ts = 1600000000000 + np.cumsum(rng.integers(0, 3, num_events))
+    sides = rng.integers(0, 2, num_events)
+    offsets = rng.integers(1, levels // 2, num_events)
+    prices = np.round(np.where(sides == 0, 10000.0 - offsets * 0.01, 10000.0 + offsets * 0.01), 2)
+    remaining = np.where(rng.random(num_events) < 0.3, 0.0, rng.integers(1, 1000, num_events) / 100)
+    return ts, prices, remaining, np.where(sides == 0, 'bid', 'ask')
+
+
+def main():
+    import json
+    import shutil
+    import tempfile
+
+    directory = tempfile.mkdtemp()
+    try:
+        # 用BTCUSD.txt还原出的消息检查回放结果和逐条更新OrderBook一致
+        path = os.path.join(directory, 'BTCUSD.journal')
+        messages = [json.loads(message)['events'] for message in snapshot_messages('BTCUSD.txt')]
+        orderbook = OrderBook(limit=10, window=None)
+        expected = {}
+        with JournalWriter(path, checkpoint_interval=500) as writer:
+            for ts, events in enumerate(messages):
+                writer.append_message(ts, events)
+                for event in events:
+                    orderbook.insert(float(event['price']), float(event['remaining']), event['side'])
+                if ts % 97 == 0:
+                    expected[ts] = orderbook.get_copy_of_bids_and_asks()
+        journal = Journal(path)
+        for ts, snapshot in expected.items():
+            assert_msg(journal.book_at(ts, limit=10).get_copy_of_bids_and_asks() == snapshot,
+                       '时间戳{}的回放结果不一致'.format(ts))
+        print('BTCUSD.txt: {} events, {} checkpoints, replay matches'.format(len(journal), len(journal._checkpoints)))
+        journal.close()
+
+        # 随机生成的大量增量
+        path = os.path.join(directory, 'random.journal')
+        ts, prices, remaining, sides = _random_events(2000000)
+        start = time.perf_counter()
+        with JournalWriter(path) as writer:
+            for event in zip(ts.tolist(), prices.tolist(), remaining.tolist(), sides.tolist()):
+                writer.append(*event)
+        seconds = time.perf_counter() - start
+        print('write: {:.0f} events/s, {} bytes'.format(len(ts) / seconds, os.path.getsize(path)))
+
+        journal = Journal(path)
+        start = time.perf_counter()
+        bids, asks = journal.levels_at()
+        seconds = time.perf_counter() - start
+        print('full replay to the end: {:.3f}s, {} bid / {} ask levels'.format(seconds, len(bids[0]), len(asks[0])))
+
+        # 没有检查点时从头回放，衡量合并增量本身的速度
+        empty = np.zeros(0)
+        start = time.perf_counter()
+        journal._replay([(empty, empty), (empty, empty)], 0, len(journal))
+        seconds = time.perf_counter() - start
+        print('replay from scratch: {:.0f} events/s'.format(len(journal) / seconds))
+
+        grid = np.linspace(ts[0], ts[-1], 1000).astype(np.int64)
+        start = time.perf_counter()
+        for _ in journal.replay(grid):
+            pass
+        seconds = time.perf_counter() - start
+        print('replay on a grid of {} timestamps: {:.2f}s, {:.2f}ms per timestamp'.format(len(grid), seconds,
+                                                                                           1000 * seconds / len(grid)))
+
+        # 随机时刻的订单簿：每次从最近的检查点开始
+        start = time.perf_counter()
+        for t in np.random.default_rng(1).integers(ts[0], ts[-1], 1000):
+            journal.levels_at(t)
+        seconds = time.perf_counter() - start
+        print('random seek: {:.2f}ms per timestamp'.format(1000 * seconds / 1000))
+        journal.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+from utils import assert_msg, crossover_vector
+
+try:
+    import _kernels
+except ImportError:
+    # 没有安装时，使用extra_SWIG目录下 python setup.py build_ext --inplace 编译出来的模块
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'extra_SWIG'))
+    try:
+        import _kernels
+    except ImportError:
+        _kernels = None
+
+# C内核是否可用，不可用时使用下面的numpy/Python实现，结果相同
+HAS_C_KERNELS = _kernels is not None
+
+
+def _doubles(values):
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+
+def _signals(values):
+    # 内核只看信号的正负，整数信号截断到[-1, 1]就可以，已经是int8的不复制
+    values = np.asarray(values)
+    if values.dtype == np.int8:
+        return np.ascontiguousarray(values)
+    if np.issubdtype(values.dtype, np.integer):
+        return np.clip(values, -1, 1).astype(np.int8)
+    return np.sign(np.nan_to_num(values.astype(np.float64))).astype(np.int8)
+
+
+def cross_signal(series1, series2, use_c=True):
+    """
+    均线交叉信号：第i个元素为+1表示series1在第i-1个时刻刚好从下方穿过series2，-1表示从上方穿过，
+    和SmaCross.init中由两次crossover_vector得到的信号相同，可以直接传给Strategy.set_signal。
+    :param series1:     np.ndarray  快线
+    :param series2:     np.ndarray  慢线
+    :param use_c:       bool        False时强制使用numpy实现，用于对照
+    :return:            np.ndarray  int8信号数组
+    """
+    series1, series2 = _doubles(series1), _doubles(series2)
+    assert_msg(len(series1) == len(series2), '两个序列的长度必须相同')
+    if use_c and HAS_C_KERNELS:
+        out = np.empty(len(series1), dtype=np.int8)
+        # 和crossover_vector一样严格比较，不留相对误差
+        _kernels.cross_signal(series1, series2, 0.0, out)
+        return out
+    return (crossover_vector(series1, series2).astype(np.int8)
+            - crossover_vector(series2, series1).astype(np.int8))
+
+
+def position_signal(signal, use_c=True):
+    """
+    只做多的仓位状态机：空仓时的买入信号开仓，持仓时的卖出信号平仓，重复的信号忽略。
+    :param signal:  np.ndarray  原始信号，+1买入，-1卖出，0不操作
+    :return:        (np.ndarray, np.ndarray)    实际执行的int8信号，以及每个时刻执行之后的仓位（1持仓，0空仓）
+    """
+    signal = _signals(signal)
+    if use_c and HAS_C_KERNELS:
+        out = np.empty(len(signal), dtype=np.int8)
+        state = np.empty(len(signal), dtype=np.int8)
+        _kernels.position_signal(signal, out, state)
+        return out, state
+
+    # 每一段连续相同的非零信号只保留第一个，再去掉第一次买入之前的卖出，剩下的买卖严格交替
+    bars = np.flatnonzero(signal)
+    sides = signal[bars]
+    keep = np.r_[True, sides[1:] != sides[:-1]] if len(bars) else np.zeros(0, dtype=bool)
+    bars, sides = bars[keep], sides[keep]
+    if len(sides) and sides[0] < 0:
+        bars, sides = bars[1:], sides[1:]
+    out = np.zeros(len(signal), dtype=np.int8)
+    out[bars] = sides
+    state = np.cumsum(out, dtype=np.int8)
+    return out, state
+
+
+def trailing_stop(close, signal, stop, use_c=True):
+    """
+    带移动止损的仓位状态机：按position_signal开仓平仓，持仓期间上一个收盘价比开仓以来的最高收盘价
+    回落超过stop时平仓。每个时刻的状态依赖之前的最高价，没有C内核时只能逐个时刻循环。
+    :param close:   np.ndarray  收盘价
+    :param signal:  np.ndarray  原始信号
+    :param stop:    float       回落比例，比如0.05表示从最高价回落5%止损
+    :return:        np.ndarray  实际执行的int8信号
+    """
+    close, signal = _doubles(close), _signals(signal)
+    assert_msg(len(close) == len(signal), '收盘价和信号的长度必须相同')
+    assert_msg(0 < stop < 1, '止损比例必须在(0, 1)之间')
+    out = np.zeros(len(close), dtype=np.int8)
+    if use_c and HAS_C_KERNELS:
+        _kernels.trailing_stop(close, signal, stop, out)
+        return out
+
+    held = False
+    peak = 0.0
+    prices = close.tolist()
+    for i, s in enumerate(signal.tolist()):
+        if held:
+            stopped = False
+            if i > 0:
+                price = prices[i - 1]
+                if price > peak:
+                    peak = price
+                stopped = price <= peak * (1 - stop)
+            if stopped or s < 0:
+                out[i] = -1
+                held = False
+        elif s > 0:
+            out[i] = 1
+            held = True
+            peak = prices[i]
+    return out
+
+
+def main():
+    from indicators import sma
+
+    rng = np.random.default_rng(0)
+    close = 10000 * np.exp(np.cumsum(rng.normal(0, 0.001, 5000000)))
+    fast, slow = sma(close, 10), sma(close, 30)
+    signal = cross_signal(fast, slow)
+    print('C kernels: {}'.format('available' if HAS_C_KERNELS else 'not built, using fallback'))
+
+    for name, func, args in [('cross_signal', cross_signal, (fast, slow)),
+                             ('position_signal', lambda *a, **kw: position_signal(*a, **kw)[0], (signal,)),
+                             ('trailing_stop', trailing_stop, (close, signal, 0.02))]:
+        start = time.perf_counter()
+        fallback = func(*args, use_c=False)
+        fallback_seconds = time.perf_counter() - start
+        if not HAS_C_KERNELS:
+            print('{:<16} fallback {:.3f}s'.format(name, fallback_seconds))
+            continue
+
+        start = time.perf_counter()
+        result = func(*args)
+        c_seconds = time.perf_counter() - start
+        assert_msg(np.array_equal(result, fallback), '{}的C实现和fallback结果不一致'.format(name))
+        print('{:<16} C {:.3f}s, fallback {:.3f}s'.format(name, c_seconds, fallback_seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+import itertools
+import os
+import pickle
+import random
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from utils import assert_msg
+from indicators import IndicatorRegistry
+
+# 放进共享内存的行情列，都是float64，拼成一个二维数组
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# 工作进程里的全局状态，由_init_worker设置，同一个进程处理的所有参数组合共用
+_worker = {}
+
+
+def parameter_grid(param_ranges, constraint=None):
+    """
+    生成所有参数组合，跳过不满足约束的组合
+    :param param_ranges:    dict        参数名 -> 候选值列表
+    :param constraint:      callable    constraint(params) 返回False的组合被丢弃，比如 lambda p: p['fast'] < p['slow']
+    :return:                list        [{参数名: 值}, ...]
+    """
+    names = list(param_ranges)
+    combinations = []
+    for values in itertools.product(*(param_ranges[name] for name in names)):
+        params = dict(zip(names, values))
+        if constraint is None or constraint(params):
+            combinations.append(params)
+    return combinations
+
+
+def score_of(result, maximize):
+    # maximize可以是回测结果中的一项，也可以是一个函数
+    value = maximize(result) if callable(maximize) else result[maximize]
+    value = float(value)
+    return value if np.isfinite(value) else -np.inf
+
+
+def check_picklable(maximize, workers):
+    """
+    多进程时maximize要序列化后发给工作进程，lambda和局部函数不能序列化，
+    不提前检查的话会在进程池内部报出难以理解的错误
+    """
+    if workers > 1 and callable(maximize):
+        try:
+            pickle.dumps(maximize)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            assert_msg(False, 'workers大于1时maximize必须是模块级别定义的函数（不能是lambda或局部函数），'
+                              '或者使用workers=1：{!r}'.format(maximize))
+
+
+def _attach_data(shm_name, shape, index):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    values = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    # 工作进程只读取行情数据，设成只读，策略误写时直接报错
+    values.setflags(write=False)
+    # 一个float64二维数组构造的DataFrame只有一个数据块，不会复制共享内存里的数据
+    data = pd.DataFrame(values, index=index, columns=OHLCV_COLUMNS, copy=False)
+    return shm, data
+
+
+def _init_worker(shm_name, shape, index, backtest_type, strategy_type, broker_type, cash, commission, mode,
+                 cache_dir=None):
+    shm, data = _attach_data(shm_name, shape, index)
+    _worker.update(shm=shm, data=data, backtest_type=backtest_type, strategy_type=strategy_type,
+                   broker_type=broker_type, cash=cash, commission=commission, mode=mode,
+                   indicator_cache=IndicatorRegistry(cache_dir=cache_dir))
+
+
+@contextmanager
+def worker_pool(backtest, workers, mode='vectorized', cache_dir=None):
+    """
+    把backtest的行情数据复制到共享内存，启动进程池，每个工作进程在初始化时映射同一块内存。
+    workers为1时不启动进程，在当前进程里初始化同样的状态，得到None，配合pool_map使用。
+    :return:    ProcessPoolExecutor 或 None
+    """
+    data = backtest.data
+    values = np.ascontiguousarray(data[OHLCV_COLUMNS].values, dtype=np.float64)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+    try:
+        np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+        initargs = (shm.name, values.shape, data.index, type(backtest), backtest.strategy_type,
+                    backtest.broker_type, backtest.cash, backtest.commission, mode, cache_dir)
+
+        if workers == 1:
+            _init_worker(*initargs)
+            try:
+                yield None
+            finally:
+                _worker.pop('shm').close()
+                _worker.clear()
+        else:
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as executor:
+                yield executor
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def pool_map(executor, func, *iterables):
+    # executor为None时（worker_pool的workers为1）在当前进程中依次执行
+    if executor is None:
+        return list(map(func, *iterables))
+    return list(executor.map(func, *iterables))
+
+
+def worker_data():
+    """
+    工作进程中共享内存里的行情DataFrame
+    """
+    return _worker['data']
+
+
+def run_in_worker(data, params):
+    """
+    在工作进程中用data回测一组参数，使用这个进程共享的指标缓存
+    :return:    (Backtest, pd.Series)
+    """
+    backtest = _worker['backtest_type'](data, _worker['strategy_type'], _worker['broker_type'],
+                                        _worker['cash'], _worker['commission'],
+                                        indicator_cache=_worker['indicator_cache'])
+    return backtest, backtest.run(mode=_worker['mode'], **params)
+
+
+def _run_batch(batch, end=None, maximize='收益'):
+    """
+    在工作进程里依次回测一批参数组合。
+    同一个进程的指标缓存在组合之间共享，比如fast=10, slow=20和fast=10, slow=30只计算一次SMA(10)。
+    :param end: int     只使用前end行数据，用于剪枝时的快速预评估
+    :return:    list    [(组合序号, 得分, 回测结果dict)]
+    """
+    data = worker_data()
+    if end is not None:
+        data = data.iloc[:end]
+
+    results = []
+    for idx, params in batch:
+        _, result = run_in_worker(data, params)
+        results.append((idx, score_of(result, maximize), result.to_dict()))
+    return results
+
+
+def _batches(items, num_batches):
+    # 按顺序切成连续的批，相邻的组合更可能共用同样的指标
+    size = max(1, -(-len(items) // num_batches))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def optimize(backtest, param_ranges, maximize='收益', constraint=None, method='grid', max_tries=None,
+             prune=None, prune_window=0.5, workers=None, mode='vectorized', random_state=None, cache_dir=None):
+    """
+    参数优化：把参数组合分给进程池并行回测，按maximize从高到低返回结果表。
+    行情数据只复制一次到共享内存，所有工作进程直接映射同一块内存，不需要为每个组合序列化DataFrame。
+    :param backtest:        Backtest    提供数据、策略类型、交易所类型、初始资金和手续费
+    :param param_ranges:    dict        参数名 -> 候选值列表
+    :param maximize:        str         用于排序的回测结果字段，或者 callable(result) -> float，
+                                        workers大于1时必须是模块级别定义的函数
+    :param constraint:      callable    constraint(params) 返回False的组合不回测
+    :param method:          str         'grid'遍历所有组合；'random'从中随机抽取max_tries个
+    :param max_tries:       int         随机搜索的组合数量
+    :param prune:           float       剪枝比例。先只用前prune_window的数据回测所有组合，
+                                        丢掉得分最差的prune比例，剩下的再用完整数据回测
+    :param prune_window:    float       预评估使用的数据比例
+    :param workers:         int         进程数，默认为CPU数；为1时在当前进程中运行
+    :param mode:            str         Backtest.run的回测模式
+    :param cache_dir:       str         指标的磁盘缓存目录，所有工作进程以及下一次优化都可以复用已经算过的指标
+    :return:                pd.DataFrame 每行一个参数组合，包含参数、回测结果和得分，按得分降序
+    """
+    assert_msg(param_ranges, '至少需要一个参数范围')
+    for name in param_ranges:
+        assert_msg(hasattr(backtest.strategy_type, name), '策略{}没有参数{}'.format(backtest.strategy_type.__name__, name))
+    assert_msg(method in ('grid', 'random'), '未知的搜索方法：{}'.format(method))
+    assert_msg(prune is None or 0 <= prune < 1, 'prune必须在[0, 1)之间')
+
+    param_ranges = {name: list(values) for name, values in param_ranges.items()}
+    combinations = parameter_grid(param_ranges, constraint)
+    if method == 'random' and max_tries is not None and max_tries < len(combinations):
+        combinations = random.Random(random_state).sample(combinations, max_tries)
+    assert_msg(combinations, '没有满足约束的参数组合')
+    indexed = list(enumerate(combinations))
+
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, len(indexed))
+    check_picklable(maximize, workers)
+
+    with worker_pool(backtest, workers, mode, cache_dir) as executor:
+        scores = _evaluate(indexed, workers, executor, maximize, prune, prune_window, len(backtest.data))
+
+    rows = []
+    for idx, score, result in scores:
+        row = dict(combinations[idx])
+        row.update(result)
+        row['score'] = score
+        rows.append(row)
+    table = pd.DataFrame(rows, columns=list(param_ranges) + [column for column in rows[0]
+                                                             if column not in param_ranges])
+    return table.sort_values('score', ascending=False, kind='mergesort').reset_index(drop=True)
+
+
+def _evaluate(indexed, workers, executor, maximize, prune, prune_window, length):
+    def run_all(items, end=None):
+        batches = _batches(items, workers)
+        results = pool_map(executor, _run_batch, batches, [end] * len(batches), [maximize] * len(batches))
+        return [item for batch in results for item in batch]
+
+    if prune:
+        # Backtest.run从第warmup（100）个时刻开始交易，预评估至少要覆盖到这之后
+        end = min(length, max(200, int(length * prune_window)))
+        preliminary = sorted(run_all(indexed, end), key=lambda item: item[1], reverse=True)
+        keep = {idx for idx, _, _ in preliminary[:max(1, int(round(len(preliminary) * (1 - prune))))]}
+        indexed = [(idx, params) for idx, params in indexed if idx in keep]
+
+    return run_all(indexed)
@@ -0,0 +1,362 @@
+import copy
+import json
+import time
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from utils import assert_msg
+
+
+class _LevelsView(Sequence):
+    """
+    一侧前k档的只读视图，按从优到劣的顺序给出 (价格, 数量)。
+    不复制数据，读取的是订单簿当前的状态，订单簿更新后视图的内容也随之变化。
+    """
+
+    def __init__(self, levels, depth=None):
+        self._levels = levels
+        self._depth = depth
+
+    def __len__(self):
+        size = len(self._levels)
+        return size if self._depth is None else min(size, self._depth)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('price level out of range')
+        return self._levels.level(i)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class _LevelsDict(Mapping):
+    """
+    一侧所有档位的只读dict视图 {价格: 数量}，按从优到劣的顺序迭代，兼容原来OrderBook.bids/asks的读取方式。
+    """
+
+    def __init__(self, levels):
+        self._levels = levels
+
+    def __getitem__(self, price):
+        return self._levels.amount(price)
+
+    def __iter__(self):
+        for i in range(len(self._levels)):
+            yield self._levels.level(i)[0]
+
+    def __len__(self):
+        return len(self._levels)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class _PriceLevels(object):
+    """
+    订单簿的一侧。价格按从优到劣的顺序保存在有序list中，用bisect二分查找定位；数量保存在dict中。
+    买单价格从高到低，内部保存成相反数，这样两侧都是升序，最优价都在第0个位置。
+    更新已有价格档位的数量O(1)；新增、删除档位时二分查找定位是O(log n)，但list插入删除要移动后面的元素，是O(n)。
+    所以max_levels不为None时只保留最优的max_levels档，n有上界，移动的只是一小段连续内存。
+    """
+
+    def __init__(self, descending, max_levels=None):
+        self._sign = -1.0 if descending else 1.0
+        self._max_levels = max_levels
+        self._keys = []
+        self._amounts = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def update(self, price, amount):
+        key = self._sign * price
+        if amount == 0:
+            if self._amounts.pop(key, None) is not None:
+                del self._keys[bisect_left(self._keys, key)]
+        elif key in self._amounts:
+            self._amounts[key] = amount
+        else:
+            i = bisect_left(self._keys, key)
+            if self._max_levels is not None and i >= self._max_levels:
+                # 在保留的范围之外，不保存
+                return
+            self._keys.insert(i, key)
+            self._amounts[key] = amount
+            if self._max_levels is not None and len(self._keys) > self._max_levels:
+                del self._amounts[self._keys.pop()]
+
+    def level(self, i):
+        key = self._keys[i]
+        return self._sign * key, self._amounts[key]
+
+    def amount(self, price):
+        return self._amounts[self._sign * price]
+
+    def best(self):
+        return self.level(0) if self._keys else None
+
+    def truncate(self, size):
+        for key in self._keys[size:]:
+            del self._amounts[key]
+        del self._keys[size:]
+
+    def clear(self):
+        del self._keys[:]
+        self._amounts.clear()
+
+    def load(self, prices, amounts):
+        # prices已经按从优到劣排列，直接作为有序list，不需要逐个插入
+        self._keys = [self._sign * price for price in prices][:self._max_levels]
+        self._amounts = dict(zip(self._keys, amounts))
+
+
+class OrderBook(object):
+    """
+    增量维护的订单簿。每条行情消息只更新变化的档位，不需要重新排序；
+    买一卖一O(1)，前几档通过视图读取，不复制。
+    每侧保留最优的limit * window档：比limit多留一些，前limit档中的档位被撤掉时，后面的档位可以补上来；
+    更差的档位直接丢弃，档数不会无限增长。window为None时保留全部档位。
+    """
+
+    BID = 'bid'
+    ASKS = 'ask'
+
+    # 默认每侧保留limit的这么多倍档位
+    WINDOW = 5
+
+    def __init__(self, limit=20, window=WINDOW):
+        """
+        :param limit:   int     bids_sorted/asks_sorted以及快照中包含的档数，None表示全部
+        :param window:  int     每侧保留limit * window档，None表示保留全部档位
+        """
+        self.limit = limit
+        max_levels = None if limit is None or window is None else limit * window
+        self._bids = _PriceLevels(descending=True, max_levels=max_levels)
+        self._asks = _PriceLevels(descending=False, max_levels=max_levels)
+
+    @classmethod
+    def from_levels(cls, bids, asks, limit=20, window=WINDOW):
+        """
+        由完整的价格档位构造订单簿
+        :param bids:    (prices, amounts)   买单，价格从高到低
+        :param asks:    (prices, amounts)   卖单，价格从低到高
+        """
+        orderbook = cls(limit, window)
+        orderbook._bids.load(*(np.asarray(values, dtype=np.float64).tolist() for values in bids))
+        orderbook._asks.load(*(np.asarray(values, dtype=np.float64).tolist() for values in asks))
+        return orderbook
+
+    def insert(self, price, amount, direction):
+        """
+        更新一个价格档位，amount为0表示这个档位被撤空
+        """
+        if direction == self.BID:
+            self._bids.update(price, amount)
+        elif direction == self.ASKS:
+            self._asks.update(price, amount)
+        else:
+            print('WARNING: unknow direction {}'.format(direction))
+
+    def sort_and_truncate(self):
+        """
+        兼容原来的接口。档位一直是有序的，不需要排序，这里只把两侧截断到limit档
+        """
+        if self.limit is not None:
+            self._bids.truncate(self.limit)
+            self._asks.truncate(self.limit)
+
+    def clear(self):
+        self._bids.clear()
+        self._asks.clear()
+
+    @property
+    def bids(self):
+        """
+        保留的所有买单 {价格: 数量}，只读，按价格从高到低迭代
+        """
+        return _LevelsDict(self._bids)
+
+    @property
+    def asks(self):
+        """
+        保留的所有卖单 {价格: 数量}，只读，按价格从低到高迭代
+        """
+        return _LevelsDict(self._asks)
+
+    @property
+    def best_bid(self):
+        """
+        返回买一 (价格, 数量)，没有买单时为None
+        """
+        return self._bids.best()
+
+    @property
+    def best_ask(self):
+        """
+        返回卖一 (价格, 数量)，没有卖单时为None
+        """
+        return self._asks.best()
+
+    @property
+    def mid_price(self):
+        """
+        返回买一卖一的中间价，任何一侧为空时为None
+        """
+        if not len(self._bids) or not len(self._asks):
+            return None
+        return (self._bids.level(0)[0] + self._asks.level(0)[0]) / 2
+
+    def top_bids(self, depth=None):
+        """
+        返回价格最高的depth档买单的视图，depth为None时返回全部
+        """
+        return _LevelsView(self._bids, depth)
+
+    def top_asks(self, depth=None):
+        """
+        返回价格最低的depth档卖单的视图，depth为None时返回全部
+        """
+        return _LevelsView(self._asks, depth)
+
+    @property
+    def bids_sorted(self):
+        return self.top_bids(self.limit)
+
+    @property
+    def asks_sorted(self):
+        return self.top_asks(self.limit)
+
+    def get_copy_of_bids_and_asks(self):
+        """
+        返回前limit档的副本，格式和保存的快照相同：[[价格, 数量], ...]
+        """
+        return [list(level) for level in self.bids_sorted], [list(level) for level in self.asks_sorted]
+
+
+def snapshot_messages(file_path):
+    """
+    由Crawler保存的前10档快照还原出行情消息：比较相邻两个快照，新出现或数量变化的档位是一条更新，
+    消失的档位是一条数量为0的更新。格式和交易所推送的消息相同，用来回放测试订单簿。
+    """
+    messages = []
+    previous = {'bid': {}, 'ask': {}}
+    with open(file_path, 'r') as fin:
+        for line in fin:
+            snapshot = json.loads(line)
+            events = []
+            for side, key in (('bid', 'bids'), ('ask', 'asks')):
+                current = {price: amount for price, amount in snapshot[key]}
+                for price in previous[side]:
+                    if price not in current:
+                        events.append({'price': str(price), 'remaining': '0', 'side': side})
+                for price, amount in current.items():
+                    if previous[side].get(price) != amount:
+                        events.append({'price': str(price), 'remaining': str(amount), 'side': side})
+                previous[side] = current
+            messages.append(json.dumps({'events': events}))
+    return messages
+
+
+def random_messages(num_messages, levels=2000, seed=0):
+    """
+    生成深度为levels档左右的随机行情消息，每条消息更新几个档位，用于测试深度较大时的性能
+    """
+    rng = np.random.default_rng(seed)
+    messages = []
+    for _ in range(num_messages):
+        events = []
+        for _ in range(int(rng.integers(1, 6))):
+            side = 'bid' if rng.random() < 0.5 else 'ask'
+            offset = int(rng.integers(1, levels // 2))
+            price = 10000.0 - offset * 0.01 if side == 'bid' else 10000.0 + offset * 0.01
+            remaining = 0.0 if rng.random() < 0.3 else float(rng.integers(1, 1000)) / 100
+            events.append({'price': str(round(price, 2)), 'remaining': str(remaining), 'side': side})
+        messages.append(json.dumps({'events': events}))
+    return messages
+
+
+def _resort_replay(messages, limit, truncate=True):
+    """
+    原来的做法，作为对照：每条消息之后对两侧全部排序、截断、重建dict，深拷贝前limit档。
+    truncate为False时保留全部档位，只排序不截断
+    """
+    bids, asks = {}, {}
+    snapshot = None
+    for message in messages:
+        for event in json.loads(message)['events']:
+            book = bids if event['side'] == 'bid' else asks
+            price, amount = float(event['price']), float(event['remaining'])
+            if amount == 0:
+                book.pop(price, None)
+            else:
+                book[price] = amount
+        bids_sorted = sorted(bids.items(), reverse=True)
+        asks_sorted = sorted(asks.items())
+        if truncate:
+            bids_sorted, asks_sorted = bids_sorted[:limit], asks_sorted[:limit]
+            bids, asks = dict(bids_sorted), dict(asks_sorted)
+        snapshot = copy.deepcopy(bids_sorted[:limit]), copy.deepcopy(asks_sorted[:limit])
+    return snapshot
+
+
+def replay(messages, limit=10, window=OrderBook.WINDOW):
+    """
+    用OrderBook依次处理消息，每条消息之后读取前limit档，和Crawler的用法相同
+    :return:    (OrderBook, 最后的快照)
+    """
+    orderbook = OrderBook(limit=limit, window=window)
+    snapshot = None
+    for message in messages:
+        for event in json.loads(message)['events']:
+            orderbook.insert(float(event['price']), float(event['remaining']), event['side'])
+        snapshot = orderbook.get_copy_of_bids_and_asks()
+    return orderbook, snapshot
+
+
+def main():
+    messages = snapshot_messages('BTCUSD.txt')
+    events = sum(len(json.loads(message)['events']) for message in messages)
+
+    start = time.perf_counter()
+    expected = _resort_replay(messages, 10)
+    resort_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, snapshot = replay(messages, 10)
+    seconds = time.perf_counter() - start
+
+    assert_msg(snapshot == tuple([list(level) for level in side] for side in expected), '回放结果和原来的做法不一致')
+    print('BTCUSD.txt: {} messages, {} events'.format(len(messages), events))
+    print('re-sort per message: {:.0f} messages/s'.format(len(messages) / resort_seconds))
+    print('OrderBook:           {:.0f} messages/s'.format(len(messages) / seconds))
+
+    # 深度较大的订单簿：保留全部档位时，每条消息重新排序的开销随深度增长，增量维护不受影响
+    messages = random_messages(20000, levels=5000)
+    start = time.perf_counter()
+    expected = _resort_replay(messages, 10, truncate=False)
+    resort_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    orderbook, snapshot = replay(messages, 10, window=None)
+    seconds = time.perf_counter() - start
+
+    assert_msg(snapshot == tuple([list(level) for level in side] for side in expected), '回放结果和原来的做法不一致')
+    start = time.perf_counter()
+    trimmed, _ = replay(messages, 10)
+    trimmed_seconds = time.perf_counter() - start
+
+    print('random book with {} bid / {} ask levels'.format(len(orderbook.top_bids()), len(orderbook.top_asks())))
+    print('re-sort per message: {:.0f} messages/s'.format(len(messages) / resort_seconds))
+    print('OrderBook:           {:.0f} messages/s'.format(len(messages) / seconds))
+    print('OrderBook, {} levels: {:.0f} messages/s'.format(len(trimmed.top_bids()), len(messages) / trimmed_seconds))
+
+
+if __name__ == '__main__':
+    main()
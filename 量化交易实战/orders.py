@@ -0,0 +1,330 @@
+import math
+import time
+
+import numpy as np
+
+from utils import assert_msg
+
+# 订单类型
+MARKET = 0
+LIMIT = 1
+STOP = 2
+
+# 买卖方向
+BUY = 1
+SELL = -1
+
+# 订单状态。已经成交的数量以filled字段为准
+PENDING = 0
+FILLED = 1
+CANCELLED = 2
+EXPIRED = 3
+# 账户没有现金（买）或者持仓（卖），一点都没有成交
+REJECTED = 4
+# 部分成交之后，剩下的部分被撤销或者过期
+PARTIAL = 5
+
+ORDER_DTYPE = np.dtype([
+    ('tick', np.int64),         # 下单时刻
+    ('side', np.int8),          # BUY / SELL
+    ('type', np.int8),          # MARKET / LIMIT / STOP
+    ('size', np.float64),       # 下单数量，NaN表示全部资金（买）或者全部持仓（卖）
+    ('price', np.float64),      # 限价单的限价，止损单的触发价
+    ('expire', np.int64),       # 最后一个可以成交的时刻，-1表示一直有效
+    ('filled', np.float64),     # 已经成交的数量，订单结束时也可能小于size，见PARTIAL
+    ('status', np.int8),
+])
+
+TRADE_DTYPE = np.dtype([
+    ('order', np.int64),        # 订单编号
+    ('tick', np.int64),         # 成交时刻
+    ('side', np.int8),
+    ('size', np.float64),
+    ('price', np.float64),
+    ('commission', np.float64),
+])
+
+
+class _RecordBuffer(object):
+    """
+    预先分配的结构化数组，记录追加到末尾，容量不够时翻倍，均摊O(1)。
+    """
+
+    def __init__(self, dtype, capacity):
+        self._array = np.zeros(max(1, capacity), dtype=dtype)
+        self._size = 0
+
+    def append(self, record):
+        if self._size == len(self._array):
+            array = np.zeros(2 * len(self._array), dtype=self._array.dtype)
+            array[:self._size] = self._array
+            self._array = array
+        self._array[self._size] = record
+        self._size += 1
+        return self._size - 1
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def array(self):
+        return self._array
+
+    @property
+    def values(self):
+        # 只返回已经写入的部分，是视图，不复制
+        return self._array[:self._size]
+
+
+class OrderSimulator(object):
+    """
+    订单撮合模拟器。在第t个时刻提交的订单从第t+1个时刻开始撮合，用这个时刻的OHLC判断能否成交：
+    市价单按开盘价成交；
+    限价单在价格触及限价时成交，开盘就优于限价时按开盘价成交；
+    止损单在价格触及触发价时按触发价（跳空时按开盘价）成交，没有成交完的部分转为市价单。
+    市价单和止损单的成交价格按slippage向不利方向偏移。
+    participation不为None时，每个时刻所有订单合计最多成交这个时刻成交量的participation倍，没成交的部分留到下一个时刻。
+    买入数量受现金限制、卖出数量受持仓限制（不做空），超出的部分撤销；一点都成交不了的订单标记为REJECTED，
+    不会标记为FILLED。
+
+    订单和成交记录都保存在预先分配的结构化数组中；没有挂单的时刻match直接返回，
+    所以逐个时刻调用的开销只和挂单数量有关，适合多年的分钟数据。
+    """
+
+    def __init__(self, open, high, low, close, volume=None, commission=.0, slippage=.0, participation=None,
+                 capacity=1024):
+        """
+        :param open:            np.ndarray  开盘价
+        :param high:            np.ndarray  最高价
+        :param low:             np.ndarray  最低价
+        :param close:           np.ndarray  收盘价
+        :param volume:          np.ndarray  成交量，participation不为None时使用
+        :param commission:      float       手续费率
+        :param slippage:        float       滑点比例，如0.0005表示成交价格差万分之五
+        :param participation:   float       每个时刻最多成交这个时刻成交量的比例，None表示不限制
+        :param capacity:        int         订单和成交记录的初始容量
+        """
+        assert_msg(0 <= slippage < 1, '滑点比例必须在[0, 1)之间')
+        assert_msg(participation is None or participation > 0, 'participation必须大于0')
+        assert_msg(participation is None or volume is not None, '按成交量限制成交时需要volume')
+
+        self._open = np.asarray(open, dtype=np.float64)
+        self._high = np.asarray(high, dtype=np.float64)
+        self._low = np.asarray(low, dtype=np.float64)
+        self._close = np.asarray(close, dtype=np.float64)
+        self._volume = None if volume is None else np.asarray(volume, dtype=np.float64)
+        assert_msg(len(self._open) == len(self._high) == len(self._low) == len(self._close),
+                   'OHLC的长度必须相同')
+
+        self.commission = commission
+        self.slippage = slippage
+        self.participation = participation
+
+        self._orders = _RecordBuffer(ORDER_DTYPE, capacity)
+        self._trades = _RecordBuffer(TRADE_DTYPE, capacity)
+        # 挂单队列，按提交顺序撮合。撮合时频繁读写的状态放在列表里：
+        # [订单编号, 下单时刻, 方向, 类型, 剩余数量, 价格, 过期时刻]
+        self._pending = []
+
+    def __len__(self):
+        return len(self._close)
+
+    @property
+    def orders(self):
+        return self._orders.values
+
+    @property
+    def trades(self):
+        return self._trades.values
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def submit(self, tick, side, size=None, type=MARKET, price=None, valid=None):
+        """
+        提交订单
+        :param tick:    int     下单时刻，订单从tick+1开始撮合
+        :param side:    int     BUY / SELL
+        :param size:    float   数量，None表示全部资金（买）或者全部持仓（卖），在第一次成交时按成交价格确定
+        :param type:    int     MARKET / LIMIT / STOP
+        :param price:   float   限价单的限价，止损单的触发价
+        :param valid:   int     有效的时刻数，None表示一直有效
+        :return:        int     订单编号
+        """
+        assert_msg(side in (BUY, SELL), '未知的买卖方向：{}'.format(side))
+        assert_msg(type in (MARKET, LIMIT, STOP), '未知的订单类型：{}'.format(type))
+        assert_msg(type == MARKET or (price is not None and price > 0), '限价单和止损单需要大于0的价格')
+        assert_msg(size is None or size > 0, '订单数量必须大于0')
+        assert_msg(valid is None or valid > 0, '有效时刻数必须大于0')
+
+        size = math.nan if size is None else float(size)
+        price = math.nan if price is None else float(price)
+        expire = -1 if valid is None else tick + valid
+        order_id = self._orders.append((tick, side, type, size, price, expire, 0.0, PENDING))
+        self._pending.append([order_id, tick, side, type, size, price, expire])
+        return order_id
+
+    def cancel(self, order_id):
+        """
+        撤销还没有成交完的订单
+        :return:    bool    是否撤销成功
+        """
+        for k, order in enumerate(self._pending):
+            if order[0] == order_id:
+                del self._pending[k]
+                self._finish(order_id, CANCELLED)
+                return True
+        return False
+
+    def _finish(self, order_id, status):
+        # 没有成交完就结束的订单，已经部分成交的记为PARTIAL
+        order = self._orders.array[order_id]
+        order['status'] = PARTIAL if order['filled'] > 0 else status
+
+    def match(self, tick, cash, position):
+        """
+        用第tick个时刻的行情撮合所有挂单
+        :return:    (float, float)  撮合之后的现金和持仓
+        """
+        if not self._pending:
+            return cash, position
+
+        bar_open = float(self._open[tick])
+        bar_high = float(self._high[tick])
+        bar_low = float(self._low[tick])
+        liquidity = math.inf
+        if self.participation is not None:
+            volume = float(self._volume[tick])
+            if volume == volume:
+                liquidity = self.participation * volume
+
+        orders = self._orders.array
+        commission = self.commission
+        pending = []
+        for order in self._pending:
+            order_id, created, side, kind, remaining, price, expire = order
+            if created >= tick:
+                pending.append(order)
+                continue
+            if 0 <= expire < tick:
+                self._finish(order_id, EXPIRED)
+                continue
+
+            # 按这个时刻的OHLC确定能否成交以及成交价格
+            if kind == MARKET:
+                fill_price = bar_open
+            elif kind == LIMIT:
+                if (bar_low > price) if side == BUY else (bar_high < price):
+                    pending.append(order)
+                    continue
+                fill_price = min(bar_open, price) if side == BUY else max(bar_open, price)
+            else:
+                if (bar_high < price) if side == BUY else (bar_low > price):
+                    pending.append(order)
+                    continue
+                fill_price = max(bar_open, price) if side == BUY else min(bar_open, price)
+                # 止损单触发以后，没成交完的部分按市价单处理
+                order[3] = MARKET
+            if kind != LIMIT:
+                fill_price *= 1 + side * self.slippage
+
+            # 账户最多能成交的数量
+            if side == BUY:
+                available = cash / (fill_price * (1 + commission))
+            else:
+                available = position
+            if not available > 0:
+                # 没有现金或者持仓，不能当作成交了0个的FILLED订单
+                self._finish(order_id, REJECTED)
+                continue
+            if remaining != remaining:
+                remaining = available
+
+            quantity = min(remaining, liquidity, available)
+            if quantity > 0:
+                value = quantity * fill_price
+                fee = value * commission
+                if side == BUY:
+                    # 数量是按现金算出来的，只可能留下浮点误差级别的负数
+                    cash = max(cash - value - fee, 0.0)
+                    position += quantity
+                else:
+                    cash += value - fee
+                    position -= quantity
+                    if quantity == available:
+                        position = 0.0
+                liquidity -= quantity
+                remaining -= quantity
+                orders[order_id]['filled'] += quantity
+                self._trades.append((order_id, tick, side, quantity, fill_price, fee))
+
+            if remaining <= 1e-12 * max(quantity, 1.0):
+                orders[order_id]['status'] = FILLED
+            elif available < min(remaining + quantity, liquidity + quantity):
+                # 现金或者持仓不够，剩下的部分撤销
+                self._finish(order_id, CANCELLED)
+            else:
+                order[4] = remaining
+                pending.append(order)
+
+        self._pending = pending
+        return cash, position
+
+
+def random_bars(num_bars, seed=0):
+    """
+    生成随机游走的分钟OHLCV数据，用于性能测试
+    """
+    rng = np.random.default_rng(seed)
+    close = 10000 * np.exp(np.cumsum(rng.normal(0, 0.001, num_bars)))
+    open = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 0.0005, num_bars)) * close
+    high = np.maximum(open, close) + spread
+    low = np.minimum(open, close) - spread
+    volume = rng.exponential(5.0, num_bars)
+    return open, high, low, close, volume
+
+
+def main():
+    # 三年的分钟数据
+    num_bars = 3 * 365 * 24 * 60
+    open, high, low, close, volume = random_bars(num_bars)
+    simulator = OrderSimulator(open, high, low, close, volume, commission=0.001, slippage=0.0005,
+                               participation=0.1, capacity=num_bars // 10)
+
+    # 平均每100个时刻下一个单，市价单、限价单、止损单各占三分之一
+    rng = np.random.default_rng(1)
+    order_ticks = np.zeros(num_bars, dtype=bool)
+    order_ticks[rng.choice(num_bars, num_bars // 100, replace=False)] = True
+    kinds = rng.integers(0, 3, num_bars)
+    offsets = rng.uniform(0.001, 0.005, num_bars)
+
+    cash, position = 1000000.0, 0.0
+    start = time.perf_counter()
+    for tick in range(num_bars):
+        cash, position = simulator.match(tick, cash, position)
+        if order_ticks[tick]:
+            side = BUY if position == 0 else SELL
+            kind = int(kinds[tick])
+            price = None
+            if kind == LIMIT:
+                price = close[tick] * (1 - side * offsets[tick])
+            elif kind == STOP:
+                price = close[tick] * (1 + side * offsets[tick])
+            simulator.submit(tick, side, 1.0, kind, price, valid=60)
+    seconds = time.perf_counter() - start
+
+    trades = simulator.trades
+    print('bars: {}, orders: {}, trades: {}'.format(num_bars, len(simulator.orders), len(trades)))
+    print('status: filled {}, cancelled {}, expired {}, rejected {}, partial {}, pending {}'.format(
+        *(int((simulator.orders['status'] == status).sum())
+          for status in (FILLED, CANCELLED, EXPIRED, REJECTED, PARTIAL)),
+        simulator.pending))
+    print('final cash {:.2f}, position {:.4f}, commission {:.2f}'.format(cash, position, trades['commission'].sum()))
+    print('{:.2f}s, {:.0f} bars/s, {:.0f} orders/s'.format(
+        seconds, num_bars / seconds, len(simulator.orders) / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+import abc
+import time
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from utils import assert_msg
+from indicators import DEFAULT_REGISTRY, sma
+
+
+class PanelData(object):
+    """
+    多个品种的行情，按列存储：每个字段是一个 时间 × 品种 的二维数组，
+    同一时刻所有品种的价格在内存中相邻，按时间逐行处理时不需要对品种循环。
+    """
+
+    FIELDS = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+    def __init__(self, index, symbols, close, open=None, high=None, low=None, volume=None):
+        self.index = pd.Index(index)
+        self.symbols = list(symbols)
+        self.Close = np.ascontiguousarray(close, dtype=np.float64)
+        assert_msg(self.Close.shape == (len(self.index), len(self.symbols)), 'Close的形状必须是 时间 × 品种')
+        self.Open, self.High, self.Low, self.Volume = [
+            None if field is None else np.ascontiguousarray(field, dtype=np.float64)
+            for field in (open, high, low, volume)]
+
+    @classmethod
+    def from_frames(cls, frames):
+        """
+        由每个品种一个的OHLCV DataFrame构造，时间取所有品种的并集。
+        某个品种在某个时刻没有数据时沿用上一个价格，上市之前为NaN，成交量为0。
+        :param frames:  dict    品种 -> pd.DataFrame
+        """
+        symbols = list(frames)
+        index = frames[symbols[0]].index
+        for symbol in symbols[1:]:
+            index = index.union(frames[symbol].index)
+        index = index.sort_values()
+
+        fields = {}
+        for field in cls.FIELDS:
+            if not all(field in frames[symbol] for symbol in symbols):
+                continue
+            columns = pd.DataFrame({symbol: frames[symbol][field] for symbol in symbols}).reindex(index)
+            fields[field] = columns.fillna(0.0).values if field == 'Volume' else columns.ffill().values
+        assert_msg('Close' in fields, '每个品种都需要Close列')
+        return cls(index, symbols, fields['Close'], fields.get('Open'), fields.get('High'),
+                   fields.get('Low'), fields.get('Volume'))
+
+    @classmethod
+    def from_close(cls, close):
+        """
+        由收盘价DataFrame构造，每一列是一个品种
+        """
+        close = close.sort_index().ffill()
+        return cls(close.index, close.columns, close.values)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def shape(self):
+        return self.Close.shape
+
+
+class PortfolioStrategy(metaclass=abc.ABCMeta):
+    """
+    多品种策略。和Strategy不同，不是逐个时刻调用next买卖，而是一次给出每个时刻每个品种的目标权重，
+    由PortfolioBacktest按权重调仓。权重是占当前总市值的比例，可以是小数（部分仓位），
+    每行的和不超过1，剩下的部分保留为现金。NaN表示这个品种在这个时刻不调仓。
+    """
+
+    def __init__(self, data, indicator_cache=None):
+        self._data = data  # type: PanelData
+        self._indicator_cache = DEFAULT_REGISTRY if indicator_cache is None else indicator_cache
+
+    def I(self, func: Callable, *args) -> np.ndarray:
+        """
+        计算指标，所有品种一起计算，结果是 时间 × 品种 的二维数组。
+        和Strategy.I一样，返回的是缓存中共享的只读数组
+        """
+        value = self._indicator_cache.compute(func, *args)
+        assert_msg(value.shape[0] == len(self._data), '指示器长度必须和data长度相同')
+        return value
+
+    @property
+    def data(self):
+        return self._data
+
+    @abc.abstractmethod
+    def init(self):
+        """
+        初始化策略，计算指标
+        """
+        pass
+
+    @abc.abstractmethod
+    def weights(self):
+        """
+        :return:    np.ndarray  时间 × 品种 的目标权重
+        """
+        pass
+
+
+class PortfolioSmaCross(PortfolioStrategy):
+    """
+    多品种的均线策略：快线在慢线之上的品种等权持有，其余品种空仓
+    """
+
+    fast = 10
+    slow = 20
+
+    def init(self):
+        self.sma1 = self.I(sma, self.data.Close, self.fast)
+        self.sma2 = self.I(sma, self.data.Close, self.slow)
+
+    def weights(self):
+        # 和SmaCross一样只使用上一个时刻的均线，避免用到当前时刻的收盘价
+        held = np.zeros(self.data.shape, dtype=bool)
+        with np.errstate(invalid='ignore'):
+            held[1:] = self.sma1[:-1] > self.sma2[:-1]
+        count = held.sum(axis=1, keepdims=True)
+        return held / np.maximum(count, 1)
+
+
+def simulate_weights(close, weights, cash, commission, start=0, tolerance=0.0):
+    """
+    按目标权重调仓的组合回测。只在权重发生变化的时刻调仓，每次调仓是对所有品种的向量运算；
+    两次调仓之间持仓不变，市值曲线用矩阵乘法一次算出。
+    调仓时先卖后买，买入的金额包含手续费；现金不够时按比例缩小所有买单，现金不会为负。
+    :param close:       np.ndarray  时间 × 品种 的价格，NaN表示这个时刻不能交易，持仓按最近一个有效价格估值
+    :param weights:     np.ndarray  时间 × 品种 的目标权重
+    :param cash:        float       初始资金
+    :param commission:  float       手续费率
+    :param start:       int         开始调仓的位置
+    :param tolerance:   float       调仓金额不超过这个品种目标市值（或当前市值）的这个比例时不交易，
+                                    避免价格波动引起的频繁小额调仓
+    :return:            dict        equity市值曲线，cash现金曲线，positions最终持仓，rebalances调仓时刻，
+                                    trades成交笔数，turnover成交金额
+    """
+    close = np.asarray(close, dtype=np.float64)
+    weights = np.array(weights, dtype=np.float64)
+    assert_msg(weights.shape == close.shape, 'weights的形状必须和close相同')
+    length, num_assets = close.shape
+
+    tradable = ~np.isnan(close)
+    # 估值用最近一个有效价格，暂停交易（NaN）期间持仓按停牌前的价格计算，第一个有效价格之前为0
+    last_valid = np.where(tradable, np.arange(length)[:, None], 0)
+    np.maximum.accumulate(last_valid, axis=0, out=last_valid)
+    prices = np.take_along_axis(close, last_valid, axis=0)
+    prices[np.isnan(prices)] = 0.0
+    weights[:start] = np.nan
+    # 不能交易的品种目标权重为0
+    weights[~tradable & ~np.isnan(weights)] = 0.0
+    with np.errstate(invalid='ignore'):
+        assert_msg(not (weights < 0).any(), '目标权重不能为负')
+        assert_msg(not (np.nansum(weights, axis=1) > 1 + 1e-9).any(), '每个时刻的目标权重之和不能超过1')
+
+    # 整行都是NaN或者和上一行完全相同时不调仓
+    has_target = (~np.isnan(weights)).any(axis=1)
+    same = np.zeros(length, dtype=bool)
+    same[1:] = ((weights[1:] == weights[:-1]) | (np.isnan(weights[1:]) & np.isnan(weights[:-1]))).all(axis=1)
+    rebalances = np.flatnonzero(has_target & ~same)
+
+    initial_cash = cash
+    positions = np.zeros(num_assets)
+    event_cash = np.empty(len(rebalances))
+    event_positions = np.empty((len(rebalances), num_assets))
+    trades = 0
+    turnover = 0.0
+    for k, t in enumerate(rebalances):
+        price = prices[t]
+        target = weights[t]
+        value = positions * price
+        equity = cash + value.sum()
+
+        # 目标市值减当前市值，NaN的品种保持不变
+        target_value = np.where(np.isnan(target), value, target * equity)
+        diff = target_value - value
+        diff[~tradable[t] | (np.abs(diff) <= tolerance * np.maximum(target_value, value))] = 0.0
+
+        sells = diff < 0
+        if sells.any():
+            sell_value = -diff[sells]
+            positions[sells] -= sell_value / price[sells]
+            cash += sell_value.sum() * (1 - commission)
+            turnover += sell_value.sum()
+            trades += int(sells.sum())
+
+        buys = diff > 0
+        if buys.any():
+            buy_value = diff[buys]
+            total = buy_value.sum()
+            if total > cash:
+                buy_value *= max(cash, 0.0) / total
+                total = buy_value.sum()
+            positions[buys] += buy_value / (price[buys] * (1 + commission))
+            cash -= total
+            turnover += total
+            trades += int(buys.sum())
+
+        # 卖光的品种去掉浮点误差留下的零头，不能交易的品种保持原来的持仓
+        positions[tradable[t] & (np.abs(positions * price) < 1e-9)] = 0.0
+        event_cash[k] = cash
+        event_positions[k] = positions
+
+    # 两次调仓之间持仓不变，每一段的市值 = 现金 + 价格矩阵 × 持仓向量
+    cash_curve = np.full(length, float(initial_cash))
+    equity = np.full(length, float(initial_cash))
+    boundaries = np.r_[rebalances, length]
+    for k in range(len(rebalances)):
+        segment = slice(boundaries[k], boundaries[k + 1])
+        cash_curve[segment] = event_cash[k]
+        equity[segment] = event_cash[k] + prices[segment] @ event_positions[k]
+
+    return {
+        'equity': equity,
+        'cash': cash_curve,
+        'positions': positions,
+        'rebalances': rebalances,
+        'trades': trades,
+        'turnover': turnover,
+    }
+
+
+class PortfolioBacktest:
+    """
+    多品种组合回测，和Backtest的用法相同：
+    PortfolioBacktest(panel, PortfolioSmaCross, 10000.0, 0.003).run(fast=5, slow=30)
+    """
+
+    def __init__(self, data, strategy_type, cash=10000.0, commission=.0, indicator_cache=None, tolerance=0.0):
+        """
+        :param data:            PanelData   多品种行情
+        :param strategy_type:   type(PortfolioStrategy)
+        :param cash:            float       初始资金
+        :param commission:      float       手续费率
+        :param tolerance:       float       调仓金额占这个品种市值的比例不超过这个值时不交易
+        """
+        assert_msg(isinstance(data, PanelData), 'data不是PanelData类型')
+        assert_msg(issubclass(strategy_type, PortfolioStrategy), 'strategy_type不是一个PortfolioStrategy类型')
+        assert_msg(0 < cash, "初始现金数量大于0，输入的现金数量：{}".format(cash))
+        assert_msg(0 <= commission <= 0.05, "合理的手续费率一般不会超过5%，输入的费率：{}".format(commission))
+
+        self._data = data
+        self._cash = cash
+        self._commission = commission
+        self._tolerance = tolerance
+        self._strategy = strategy_type(data, indicator_cache)
+        self._results = None
+        self.equity = None
+        self.positions = None
+
+    def run(self, start=0, **params):
+        """
+        :param start:   int     开始调仓的位置
+        :param params:  策略参数，覆盖策略类上的默认值
+        :return:        pd.Series
+        """
+        strategy = self._strategy
+        for name, value in params.items():
+            assert_msg(hasattr(strategy, name), '策略{}没有参数{}'.format(type(strategy).__name__, name))
+            setattr(strategy, name, value)
+
+        strategy.init()
+        result = simulate_weights(self._data.Close, strategy.weights(), self._cash, self._commission, start,
+                                  self._tolerance)
+
+        self.equity = pd.Series(result['equity'], index=self._data.index)
+        self.positions = pd.Series(result['positions'], index=self._data.symbols)
+        self._results = pd.Series({
+            '初始市值': self._cash,
+            '结束市值': result['equity'][-1],
+            '收益': result['equity'][-1] - self._cash,
+            '调仓次数': len(result['rebalances']),
+            '成交笔数': result['trades'],
+            '成交金额': result['turnover'],
+        })
+        return self._results
+
+
+def random_panel(num_bars, num_assets, seed=0):
+    """
+    生成随机游走的多品种行情，用于测试和性能对比
+    """
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0002, 0.02, size=(num_bars, num_assets))
+    close = 100 * np.exp(np.cumsum(returns, axis=0))
+    index = pd.date_range('2015-01-01', periods=num_bars, freq='h')
+    return PanelData(index, ['S{}'.format(i) for i in range(num_assets)], close)
+
+
+def main():
+    panel = random_panel(10000, 500)
+    start = time.perf_counter()
+    ret = PortfolioBacktest(panel, PortfolioSmaCross, 1000000.0, 0.001, tolerance=0.05).run()
+    print(ret)
+    print('{} bars x {} assets: {:.2f}s'.format(len(panel), len(panel.symbols), time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+import json
+import os
+import queue
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+from utils import assert_msg
+
+# 二进制格式：文件开头4个字节的标识，之后每条记录是
+# 时间戳(int64毫秒) 买单档数(uint16) 卖单档数(uint16)，再接每一档的 价格、数量(float64)，买单在前
+BINARY_MAGIC = b'OBS1'
+_HEADER = struct.Struct('<qHH')
+
+# 通知写线程退出的标记
+_CLOSE = object()
+
+
+def encode_json(ts, bids, asks):
+    return (json.dumps({'bids': bids, 'asks': asks, 'ts': ts}) + '\n').encode()
+
+
+def encode_binary(ts, bids, asks):
+    values = [value for level in bids for value in level] + [value for level in asks for value in level]
+    return _HEADER.pack(ts, len(bids), len(asks)) + struct.pack('<{}d'.format(len(values)), *values)
+
+
+class SnapshotSink(object):
+    """
+    订单簿快照的异步写入。write只把快照放进有界队列，马上返回；后台线程攒够batch_size条
+    或者等了flush_interval秒之后，一次编码、写入并flush（group commit），文件句柄一直保持打开。
+    队列满时（磁盘跟不上）丢弃新的快照并计数，不会阻塞接收行情的线程。
+    rotate_bytes不为None时，文件超过这个大小后改名为 path.1、path.2 ...，再写新的文件。
+    """
+
+    def __init__(self, path, format='json', batch_size=256, flush_interval=1.0, queue_size=10000,
+                 rotate_bytes=None):
+        """
+        :param path:            str     输出文件，已经存在时追加
+        :param format:          str     'json'每行一个JSON，和原来的快照文件相同；'binary'定长字段的二进制记录
+        :param batch_size:      int     攒够这么多条写一次
+        :param flush_interval:  float   最多等这么多秒写一次
+        :param queue_size:      int     队列长度
+        :param rotate_bytes:    int     单个文件的最大字节数，None表示不切分
+        """
+        assert_msg(format in ('json', 'binary'), '未知的快照格式：{}'.format(format))
+        assert_msg(batch_size > 0 and flush_interval > 0, 'batch_size和flush_interval必须大于0')
+
+        self.path = path
+        self.format = format
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.dropped = 0
+        self.written = 0
+
+        self._encode = encode_json if format == 'json' else encode_binary
+        self._queue = queue.Queue(queue_size)
+        self._error = None
+        self._file = None
+        self._open()
+
+        self._thread = threading.Thread(target=self._run, name='SnapshotSink', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, ts, bids, asks):
+        """
+        提交一个快照。bids和asks会在后台线程中编码，调用方传入之后不能再修改（比如传get_copy_of_bids_and_asks的结果）
+        :param ts:      int     毫秒时间戳
+        :param bids:    list    [[价格, 数量], ...]
+        :param asks:    list    [[价格, 数量], ...]
+        :return:        bool    是否放进了队列
+        """
+        # 写线程已经出错或者退出（包括close之后）时，放进队列的快照不会再有人写入，不能当作成功
+        self._check()
+        assert_msg(self._thread.is_alive(), 'SnapshotSink的写线程已经退出：{}'.format(self.path))
+        try:
+            self._queue.put_nowait((ts, bids, asks))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self):
+        """
+        写完队列中剩下的快照，关闭文件
+        """
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._check()
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def _open(self):
+        self._file = open(self.path, 'ab')
+        self._size = self._file.tell()
+        if self.format == 'binary':
+            if self._size == 0:
+                self._file.write(BINARY_MAGIC)
+                self._size = len(BINARY_MAGIC)
+            else:
+                with open(self.path, 'rb') as fin:
+                    assert_msg(fin.read(len(BINARY_MAGIC)) == BINARY_MAGIC, '{}不是二进制快照文件'.format(self.path))
+
+    def _rotate(self):
+        self._file.close()
+        index = 1
+        while os.path.exists('{}.{}'.format(self.path, index)):
+            index += 1
+        os.replace(self.path, '{}.{}'.format(self.path, index))
+        self._open()
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        data = b''.join(self._encode(*item) for item in batch)
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+        self.written += len(batch)
+        if self.rotate_bytes is not None and self._size >= self.rotate_bytes:
+            self._rotate()
+
+    def _run(self):
+        batch = []
+        deadline = None
+        try:
+            while True:
+                timeout = None if not batch else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is _CLOSE:
+                    self._flush(batch)
+                    return
+                if item is not None:
+                    if not batch:
+                        deadline = time.monotonic() + self.flush_interval
+                    batch.append(item)
+                    if len(batch) < self.batch_size and time.monotonic() < deadline:
+                        continue
+                self._flush(batch)
+                batch = []
+        except BaseException as error:
+            # 写线程出错时记下异常，下一次write或者close时在调用方的线程中抛出
+            self._error = error
+
+
+def read_snapshots(path):
+    """
+    读取快照文件，JSON和二进制格式都可以，按文件开头的标识区分
+    :return:    generator   每个快照是 {'bids': [[价格, 数量], ...], 'asks': [...], 'ts': 毫秒时间戳}
+    """
+    with open(path, 'rb') as fin:
+        if fin.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            fin.seek(0)
+            for line in fin:
+                yield json.loads(line)
+            return
+
+        data = fin.read()
+    offset = 0
+    while offset < len(data):
+        ts, num_bids, num_asks = _HEADER.unpack_from(data, offset)
+        offset += _HEADER.size
+        count = 2 * (num_bids + num_asks)
+        values = struct.unpack_from('<{}d'.format(count), data, offset)
+        offset += 8 * count
+        levels = [[values[i], values[i + 1]] for i in range(0, count, 2)]
+        yield {'bids': levels[:num_bids], 'asks': levels[num_bids:], 'ts': ts}
+
+
+def main():
+    snapshots = list(read_snapshots('BTCUSD.txt')) * 20
+    directory = tempfile.mkdtemp()
+    try:
+        # 原来的做法：每条消息打开文件、编码、追加
+        path = os.path.join(directory, 'per_message.txt')
+        start = time.perf_counter()
+        for snapshot in snapshots:
+            with open(path, 'a+') as f:
+                f.write(json.dumps(snapshot) + '\n')
+        seconds = time.perf_counter() - start
+        print('open per message: {:.0f} snapshots/s, {} bytes'.format(len(snapshots) / seconds,
+                                                                       os.path.getsize(path)))
+
+        for format in ('json', 'binary'):
+            path = os.path.join(directory, 'sink.' + format)
+            start = time.perf_counter()
+            # 队列足够大，这里不丢弃快照，读回来和写入的完全一致
+            sink = SnapshotSink(path, format, queue_size=len(snapshots))
+            for snapshot in snapshots:
+                sink.write(snapshot['ts'], snapshot['bids'], snapshot['asks'])
+            submitted = time.perf_counter() - start
+            sink.close()
+            seconds = time.perf_counter() - start
+
+            assert_msg(list(read_snapshots(path)) == snapshots, '{}格式读回的快照和写入的不一致'.format(format))
+            print('SnapshotSink {:<6}: write() {:.0f} snapshots/s, with flush {:.0f} snapshots/s, '
+                  '{} bytes, {} dropped'.format(format, len(snapshots) / submitted, len(snapshots) / seconds,
+                                                os.path.getsize(path), sink.dropped))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+TRADE_LOG_DTYPE = np.dtype([
+    ('tick', np.int64),         # 成交时刻
+    ('size', np.float64),       # 成交数量，正数买入，负数卖出
+    ('price', np.float64),      # 成交价格，包含滑点
+    ('value', np.float64),      # 成交金额
+    ('commission', np.float64), # 手续费
+])
+
+# 推断周期时最多看这么多个时间间隔，数据再长也是常数时间
+_PERIOD_SAMPLE = 10000
+
+# 盈利小于开仓前市值的这个比例时视为不赚不亏
+_PROFIT_RTOL = 1e-9
+
+
+def periods_per_year(index):
+    """
+    由时间索引推断每年的周期数，用于年化。数字货币全天交易，一年按365天计算；
+    索引不是时间时按每年252个交易日。
+    :param index:   pd.Index
+    :return:        float
+    """
+    if isinstance(index, pd.DatetimeIndex) and len(index) > 1:
+        step = np.median(np.diff(index.asi8[:_PERIOD_SAMPLE + 1]))
+        if step > 0:
+            return 365 * 24 * 3600 * 1e9 / step
+    return 252.0
+
+
+def trade_log(fills):
+    """
+    由交易所的成交记录得到交易记录，每笔成交一条。
+    部分成交的订单有多条，成交价格是实际的成交价，不是这个时刻的收盘价。
+    :param fills:       np.ndarray  交易所的成交记录（ExchangeAPI.trades），字段见orders.TRADE_DTYPE
+    :return:            np.ndarray  结构化数组，字段见TRADE_LOG_DTYPE
+    """
+    fills = np.asarray(fills)
+    log = np.empty(len(fills), dtype=TRADE_LOG_DTYPE)
+    log['tick'] = fills['tick']
+    log['size'] = fills['side'] * fills['size']
+    log['price'] = fills['price']
+    log['value'] = fills['size'] * fills['price']
+    log['commission'] = fills['commission']
+    return log
+
+
+def compute_stats(cash, position, close, start=0, periods=252.0, fills=None):
+    """
+    由回测记录的现金和持仓曲线计算回测统计，全部是数组运算：
+    夏普比率、索提诺比率按每个时刻的收益率计算并年化；
+    最大回撤是相对之前最高市值的最大跌幅（负数），最长回撤周期是距离上一次创新高的最多时刻数；
+    一次交易是从空仓到重新空仓的一段持仓，胜率是其中市值增加的比例，最后没有平仓的一段按最后的市值计算；
+    持仓时间比例是有持仓的时刻占比，换手率是成交金额除以平均市值：
+    有成交记录时用实际成交金额，否则按持仓变化和收盘价估算。
+    :param cash:        np.ndarray  每个时刻的现金
+    :param position:    np.ndarray  每个时刻的持仓
+    :param close:       np.ndarray  收盘价
+    :param start:       int         回测开始位置，只统计从这里开始的部分
+    :param periods:     float       每年的周期数，见periods_per_year
+    :param fills:       np.ndarray  交易所的成交记录，字段见orders.TRADE_DTYPE，None表示没有
+    :return:            dict
+    """
+    cash = np.asarray(cash, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    position = np.asarray(position, dtype=np.float64)
+    # 开始之前的持仓和市值，第一个时刻就开仓时用来计算这笔交易的盈亏
+    if start > 0:
+        initial_position = position[start - 1]
+        initial = cash[start - 1] + initial_position * close[start - 1]
+    else:
+        initial_position, initial = 0.0, cash[0]
+    close = close[start:]
+    position = position[start:]
+    equity = cash[start:] + position * close
+    n = len(equity)
+    if n == 0:
+        return {}
+
+    # 每个时刻的收益率，市值为0之后收益率记为0
+    previous = equity[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.where(previous > 0, equity[1:] / previous - 1, 0.0)
+    mean = returns.mean() if len(returns) else np.nan
+    std = returns.std(ddof=1) if len(returns) > 1 else np.nan
+    downside = np.sqrt(np.mean(np.minimum(returns, 0.0) ** 2)) if len(returns) else np.nan
+    annual = np.sqrt(periods)
+    sharpe = mean / std * annual if std > 0 else np.nan
+    sortino = mean / downside * annual if downside > 0 else np.nan
+
+    # 回撤
+    peak = np.maximum.accumulate(equity)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = np.where(peak > 0, equity / peak - 1, 0.0)
+    ticks = np.arange(n)
+    last_peak = np.maximum.accumulate(np.where(equity >= peak, ticks, 0))
+    duration = int((ticks - last_peak).max())
+
+    # 交易：从空仓开始持仓到重新空仓，开始时已经有的持仓算作第一个时刻开仓
+    held = position > 0
+    was_held = np.r_[False, held[:-1]]
+    entries = np.flatnonzero(held & ~was_held)
+    exits = np.flatnonzero(~held & was_held)
+    if len(exits) < len(entries):
+        exits = np.r_[exits, n - 1]
+    # 空仓时市值就是现金，所以开仓前一个时刻的市值就是开仓前的资金
+    before = np.r_[initial, equity][entries]
+    profit = equity[exits] - before
+    # 开平仓价格相同、没有手续费时盈亏应该是0，不同的计算顺序会留下正负1e-12量级的误差，不能算作盈利
+    win_rate = (profit > np.abs(before) * _PROFIT_RTOL).mean() if len(entries) else np.nan
+
+    if fills is not None:
+        fills = np.asarray(fills)
+        fills = fills[fills['tick'] >= start]
+        traded = (fills['size'] * fills['price']).sum()
+    else:
+        traded = (np.abs(np.diff(position, prepend=initial_position)) * close).sum()
+    turnover = traded / equity.mean() if equity.mean() > 0 else np.nan
+
+    return {
+        '夏普比率': sharpe,
+        '索提诺比率': sortino,
+        '最大回撤': drawdown.min(),
+        '最长回撤周期': duration,
+        '交易次数': len(entries),
+        '胜率': win_rate,
+        '持仓时间比例': held.mean(),
+        '换手率': turnover,
+    }
@@ -0,0 +1,339 @@
+import abc
+import math
+from collections import deque
+
+import numpy as np
+
+import indicators
+from utils import assert_msg, crossover
+from snapshots import read_snapshots
+
+
+class StreamingIndicator(metaclass=abc.ABCMeta):
+    """
+    增量计算的指标。每来一个新价格调用一次update，时间复杂度O(1)，不需要保存或者重新扫描整段历史。
+    每个子类的batch是对应的批量版本（indicators模块中的函数），参数相同：
+    对同一段价格，逐个update的结果和 batch(values, *params) 一致。
+    """
+
+    # 批量计算的函数，由子类指定
+    batch = None
+
+    def __init__(self):
+        self._value = math.nan
+
+    @abc.abstractmethod
+    def update(self, value):
+        """
+        加入一个新的值
+        :return:    float   加入之后的指标值，数据还不够时为NaN
+        """
+        pass
+
+    @property
+    def value(self):
+        return self._value
+
+    @property
+    def ready(self):
+        return not math.isnan(self._value)
+
+    def run(self, values):
+        """
+        依次update一段历史数据，返回和批量版本相同形状的数组，可以用来预热或者对照批量结果
+        """
+        return np.array([self.update(value) for value in values], dtype=np.float64)
+
+
+class SMA(StreamingIndicator):
+    """
+    简单滑动平均，按照indicators.sma完全相同的步骤增量计算，结果和批量版本逐位相同：
+    均线交叉对1e-13量级的差异也很敏感，只有逐位相同，实盘信号才能和回测信号完全一致。
+    和批量版本一样，每个值先减去所在块（长度max(n, SUM_BLOCK)）的第一个值再累加，
+    只保存最近n + 1个累积和，窗口和就是两个累积和的差，跨块的窗口加上两个块基准值之差，均为O(1)。
+    窗口中有NaN时结果为NaN，NaN移出窗口后立即恢复；窗口内所有值都相同时直接取这个值。
+    """
+
+    batch = staticmethod(indicators.sma)
+
+    def __init__(self, n):
+        super(SMA, self).__init__()
+        assert_msg(n > 0, '窗口大小必须大于0')
+        self.n = n
+        self._block = max(n, indicators.SUM_BLOCK)
+        self._count = 0
+        # 当前块和前一个块的基准值
+        self._reference = 0.0
+        self._previous_reference = 0.0
+        # 最近n + 1个相对基准值的累积和
+        self._sums = deque([0.0], maxlen=n + 1)
+        # NaN用前一个有效值代替参与累加，只是为了让基准值和累积和保持正常
+        self._last_valid = 0.0
+        self._last_missing = -1
+        # 结尾处连续相同的值的个数
+        self._previous = math.nan
+        self._run = 0
+
+    def update(self, value):
+        value = float(value)
+        i = self._count
+        self._count += 1
+
+        self._run = self._run + 1 if value == self._previous else 1
+        self._previous = value
+        if math.isnan(value):
+            self._last_missing = i
+        else:
+            self._last_valid = value
+        if self.n == 1:
+            self._value = value
+            return self._value
+
+        if i % self._block == 0:
+            self._previous_reference, self._reference = self._reference, self._last_valid
+        self._sums.append(self._sums[-1] + (self._last_valid - self._reference))
+
+        if i < self.n - 1:
+            return self._value
+        if self._last_missing > i - self.n:
+            self._value = math.nan
+        elif self._run >= self.n:
+            self._value = value
+        else:
+            window_sum = self._sums[-1] - self._sums[0]
+            # 窗口开头有head个值落在前一个块中，把它们换算到当前块的基准值上
+            head = i // self._block * self._block - (i - self.n + 1)
+            if head > 0:
+                window_sum += head * (self._previous_reference - self._reference)
+            self._value = self._reference + window_sum / self.n
+        return self._value
+
+
+class EMA(StreamingIndicator):
+    """
+    指数滑动平均，alpha = 2 / (n + 1)，第一个值作为初始值
+    """
+
+    batch = staticmethod(indicators.ema)
+
+    def __init__(self, n):
+        super(EMA, self).__init__()
+        self.n = n
+        self.alpha = 2.0 / (n + 1)
+
+    def update(self, value):
+        value = float(value)
+        if math.isnan(self._value):
+            self._value = value
+        else:
+            self._value += self.alpha * (value - self._value)
+        return self._value
+
+
+class _RollingExtreme(StreamingIndicator):
+    """
+    单调队列：队列中保存(位置, 值)，值单调，队首就是窗口内的最值。
+    新值进来时把队尾不可能再成为最值的元素弹出，每个元素最多进出队列一次，均摊O(1)。
+    """
+
+    def __init__(self, n):
+        super(_RollingExtreme, self).__init__()
+        assert_msg(n > 0, '窗口大小必须大于0')
+        self.n = n
+        self._deque = deque()
+        self._count = 0
+
+    @abc.abstractmethod
+    def _dominates(self, new, old):
+        """
+        new进入窗口之后，old是否不可能再成为最值
+        """
+        pass
+
+    def update(self, value):
+        value = float(value)
+        while self._deque and self._dominates(value, self._deque[-1][1]):
+            self._deque.pop()
+        self._deque.append((self._count, value))
+        if self._deque[0][0] <= self._count - self.n:
+            self._deque.popleft()
+        self._count += 1
+
+        if self._count >= self.n:
+            self._value = self._deque[0][1]
+        return self._value
+
+
+class RollingMin(_RollingExtreme):
+    batch = staticmethod(indicators.rolling_min)
+
+    def _dominates(self, new, old):
+        return new <= old
+
+
+class RollingMax(_RollingExtreme):
+    batch = staticmethod(indicators.rolling_max)
+
+    def _dominates(self, new, old):
+        return new >= old
+
+
+class RollingVariance(StreamingIndicator):
+    """
+    滑动方差，Welford方法：维护均值和离差平方和M2，窗口满了以后每次同时加入新值、移出旧值：
+    mean' = mean + (x - y) / n，M2' = M2 + (x - y) * (x - mean' + y - mean)
+    """
+
+    batch = staticmethod(indicators.rolling_var)
+
+    def __init__(self, n, ddof=1):
+        super(RollingVariance, self).__init__()
+        assert_msg(n > ddof, '窗口大小必须大于ddof')
+        self.n = n
+        self.ddof = ddof
+        self._window = deque(maxlen=n)
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, value):
+        value = float(value)
+        if len(self._window) < self.n:
+            # 窗口还没满，只加入新值
+            self._window.append(value)
+            delta = value - self._mean
+            self._mean += delta / len(self._window)
+            self._m2 += delta * (value - self._mean)
+        else:
+            old = self._window[0]
+            self._window.append(value)
+            old_mean = self._mean
+            self._mean += (value - old) / self.n
+            self._m2 += (value - old) * (value - self._mean + old - old_mean)
+
+        if len(self._window) == self.n:
+            self._value = max(self._m2, 0.0) / (self.n - self.ddof)
+        return self._value
+
+    @property
+    def std(self):
+        return math.sqrt(self._value)
+
+
+class VWAP(StreamingIndicator):
+    """
+    成交量加权平均价。n为None时从头累计，否则只统计最近n个成交。
+    滑动窗口的成交额和成交量加减多次之后浮点误差会累积，所以每处理n个值用窗口内的数据重新求一次和，均摊仍然是O(1)。
+    """
+
+    batch = staticmethod(indicators.vwap)
+
+    def __init__(self, n=None):
+        super(VWAP, self).__init__()
+        self.n = n
+        self._window = deque(maxlen=n) if n is not None else None
+        self._turnover = 0.0
+        self._volume = 0.0
+        self._updates = 0
+
+    def update(self, price, volume=1.0):
+        price, volume = float(price), float(volume)
+        if self._window is not None:
+            if len(self._window) == self.n:
+                old_price, old_volume = self._window[0]
+                self._turnover -= old_price * old_volume
+                self._volume -= old_volume
+            self._window.append((price, volume))
+        self._turnover += price * volume
+        self._volume += volume
+
+        self._updates += 1
+        if self._window is not None and self._updates % self.n == 0:
+            self._turnover = math.fsum(price * volume for price, volume in self._window)
+            self._volume = math.fsum(volume for _, volume in self._window)
+
+        if (self._window is None or len(self._window) == self.n) and self._volume > 0:
+            self._value = self._turnover / self._volume
+        return self._value
+
+    def run(self, prices, volumes=None):
+        if volumes is None:
+            volumes = np.ones(len(prices))
+        return np.array([self.update(price, volume) for price, volume in zip(prices, volumes)], dtype=np.float64)
+
+
+class Crossover(object):
+    """
+    增量版的crossover：保存两个序列最近两个值，用utils.crossover判断是否刚好在结尾交叉
+    """
+
+    def __init__(self):
+        self._series1 = deque(maxlen=2)
+        self._series2 = deque(maxlen=2)
+
+    def update(self, value1, value2):
+        self._series1.append(value1)
+        self._series2.append(value2)
+        return len(self._series1) == 2 and crossover(self._series1, self._series2)
+
+
+class SmaCrossSignal(object):
+    """
+    SmaCross策略的增量版本，逻辑和回测中的SmaCross.next一致，用于实盘：
+    增量SMA和批量的indicators.sma逐位相同，交叉判断用的也是同一个utils.crossover，不留相对误差。
+    SmaCross.next(i)只使用到第i-1个价格为止的均线，所以update(第i个价格)返回的是下一个时刻的操作：
+    +1 买入，-1 卖出，0 不操作，和回测中 strategy.signal[i + 1] 相同。
+    """
+
+    def __init__(self, fast=10, slow=20):
+        self.sma1 = SMA(fast)
+        self.sma2 = SMA(slow)
+        self._cross_up = Crossover()
+        self._cross_down = Crossover()
+
+    def update(self, price):
+        fast = self.sma1.update(price)
+        slow = self.sma2.update(price)
+        # 两个方向都要更新，保证各自保存的是最近两个值
+        cross_up = self._cross_up.update(fast, slow)
+        cross_down = self._cross_down.update(slow, fast)
+        if cross_up:
+            return 1
+        if cross_down:
+            return -1
+        return 0
+
+    def run(self, prices):
+        return np.array([self.update(price) for price in prices], dtype=np.int8)
+
+
+def read_snapshot_prices(file_path):
+    """
+    从Crawler保存的orderbook快照中取出买一、卖一的中间价，JSON和二进制格式的快照文件都可以
+    """
+    prices = []
+    for snapshot in read_snapshots(file_path):
+        if snapshot['bids'] and snapshot['asks']:
+            prices.append((snapshot['bids'][0][0] + snapshot['asks'][0][0]) / 2)
+    return np.array(prices)
+
+
+def main():
+    prices = read_snapshot_prices('BTCUSD.txt')
+    print('{} snapshots'.format(len(prices)))
+
+    # 逐个价格增量计算的结果和批量计算一致
+    for indicator, params in [(SMA, (20,)), (EMA, (20,)), (RollingMin, (20,)), (RollingMax, (20,)),
+                              (RollingVariance, (20,)), (VWAP, (20,))]:
+        streaming = indicator(*params).run(prices)
+        batch = indicator.batch(prices, *params) if indicator is not VWAP \
+            else indicator.batch(prices, np.ones(len(prices)), *params)
+        assert_msg(np.allclose(streaming, batch, rtol=1e-9, atol=1e-9, equal_nan=True),
+                   '{}的增量结果和批量结果不一致'.format(indicator.__name__))
+        print('{:<16} last value {:.4f}'.format(indicator.__name__, streaming[-1]))
+
+    signals = SmaCrossSignal(10, 20).run(prices)
+    print('buy signals: {}, sell signals: {}'.format((signals == 1).sum(), (signals == -1).sum()))
+
+
+if __name__ == '__main__':
+    main()
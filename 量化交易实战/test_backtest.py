@@ -0,0 +1,49 @@
+import os
+
+import pandas as pd
+import pytest
+
+from utils import read_file
+from Lesson36_strategy_backtest import Backtest, SmaCross, SmaCrossTrailingStop, ExchangeAPI, SimulatedExchange, \
+    check_equivalence
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BTCUSD_GEMINI.csv')
+
+
+class SlippageExchange(SimulatedExchange):
+    slippage = 0.0005
+
+
+@pytest.fixture(scope='module')
+def data():
+    return read_file(DATA_FILE, cache=False)
+
+
+@pytest.mark.parametrize('strategy_type', [SmaCross, SmaCrossTrailingStop])
+@pytest.mark.parametrize('commission', [0.0, 0.003])
+def test_loop_matches_vectorized(data, strategy_type, commission):
+    loop, vectorized = check_equivalence(data, strategy_type, ExchangeAPI, 10000.0, commission)
+    pd.testing.assert_series_equal(loop, vectorized, rtol=1e-9)
+    assert loop['交易次数'] > 0
+
+
+@pytest.mark.parametrize('broker_type, mode', [(ExchangeAPI, 'loop'), (ExchangeAPI, 'vectorized'),
+                                               (SlippageExchange, 'loop')])
+def test_rerun_starts_from_initial_cash(data, broker_type, mode):
+    backtest = Backtest(data, SmaCross, broker_type, 10000.0, 0.003)
+    first = backtest.run(mode=mode)
+    first_trades = backtest.trades
+    second = backtest.run(mode=mode)
+    pd.testing.assert_series_equal(first, second)
+    assert len(backtest.trades) == len(first_trades)
+
+    fresh = Backtest(data, SmaCross, broker_type, 10000.0, 0.003).run(mode=mode, fast=5, slow=30)
+    assert backtest.run(mode=mode, fast=5, slow=30).equals(fresh)
+
+
+def test_rerun_resets_order_history(data):
+    backtest = Backtest(data, SmaCross, SlippageExchange, 10000.0, 0.003)
+    backtest.run()
+    orders = len(backtest._broker.orders)
+    backtest.run()
+    assert len(backtest._broker.orders) == orders > 0
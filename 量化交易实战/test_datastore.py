@@ -0,0 +1,81 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from datastore import ColumnStore, build_store, default_store_path, _tz_from_json, _tz_to_json
+from utils import read_file
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BTCUSD_GEMINI.csv')
+
+
+def test_read_file_does_not_create_store_by_default():
+    data = read_file(DATA_FILE)
+    # 不使用列存储时保持CSV文件中的顺序（按时间倒序）
+    assert data.index.is_monotonic_decreasing
+    pd.testing.assert_frame_equal(data, pd.read_csv(DATA_FILE, index_col=0, parse_dates=True))
+    assert not os.path.exists(default_store_path(DATA_FILE))
+
+
+def test_cached_and_plain_reads_match(tmp_path):
+    cache_dir = str(tmp_path)
+    plain = read_file(DATA_FILE).sort_index(kind='mergesort')
+    cached = read_file(DATA_FILE, cache=True, cache_dir=cache_dir)
+    assert os.path.isdir(default_store_path(DATA_FILE, cache_dir))
+    assert cached.index.is_monotonic_increasing
+    pd.testing.assert_frame_equal(cached, plain, check_freq=False)
+
+    window = read_file(DATA_FILE, '2019-01-01', '2019-01-31')
+    cached_window = read_file(DATA_FILE, '2019-01-01', '2019-01-31', cache=True, cache_dir=cache_dir)
+    assert len(window) and window.index.min() >= pd.Timestamp('2019-01-01')
+    assert window.index.max() <= pd.Timestamp('2019-01-31')
+    pd.testing.assert_frame_equal(cached_window, window.sort_index(kind='mergesort'), check_freq=False)
+
+
+def test_store_keeps_index_timezone(tmp_path):
+    csv_path = str(tmp_path / 'tz.csv')
+    with open(csv_path, 'w') as fout:
+        fout.write('Date,Close\n2020-01-01 10:00:00+08:00,2.0\n2020-01-01 09:00:00+08:00,1.0\n'
+                   '2020-01-01 11:00:00+08:00,3.0\n')
+    plain = read_file(csv_path)
+    store = ColumnStore(build_store(csv_path, str(tmp_path / 'tz.columns')))
+    frame = store.to_frame()
+    assert frame.index[0].utcoffset() == plain.index[0].utcoffset() == pd.Timedelta(hours=8)
+    pd.testing.assert_frame_equal(frame, plain.sort_index(), check_freq=False, check_index_type=False)
+    # 不带时区的边界按索引的时区理解
+    assert store.rows_between('2020-01-01 09:30', '2020-01-01 10:00') == slice(1, 2)
+    pd.testing.assert_frame_equal(read_file(csv_path, '2020-01-01 09:30', '2020-01-01 10:00'), plain.iloc[:1])
+
+    for tz in ['UTC', 'Asia/Shanghai']:
+        index = pd.DatetimeIndex(['2020-01-01'], tz=tz)
+        assert _tz_from_json(_tz_to_json(index.tz)) == tz
+
+
+def test_concurrent_builds_leave_one_complete_store(tmp_path):
+    store_path = default_store_path(DATA_FILE, str(tmp_path))
+    errors = []
+
+    def build():
+        try:
+            build_store(DATA_FILE, store_path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=build) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert ColumnStore.is_fresh(DATA_FILE, store_path)
+    assert os.listdir(str(tmp_path)) == [os.path.basename(store_path)]
+    close = ColumnStore(store_path).column('Close')
+    assert np.array_equal(close, read_file(DATA_FILE).sort_index().Close.values)
+
+
+def test_store_columns_are_read_only_views(tmp_path):
+    store = ColumnStore.open(DATA_FILE, default_store_path(DATA_FILE, str(tmp_path)))
+    close = store.column('Close')
+    assert len(close) == len(store)
+    assert not close.flags.writeable
@@ -0,0 +1,143 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicators import IndicatorRegistry, sma, ema, rolling_std
+from utils import read_file
+from Lesson36_strategy_backtest import Backtest, SmaCross, ExchangeAPI, Strategy
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BTCUSD_GEMINI.csv')
+
+
+def _prices(length=500, seed=0):
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.01, length)))
+
+
+@pytest.mark.parametrize('n', [1, 5, 30])
+def test_indicators_match_pandas(n):
+    values = _prices()
+    series = pd.Series(values)
+    np.testing.assert_allclose(sma(values, n), series.rolling(n).mean(), rtol=1e-10)
+    np.testing.assert_allclose(ema(values, n), series.ewm(span=n, adjust=False).mean(), rtol=1e-10)
+    if n > 1:
+        np.testing.assert_allclose(rolling_std(values, n), series.rolling(n).std(), rtol=1e-8, atol=1e-12)
+
+
+def test_registry_caches_by_content():
+    registry = IndicatorRegistry()
+    values = _prices()
+    first = registry.compute(sma, values, 10)
+    second = registry.compute(sma, values.copy(), 10)
+    assert second is first
+    assert registry.hits == 1 and registry.misses == 1
+    assert not first.flags.writeable
+
+    registry.compute(sma, values, 20)
+    assert registry.misses == 2
+
+
+def test_registry_unhashable_arguments_skip_cache():
+    registry = IndicatorRegistry()
+    values = _prices()
+
+    def total(values, weights):
+        return np.asarray(values) * sum(weights)
+
+    np.testing.assert_array_equal(registry.compute(total, values, [1, 2]), values * 3)
+    frame = pd.DataFrame({'Close': values})
+    np.testing.assert_array_equal(registry.compute(lambda df, n: sma(df['Close'], n), frame, 10), sma(values, 10))
+    assert registry.stats()['entries'] == 0
+
+
+def test_registry_recomputes_readonly_views():
+    registry = IndicatorRegistry()
+    owner = _prices()
+    view = owner[:]
+    view.setflags(write=False)
+    before = registry.compute(sma, view, 10)
+
+    owner[:] = owner * 2
+    after = registry.compute(sma, view, 10)
+    np.testing.assert_allclose(after, before * 2)
+
+
+def test_registry_keys_include_argument_types():
+    registry = IndicatorRegistry()
+    values = _prices()
+
+    def kind(values, flag):
+        return np.full(len(values), len(type(flag).__name__), dtype=float)
+
+    results = [registry.compute(kind, values, flag) for flag in (True, 1, 1.0, np.float64(1.0))]
+    assert [result[0] for result in results] == [4, 3, 5, 7]
+    assert registry.misses == 4 and registry.hits == 0
+
+    first = registry.compute(kind, values, (1, 2))
+    second = registry.compute(kind, values, (1.0, 2.0))
+    assert first is not second
+    assert registry.compute(kind, values, (1, 2)) is first
+
+
+def test_registry_is_thread_safe():
+    registry = IndicatorRegistry()
+    arrays = []
+    for seed in range(100):
+        values = _prices(200, seed)
+        values.setflags(write=False)
+        arrays.append(values)
+    expected = [sma(values, 10) for values in arrays]
+    errors = []
+
+    def work(offset):
+        try:
+            for i in range(len(arrays)):
+                idx = (i + offset) % len(arrays)
+                np.testing.assert_array_equal(registry.compute(sma, arrays[idx], 10), expected[idx])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(offset * 13,)) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert registry.hits + registry.misses == 800
+
+
+def test_cached_indicators_are_read_only():
+    registry = IndicatorRegistry()
+    result = registry.compute(sma, _prices(), 10)
+    with pytest.raises(ValueError):
+        result[-1] = 0.0
+    copied = result.copy()
+    copied[-1] = 0.0
+    assert registry.compute(sma, _prices(), 10)[-1] != 0.0
+
+
+def test_strategy_indicator_accepts_unhashable_arguments():
+    data = read_file(DATA_FILE, cache=False)
+
+    class ListStrategy(Strategy):
+        def init(self):
+            self.weighted = self.I(lambda close, weights: np.asarray(close) * weights[0], self.data.Close, [1, 2])
+            self.frame = self.I(lambda frame: frame['Close'].values, self.data)
+
+        def next(self, tick):
+            pass
+
+    result = Backtest(data, ListStrategy, ExchangeAPI, 10000.0, 0.003).run()
+    assert result['收益'] == pytest.approx(0.0)
+
+
+def test_backtest_is_deterministic_with_cache():
+    data = read_file(DATA_FILE, cache=False)
+    registry = IndicatorRegistry()
+    first = Backtest(data, SmaCross, ExchangeAPI, 10000.0, 0.003, indicator_cache=registry).run()
+    second = Backtest(data, SmaCross, ExchangeAPI, 10000.0, 0.003, indicator_cache=registry).run()
+    assert registry.hits > 0
+    pd.testing.assert_series_equal(first, second)
@@ -0,0 +1,103 @@
+import json
+
+import numpy as np
+import pytest
+
+from journal import Journal, JournalWriter, checkpoint_path
+from orderbook import OrderBook, random_messages
+
+
+def _write(path, messages, checkpoint_interval=200, buffer_size=64):
+    """
+    写日志，同时逐条更新OrderBook，返回每个时间戳之后的完整订单簿
+    """
+    orderbook = OrderBook(window=None)
+    expected = []
+    with JournalWriter(path, checkpoint_interval=checkpoint_interval, buffer_size=buffer_size) as writer:
+        for ts, message in enumerate(messages):
+            events = json.loads(message)['events']
+            writer.append_message(ts, events)
+            for event in events:
+                orderbook.insert(float(event['price']), float(event['remaining']), event['side'])
+            expected.append((list(orderbook.top_bids()), list(orderbook.top_asks())))
+    return expected
+
+
+def _levels(journal, ts):
+    book = journal.book_at(ts, limit=None)
+    return list(book.top_bids()), list(book.top_asks())
+
+
+@pytest.fixture
+def messages():
+    return random_messages(1500, levels=200, seed=1)
+
+
+def test_replay_matches_sequential_orderbook(tmp_path, messages):
+    path = str(tmp_path / 'book.journal')
+    expected = _write(path, messages)
+    journal = Journal(path)
+    assert len(journal._checkpoints) > 5
+    for ts in [0, 1, 199, 200, 777, len(messages) - 1]:
+        assert _levels(journal, ts) == expected[ts]
+    journal.close()
+
+
+def test_incremental_replay_matches_seek(tmp_path, messages):
+    path = str(tmp_path / 'book.journal')
+    _write(path, messages)
+    journal = Journal(path)
+    timestamps = list(range(0, len(messages), 37))
+    for ts, state in zip(timestamps, journal.replay(timestamps)):
+        for (prices, amounts), (seek_prices, seek_amounts) in zip(state, journal.levels_at(ts)):
+            np.testing.assert_array_equal(prices, seek_prices)
+            np.testing.assert_array_equal(amounts, seek_amounts)
+    journal.close()
+
+
+def test_reopen_after_partial_write(tmp_path, messages):
+    path = str(tmp_path / 'book.journal')
+    expected = _write(path, messages[:800])
+    # 模拟写到一半时进程退出：两个文件末尾都留下不完整的记录
+    with open(path, 'ab') as fout:
+        fout.write(b'\x01\x02\x03')
+    with open(checkpoint_path(path), 'ab') as fout:
+        fout.write(b'\x00' * 10)
+
+    orderbook = OrderBook(window=None)
+    for message in messages[:800]:
+        for event in json.loads(message)['events']:
+            orderbook.insert(float(event['price']), float(event['remaining']), event['side'])
+    with JournalWriter(path, checkpoint_interval=200) as writer:
+        for ts, message in enumerate(messages[800:], 800):
+            events = json.loads(message)['events']
+            writer.append_message(ts, events)
+            for event in events:
+                orderbook.insert(float(event['price']), float(event['remaining']), event['side'])
+            expected.append((list(orderbook.top_bids()), list(orderbook.top_asks())))
+
+    journal = Journal(path)
+    for ts in [500, 799, 800, 1200, len(messages) - 1]:
+        assert _levels(journal, ts) == expected[ts]
+    journal.close()
+
+
+def test_unknown_side_is_skipped(tmp_path, capsys):
+    path = str(tmp_path / 'book.journal')
+    with JournalWriter(path) as writer:
+        writer.append_message(1, [{'price': '10', 'remaining': '1', 'side': 'bid'},
+                                  {'price': '11', 'remaining': '1', 'side': 'auction'},
+                                  {'price': '12', 'remaining': '2', 'side': 'ask'}])
+    assert 'WARNING' in capsys.readouterr().out
+    journal = Journal(path)
+    assert len(journal) == 2
+    book = journal.book_at()
+    assert book.best_bid == (10.0, 1.0) and book.best_ask == (12.0, 2.0)
+    journal.close()
+
+
+def test_timestamps_must_not_decrease(tmp_path):
+    with JournalWriter(str(tmp_path / 'book.journal')) as writer:
+        writer.append(5, 10.0, 1.0, 'bid')
+        with pytest.raises(Exception):
+            writer.append(4, 10.0, 2.0, 'bid')
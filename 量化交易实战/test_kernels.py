@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+import kernels
+from utils import crossover
+
+
+def _random_case(seed, length=400):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, length)))
+    signal = rng.choice([-1, 0, 0, 0, 1], length).astype(np.int8)
+    return close, signal
+
+
+def _reference_position(signal):
+    out = np.zeros(len(signal), dtype=np.int8)
+    held = False
+    for i, s in enumerate(signal):
+        if s > 0 and not held:
+            out[i], held = 1, True
+        elif s < 0 and held:
+            out[i], held = -1, False
+    return out
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_cross_signal_matches_crossover_loop(seed):
+    rng = np.random.default_rng(seed)
+    fast, slow = rng.normal(size=300).cumsum(), rng.normal(size=300).cumsum()
+    fast[:5] = np.nan
+    # 两条线相等的时刻不算交叉
+    fast[50:53] = slow[50:53]
+    expected = np.zeros(300, dtype=np.int8)
+    for i in range(2, 300):
+        if crossover(fast[:i], slow[:i]):
+            expected[i] = 1
+        elif crossover(slow[:i], fast[:i]):
+            expected[i] = -1
+    np.testing.assert_array_equal(kernels.cross_signal(fast, slow, use_c=False), expected)
+    if kernels.HAS_C_KERNELS:
+        np.testing.assert_array_equal(kernels.cross_signal(fast, slow), expected)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_position_signal_matches_state_machine(seed):
+    _, signal = _random_case(seed)
+    expected = _reference_position(signal)
+    for use_c in (False, True):
+        out, state = kernels.position_signal(signal, use_c=use_c)
+        np.testing.assert_array_equal(out, expected)
+        np.testing.assert_array_equal(state, np.cumsum(expected))
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_trailing_stop_c_matches_fallback(seed):
+    close, signal = _random_case(seed)
+    fallback = kernels.trailing_stop(close, signal, 0.02, use_c=False)
+    # 只有实际持仓时才会平仓，买卖交替
+    sides = fallback[fallback != 0]
+    assert not len(sides) or (sides[0] == 1 and (sides[1:] != sides[:-1]).all())
+    if kernels.HAS_C_KERNELS:
+        np.testing.assert_array_equal(kernels.trailing_stop(close, signal, 0.02), fallback)
+
+
+def test_signal_inputs_accept_any_dtype():
+    signal = np.array([0.0, 2.5, np.nan, -3.0, 1.0])
+    out, _ = kernels.position_signal(signal)
+    np.testing.assert_array_equal(out, [0, 1, 0, -1, 1])
+    with pytest.raises(Exception):
+        kernels.trailing_stop(np.ones(3), np.zeros(3), 1.5)
@@ -0,0 +1,38 @@
+import os
+
+import pandas as pd
+import pytest
+
+import optimizer
+from utils import read_file
+from Lesson36_strategy_backtest import Backtest, SmaCross, ExchangeAPI
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BTCUSD_GEMINI.csv')
+PARAMS = {'fast': [5, 10, 15], 'slow': [20, 40]}
+
+
+def final_value(result):
+    return result['结束市值']
+
+
+def _backtest():
+    return Backtest(read_file(DATA_FILE, cache=False).iloc[:2000], SmaCross, ExchangeAPI, 10000.0, 0.003)
+
+
+def test_parallel_matches_single_process():
+    single = optimizer.optimize(_backtest(), PARAMS, workers=1)
+    parallel = optimizer.optimize(_backtest(), PARAMS, workers=2)
+    pd.testing.assert_frame_equal(single, parallel)
+    assert single['score'].is_monotonic_decreasing
+
+
+def test_module_level_maximize_runs_in_pool():
+    table = optimizer.optimize(_backtest(), PARAMS, maximize=final_value, workers=2)
+    assert (table['score'] == table['结束市值']).all()
+
+
+def test_unpicklable_maximize_fails_early():
+    with pytest.raises(Exception, match='maximize'):
+        optimizer.optimize(_backtest(), PARAMS, maximize=lambda result: result['收益'], workers=2)
+    # 单进程时不需要序列化
+    optimizer.optimize(_backtest(), PARAMS, maximize=lambda result: result['收益'], workers=1)
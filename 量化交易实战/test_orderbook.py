@@ -0,0 +1,78 @@
+import os
+
+from orderbook import OrderBook, _resort_replay, random_messages, replay, snapshot_messages
+
+SNAPSHOT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BTCUSD.txt')
+
+
+def _as_lists(snapshot):
+    return tuple([list(level) for level in side] for side in snapshot)
+
+
+def test_replay_matches_resort_on_recorded_snapshots():
+    messages = snapshot_messages(SNAPSHOT_FILE)
+    _, snapshot = replay(messages, 10)
+    assert snapshot == _as_lists(_resort_replay(messages, 10))
+
+
+def test_replay_matches_resort_on_deep_book():
+    messages = random_messages(2000, levels=500, seed=3)
+    orderbook, snapshot = replay(messages, 10, window=None)
+    assert snapshot == _as_lists(_resort_replay(messages, 10, truncate=False))
+    bids, asks = list(orderbook.top_bids()), list(orderbook.top_asks())
+    assert [price for price, _ in bids] == sorted((price for price, _ in bids), reverse=True)
+    assert [price for price, _ in asks] == sorted(price for price, _ in asks)
+
+
+def test_views_and_best_levels():
+    orderbook = OrderBook(limit=2)
+    assert orderbook.best_bid is None and orderbook.mid_price is None
+    view = orderbook.top_bids()
+    for price, amount in [(99.0, 1.0), (101.0, 2.0), (100.0, 3.0)]:
+        orderbook.insert(price, amount, 'bid')
+    orderbook.insert(102.0, 1.0, 'ask')
+    assert list(view) == [(101.0, 2.0), (100.0, 3.0), (99.0, 1.0)]
+    assert list(orderbook.bids_sorted) == [(101.0, 2.0), (100.0, 3.0)]
+
+    orderbook.insert(101.0, 0, 'bid')
+    assert orderbook.best_bid == (100.0, 3.0)
+    assert orderbook.mid_price == 101.0
+    assert orderbook.get_copy_of_bids_and_asks() == ([[100.0, 3.0], [99.0, 1.0]], [[102.0, 1.0]])
+
+    copy = OrderBook.from_levels(([100.0, 99.0], [3.0, 1.0]), ([102.0], [1.0]), limit=2)
+    assert copy.get_copy_of_bids_and_asks() == orderbook.get_copy_of_bids_and_asks()
+
+
+def test_levels_outside_window_are_trimmed():
+    orderbook = OrderBook(limit=2, window=2)
+    for price in [100.0, 99.0, 98.0, 97.0, 96.0]:
+        orderbook.insert(price, 1.0, 'bid')
+    # 每侧最多保留 2 * 2 档，更差的96直接丢弃
+    assert list(orderbook.bids) == [100.0, 99.0, 98.0, 97.0]
+    orderbook.insert(101.0, 2.0, 'bid')
+    assert list(orderbook.bids) == [101.0, 100.0, 99.0, 98.0]
+    # 前limit档中的档位被撤掉后，保留的档位补上来
+    orderbook.insert(101.0, 0, 'bid')
+    orderbook.insert(100.0, 0, 'bid')
+    assert list(orderbook.bids_sorted) == [(99.0, 1.0), (98.0, 1.0)]
+
+    messages = random_messages(2000, levels=500, seed=4)
+    trimmed, _ = replay(messages, 10)
+    assert len(trimmed.top_bids()) <= 10 * OrderBook.WINDOW and len(trimmed.top_asks()) <= 10 * OrderBook.WINDOW
+
+
+def test_bids_and_asks_dicts():
+    orderbook = OrderBook(limit=2)
+    for price, amount in [(99.0, 1.0), (101.0, 2.0), (100.0, 3.0)]:
+        orderbook.insert(price, amount, 'bid')
+    orderbook.insert(102.0, 1.0, 'ask')
+    assert dict(orderbook.bids) == {99.0: 1.0, 101.0: 2.0, 100.0: 3.0}
+    assert list(orderbook.bids.items()) == [(101.0, 2.0), (100.0, 3.0), (99.0, 1.0)]
+    assert orderbook.bids[100.0] == 3.0 and 98.0 not in orderbook.bids
+    assert orderbook.asks == {102.0: 1.0}
+
+    # 原来的接口：截断到limit档
+    orderbook.sort_and_truncate()
+    assert dict(orderbook.bids) == {101.0: 2.0, 100.0: 3.0}
+    orderbook.insert(100.0, 0, 'bid')
+    assert list(orderbook.bids_sorted) == [(101.0, 2.0)]
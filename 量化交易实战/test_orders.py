@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from orders import OrderSimulator, BUY, SELL, MARKET, LIMIT, STOP, PENDING, FILLED, CANCELLED, EXPIRED, \
+    REJECTED, PARTIAL
+
+
+def _simulator(bars, **kwargs):
+    # bars: [(open, high, low, close, volume)]
+    open, high, low, close, volume = np.array(bars, dtype=np.float64).T
+    return OrderSimulator(open, high, low, close, volume, **kwargs)
+
+
+BARS = [
+    (100, 101, 99, 100, 10),
+    (100, 102, 98, 101, 10),
+    (97, 99, 95, 96, 10),
+    (105, 110, 104, 108, 10),
+    (108, 109, 107, 108, 10),
+]
+
+
+def test_market_order_fills_at_next_open_with_slippage():
+    simulator = _simulator(BARS, commission=0.01, slippage=0.001)
+    order_id = simulator.submit(0, BUY, 2.0)
+    cash, position = simulator.match(0, 1000.0, 0.0)
+    assert position == 0.0 and simulator.pending == 1
+
+    cash, position = simulator.match(1, cash, position)
+    price = 100 * 1.001
+    assert position == 2.0
+    assert cash == pytest.approx(1000.0 - 2 * price * 1.01)
+    trade = simulator.trades[0]
+    assert (trade['order'], trade['tick'], trade['side']) == (order_id, 1, BUY)
+    assert trade['price'] == pytest.approx(price) and trade['commission'] == pytest.approx(2 * price * 0.01)
+    assert simulator.orders[order_id]['status'] == FILLED
+
+    simulator.submit(1, SELL)
+    cash, position = simulator.match(2, cash, position)
+    assert position == 0.0
+    assert simulator.trades[1]['price'] == pytest.approx(97 * 0.999)
+
+
+def test_limit_orders_trigger_on_range_and_gap():
+    simulator = _simulator(BARS)
+    below = simulator.submit(0, BUY, 1.0, LIMIT, 96.0)
+    gap = simulator.submit(0, BUY, 1.0, LIMIT, 98.5)
+    cash, position = simulator.match(1, 1000.0, 0.0)
+    # 第1个时刻最低价98，只有98.5的限价单成交，按限价成交
+    assert position == 1.0 and simulator.trades[0]['price'] == 98.5
+    assert simulator.orders[below]['status'] == PENDING and simulator.orders[gap]['status'] == FILLED
+
+    # 第2个时刻最低95，96的限价单按限价成交
+    cash, position = simulator.match(2, cash, position)
+    assert position == 2.0 and simulator.trades[1]['price'] == 96.0
+
+    sell = simulator.submit(2, SELL, 1.0, LIMIT, 104.0)
+    cash, position = simulator.match(3, cash, position)
+    # 开盘105优于限价104，按开盘价成交，限价单没有滑点
+    assert simulator.trades[2]['price'] == 105.0 and simulator.orders[sell]['status'] == FILLED
+
+
+def test_stop_orders_trigger_and_expire():
+    simulator = _simulator(BARS, slippage=0.01)
+    stop_loss = simulator.submit(0, SELL, 1.0, STOP, 99.0)
+    breakout = simulator.submit(0, BUY, 1.0, STOP, 103.0)
+    never = simulator.submit(0, BUY, 1.0, STOP, 200.0, valid=2)
+    cash, position = 1000.0, 2.0
+    cash, position = simulator.match(1, cash, position)
+    # 第1个时刻最低98触发卖出止损，按触发价加滑点成交
+    assert simulator.trades[0]['price'] == pytest.approx(99.0 * 0.99)
+    assert simulator.orders[breakout]['status'] == PENDING
+
+    for tick in range(2, 5):
+        cash, position = simulator.match(tick, cash, position)
+    # 第3个时刻跳空开盘105，高于触发价，按开盘价成交
+    assert simulator.trades[1]['tick'] == 3 and simulator.trades[1]['price'] == pytest.approx(105 * 1.01)
+    assert [simulator.orders[i]['status'] for i in (stop_loss, breakout, never)] == [FILLED, FILLED, EXPIRED]
+    assert position == 2.0
+
+
+def test_partial_fills_then_cancel():
+    simulator = _simulator(BARS, participation=0.2)
+    order_id = simulator.submit(0, BUY, 5.0)
+    cash, position = simulator.match(1, 10000.0, 0.0)
+    cash, position = simulator.match(2, cash, position)
+    # 每个时刻最多成交 10 * 0.2 = 2
+    assert position == 4.0 and list(simulator.trades['size']) == [2.0, 2.0]
+    assert simulator.orders[order_id]['status'] == PENDING
+
+    assert simulator.cancel(order_id)
+    order = simulator.orders[order_id]
+    assert order['status'] == PARTIAL and order['filled'] == 4.0
+    assert not simulator.cancel(order_id)
+
+    untouched = simulator.submit(2, BUY, 1.0, LIMIT, 1.0)
+    assert simulator.cancel(untouched) and simulator.orders[untouched]['status'] == CANCELLED
+
+
+def test_partial_fill_limited_by_cash():
+    simulator = _simulator(BARS)
+    order_id = simulator.submit(0, BUY, 20.0)
+    cash, position = simulator.match(1, 1000.0, 0.0)
+    assert position == pytest.approx(10.0) and cash == 0.0
+    assert simulator.orders[order_id]['status'] == PARTIAL
+
+
+@pytest.mark.parametrize('side, size, cash, position', [(SELL, None, 1000.0, 0.0), (SELL, 1.0, 1000.0, 0.0),
+                                                        (BUY, None, 0.0, 1.0), (BUY, 1.0, 0.0, 1.0)])
+def test_orders_without_funds_are_rejected(side, size, cash, position):
+    simulator = _simulator(BARS)
+    order_id = simulator.submit(0, side, size)
+    assert simulator.match(1, cash, position) == (cash, position)
+    assert simulator.orders[order_id]['status'] == REJECTED
+    assert simulator.orders[order_id]['filled'] == 0.0
+    assert len(simulator.trades) == 0 and simulator.pending == 0
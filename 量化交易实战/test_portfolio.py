@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from portfolio import simulate_weights, random_panel
+
+
+def naive_simulate_weights(close, weights, cash, commission, tolerance=0.0):
+    # 逐个时刻、逐个品种的参考实现
+    length, num_assets = close.shape
+    positions = [0.0] * num_assets
+    last_price = [0.0] * num_assets
+    previous = None
+    equity = []
+    for t in range(length):
+        for j in range(num_assets):
+            if not np.isnan(close[t, j]):
+                last_price[j] = close[t, j]
+        target = [0.0 if np.isnan(close[t, j]) and not np.isnan(weights[t, j]) else weights[t, j]
+                  for j in range(num_assets)]
+        changed = previous is None or any(a != b and not (np.isnan(a) and np.isnan(b))
+                                          for a, b in zip(target, previous))
+        previous = target
+        if changed and not all(np.isnan(target)):
+            total = cash + sum(p * q for p, q in zip(positions, last_price))
+            diff = [0.0] * num_assets
+            for j in range(num_assets):
+                value = positions[j] * last_price[j]
+                target_value = value if np.isnan(target[j]) else target[j] * total
+                if not np.isnan(close[t, j]) and abs(target_value - value) > tolerance * max(target_value, value):
+                    diff[j] = target_value - value
+            for j in range(num_assets):
+                if diff[j] < 0:
+                    positions[j] += diff[j] / close[t, j]
+                    cash -= diff[j] * (1 - commission)
+            buys = sum(d for d in diff if d > 0)
+            scale = min(1.0, max(cash, 0.0) / buys) if buys > 0 else 1.0
+            for j in range(num_assets):
+                if diff[j] > 0:
+                    positions[j] += diff[j] * scale / (close[t, j] * (1 + commission))
+                    cash -= diff[j] * scale
+            for j in range(num_assets):
+                if not np.isnan(close[t, j]) and abs(positions[j] * close[t, j]) < 1e-9:
+                    positions[j] = 0.0
+        equity.append(cash + sum(p * q for p, q in zip(positions, last_price)))
+    return np.array(equity), np.array(positions)
+
+
+@pytest.mark.parametrize('tolerance', [0.0, 0.05])
+def test_matches_naive_loop_with_nan_gap(tolerance):
+    close = random_panel(300, 4, seed=3).Close.copy()
+    # 第1个品种中途停牌，第3个品种开头还没有上市
+    close[100:140, 1] = np.nan
+    close[:50, 3] = np.nan
+    rng = np.random.default_rng(4)
+    weights = np.repeat(rng.dirichlet(np.ones(5), size=30)[:, :4], 10, axis=0)
+    weights[rng.random(weights.shape) < 0.1] = np.nan
+
+    result = simulate_weights(close, weights, 10000.0, 0.003, tolerance=tolerance)
+    equity, positions = naive_simulate_weights(close, weights, 10000.0, 0.003, tolerance)
+    np.testing.assert_allclose(result['equity'], equity, rtol=1e-9)
+    np.testing.assert_allclose(result['positions'], positions, rtol=1e-9, atol=1e-12)
+
+
+def test_holdings_survive_nan_prices():
+    close = np.array([[10.0], [np.nan], [12.0]])
+    weights = np.array([[1.0], [1.0], [1.0]])
+    result = simulate_weights(close, weights, 100.0, 0.0)
+    # 停牌时不能交易，持仓保持不变，按停牌前的价格估值
+    np.testing.assert_allclose(result['equity'], [100.0, 100.0, 120.0])
+    np.testing.assert_allclose(result['positions'], [10.0])
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from snapshots import SnapshotSink, read_snapshots
+
+SNAPSHOT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BTCUSD.txt')
+
+
+@pytest.mark.parametrize('format', ['json', 'binary'])
+def test_sink_round_trip(tmp_path, format):
+    snapshots = list(read_snapshots(SNAPSHOT_FILE))[:500]
+    path = str(tmp_path / ('snapshots.' + format))
+    with SnapshotSink(path, format, batch_size=64, queue_size=len(snapshots)) as sink:
+        for snapshot in snapshots:
+            assert sink.write(snapshot['ts'], snapshot['bids'], snapshot['asks'])
+    assert sink.dropped == 0 and sink.written == len(snapshots)
+    assert list(read_snapshots(path)) == snapshots
+
+
+def test_rotation_keeps_every_snapshot(tmp_path):
+    snapshots = list(read_snapshots(SNAPSHOT_FILE))[:300]
+    path = str(tmp_path / 'snapshots.bin')
+    with SnapshotSink(path, 'binary', batch_size=16, queue_size=len(snapshots), rotate_bytes=4096) as sink:
+        for snapshot in snapshots:
+            sink.write(snapshot['ts'], snapshot['bids'], snapshot['asks'])
+
+    rotated = sorted((name for name in os.listdir(str(tmp_path)) if name != 'snapshots.bin'),
+                     key=lambda name: int(name.rsplit('.', 1)[1]))
+    assert rotated
+    read_back = [snapshot for name in rotated for snapshot in read_snapshots(str(tmp_path / name))]
+    read_back.extend(read_snapshots(path))
+    assert read_back == snapshots
+
+
+def test_writer_errors_surface_on_close(tmp_path):
+    sink = SnapshotSink(str(tmp_path / 'snapshots.json'))
+    # 不能编码成JSON的快照让写线程出错
+    sink.write(1, [[object(), 1.0]], [])
+    with pytest.raises(TypeError):
+        sink.close()
+
+
+def test_writer_errors_surface_on_write(tmp_path):
+    sink = SnapshotSink(str(tmp_path / 'snapshots.json'), batch_size=1)
+    sink.write(1, [[object(), 1.0]], [])
+    sink._thread.join(5)
+    with pytest.raises(TypeError):
+        sink.write(2, [[1.0, 1.0]], [])
+
+
+def test_write_after_close_fails(tmp_path):
+    sink = SnapshotSink(str(tmp_path / 'snapshots.json'))
+    assert sink.write(1, [[1.0, 1.0]], [])
+    sink.close()
+    with pytest.raises(Exception, match='已经退出'):
+        sink.write(2, [[1.0, 1.0]], [])
+    assert sink.written == 1
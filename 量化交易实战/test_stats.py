@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+
+from orders import TRADE_DTYPE, BUY, SELL
+from stats import compute_stats, trade_log
+from utils import read_file
+from Lesson36_strategy_backtest import Backtest, SmaCross, ExchangeAPI, SimulatedExchange
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BTCUSD_GEMINI.csv')
+
+
+class SlippageExchange(SimulatedExchange):
+    slippage = 0.001
+
+
+class PartialExchange(SimulatedExchange):
+    participation = 0.01
+
+
+@pytest.fixture(scope='module')
+def data():
+    return read_file(DATA_FILE, cache=False).sort_index().iloc[:3000]
+
+
+def test_trade_log_uses_fill_prices():
+    fills = np.array([(0, 3, BUY, 2.0, 101.0, 0.5), (1, 7, SELL, 0.5, 99.0, 0.1), (1, 8, SELL, 1.5, 98.0, 0.2)],
+                     dtype=TRADE_DTYPE)
+    log = trade_log(fills)
+    assert list(log['tick']) == [3, 7, 8]
+    assert list(log['size']) == [2.0, -0.5, -1.5]
+    assert list(log['price']) == [101.0, 99.0, 98.0]
+    assert list(log['value']) == [202.0, 49.5, 147.0]
+    assert list(log['commission']) == [0.5, 0.1, 0.2]
+
+
+def test_loop_and_vectorized_record_the_same_fills(data):
+    loop = Backtest(data, SmaCross, ExchangeAPI, 10000.0, 0.003)
+    loop.run()
+    vectorized = Backtest(data, SmaCross, ExchangeAPI, 10000.0, 0.003)
+    vectorized.run(mode='vectorized')
+    assert len(loop.trades) > 0
+    for field in ['tick', 'size', 'price', 'value', 'commission']:
+        np.testing.assert_allclose(loop.trades[field], vectorized.trades[field], rtol=1e-9)
+    # 全仓买卖交替，每次卖出的数量等于上一次买入的数量
+    assert (loop.trades['size'][0::2] > 0).all() and (loop.trades['size'][1::2] < 0).all()
+    np.testing.assert_allclose(loop.trades['size'][1::2], -loop.trades['size'][0::2][:len(loop.trades[1::2])])
+
+
+def test_trades_include_slippage(data):
+    backtest = Backtest(data, SmaCross, SlippageExchange, 10000.0, 0.003)
+    backtest.run()
+    trades = backtest.trades
+    assert len(trades) > 0
+    open_prices = data.Open.values[trades['tick']]
+    np.testing.assert_allclose(trades['price'], open_prices * (1 + 0.001 * np.sign(trades['size'])))
+    # 按收盘价的持仓变化记录不到滑点
+    assert not np.allclose(trades['price'], data.Close.values[trades['tick']])
+    np.testing.assert_allclose(trades['commission'], trades['value'] * 0.003)
+
+
+def test_partial_fills_are_separate_trades(data):
+    backtest = Backtest(data, SmaCross, PartialExchange, 10000.0, 0.0)
+    backtest.run()
+    trades = backtest.trades
+    # 一个订单分多个时刻成交，每次成交一条记录，加起来等于最终持仓
+    assert len(trades) > len(np.unique(backtest._broker.trades['order']))
+    assert trades['size'].sum() == pytest.approx(backtest._broker.position, abs=1e-9)
+
+
+def test_turnover_uses_fill_values():
+    cash = np.array([100.0, 0.0, 0.0, 110.0])
+    position = np.array([0.0, 1.0, 1.0, 0.0])
+    close = np.array([100.0, 100.0, 105.0, 110.0])
+    estimated = compute_stats(cash, position, close)
+    assert estimated['交易次数'] == 1 and estimated['胜率'] == 1.0
+    assert estimated['换手率'] == pytest.approx(210.0 / np.mean([100.0, 100.0, 105.0, 110.0]))
+
+    # 实际成交价格和收盘价不同时以成交记录为准
+    fills = np.array([(0, 1, BUY, 1.0, 98.0, 0.0), (1, 3, SELL, 1.0, 111.0, 0.0)], dtype=TRADE_DTYPE)
+    actual = compute_stats(cash, position, close, fills=fills)
+    assert actual['换手率'] == pytest.approx(209.0 / np.mean([100.0, 100.0, 105.0, 110.0]))
+    assert compute_stats(cash, position, close, start=2, fills=fills)['换手率'] == pytest.approx(111.0 / 107.5)
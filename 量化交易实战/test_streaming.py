@@ -0,0 +1,94 @@
+import math
+import os
+
+import numpy as np
+import pytest
+
+import kernels
+import streaming
+from indicators import sma
+from utils import crossover, crossover_vector, read_file
+from Lesson36_strategy_backtest import Backtest, SmaCross, ExchangeAPI
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BTCUSD_GEMINI.csv')
+
+
+def test_incomplete_indicator_fails_on_construction():
+    class Incomplete(streaming.StreamingIndicator):
+        pass
+
+    class IncompleteExtreme(streaming._RollingExtreme):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+    with pytest.raises(TypeError):
+        IncompleteExtreme(5)
+
+
+@pytest.mark.parametrize('indicator, params', [(streaming.SMA, (20,)), (streaming.EMA, (20,)),
+                                               (streaming.RollingMin, (20,)), (streaming.RollingMax, (20,)),
+                                               (streaming.RollingVariance, (20,))])
+def test_streaming_matches_batch(indicator, params):
+    prices = 100 * np.exp(np.cumsum(np.random.default_rng(0).normal(0, 0.01, 1000)))
+    np.testing.assert_allclose(indicator(*params).run(prices), indicator.batch(prices, *params),
+                               rtol=1e-9, atol=1e-9)
+
+
+def test_utils_crossover_is_strict():
+    # 交叉判断不带相对误差，增量版本的Crossover也一样
+    series1 = [1.0, 1.0 + 1e-13]
+    series2 = [1.0 + 1e-13, 1.0]
+    assert crossover(series1, series2)
+    assert crossover_vector(series1 + [0.0], series2 + [0.0])[2]
+    cross = streaming.Crossover()
+    assert not cross.update(series1[0], series2[0])
+    assert cross.update(series1[1], series2[1])
+
+
+@pytest.mark.parametrize('n', [1, 2, 10, 20, 1500])
+def test_sma_is_bitwise_identical_to_batch(n):
+    rng = np.random.default_rng(1)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 5000)))
+    # 常数段、开头和中间的NaN
+    prices[100:130] = prices[100]
+    prices[[0, 1, 700, 2049, 3100]] = np.nan
+    prices[3101:3140] = np.nan
+    np.testing.assert_array_equal(streaming.SMA(n).run(prices), sma(prices, n))
+
+
+def test_sma_recovers_after_nan():
+    prices = np.arange(1.0, 31.0)
+    prices[5] = np.nan
+    result = streaming.SMA(4).run(prices)
+    assert np.isnan(result[5:9]).all()
+    assert result[9] == 8.5
+    np.testing.assert_array_equal(result, sma(prices, 4))
+
+
+@pytest.fixture(scope='module')
+def close():
+    # CSV文件按时间倒序保存，Backtest会先按时间排序
+    return read_file(DATA_FILE, cache=False).sort_index().Close.values
+
+
+def test_sma_cross_signal_matches_backtest(close):
+    live = streaming.SmaCrossSignal(10, 20).run(close)
+    signal = kernels.cross_signal(sma(close, 10), sma(close, 20))
+    np.testing.assert_array_equal(live[:-1], signal[1:])
+
+    backtest = Backtest(read_file(DATA_FILE, cache=False), SmaCross, ExchangeAPI, 10000.0, 0.003)
+    backtest.run()
+    np.testing.assert_array_equal(live[:-1], backtest._strategy.signal[1:])
+
+
+def test_windowed_vwap_recomputes_sums():
+    rng = np.random.default_rng(2)
+    prices = np.r_[np.full(50, 1e8), 100 + rng.normal(0, 1, 2000)]
+    volumes = rng.uniform(1, 10, len(prices))
+    indicator = streaming.VWAP(20)
+    result = np.array([indicator.update(price, volume) for price, volume in zip(prices, volumes)])
+    # 开头的大价格移出窗口后，只做加减的窗口和会留下远大于价格精度的误差
+    expected = [math.fsum(prices[i - 19:i + 1] * volumes[i - 19:i + 1]) / math.fsum(volumes[i - 19:i + 1])
+                for i in range(len(prices) - 1000, len(prices))]
+    np.testing.assert_allclose(result[-1000:], expected, rtol=1e-12)
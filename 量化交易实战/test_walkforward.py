@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import walkforward
+from utils import read_file
+from Lesson36_strategy_backtest import Backtest, SmaCross, ExchangeAPI
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BTCUSD_GEMINI.csv')
+
+
+def test_rolling_windows_do_not_overlap():
+    windows = walkforward.rolling_windows(1000, 300, 100)
+    assert windows[0] == (0, 300, 400)
+    for (_, _, previous_end), (_, start, _) in zip(windows, windows[1:]):
+        assert start == previous_end
+    anchored = walkforward.rolling_windows(1000, 300, 100, step=150, anchored=True)
+    assert all(in_start == 0 for in_start, _, _ in anchored)
+
+
+def test_rolling_windows_reject_overlapping_out_of_sample():
+    with pytest.raises(Exception):
+        walkforward.rolling_windows(1000, 300, 100, step=50)
+
+
+def test_walk_forward_returns_each_bar_once():
+    data = read_file(DATA_FILE, cache=False).iloc[:3000]
+    backtest = Backtest(data, SmaCross, ExchangeAPI, 10000.0, 0.003)
+    table, returns = walkforward.walk_forward(backtest, {'fast': [5, 10], 'slow': [20, 40]}, train=1000, test=500,
+                                              workers=1)
+    assert len(table) == 4
+    assert returns.index.is_unique
+    assert len(returns) == 4 * 500
+
+
+def test_monte_carlo_independent_of_workers():
+    returns = pd.Series(np.random.default_rng(0).normal(0, 0.01, 1000))
+    single = walkforward.monte_carlo(returns, simulations=250, block=10, periods=252, workers=1, random_state=3)
+    parallel = walkforward.monte_carlo(returns, simulations=250, block=10, periods=252, workers=2, random_state=3)
+    pd.testing.assert_frame_equal(single, parallel)
+    assert (single['最大回撤'] <= 0).all()
@@ -1,5 +1,7 @@
+import numpy as np
 import pandas as pd
 from os import path
+from indicators import sma, ema, rolling_std
 
 
 def assert_msg(condition, msg):
@@ -14,7 +16,27 @@ def SMA(values, n):
     :param n:
     :return:
     """
-    return pd.Series(values).rolling(n).mean()
+    return sma(values, n)
+
+
+def EMA(values, n):
+    """
+    返回指数滑动平均
+    :param values:
+    :param n:
+    :return:
+    """
+    return ema(values, n)
+
+
+def STD(values, n):
+    """
+    返回滑动标准差
+    :param values:
+    :param n:
+    :return:
+    """
+    return rolling_std(values, n)
 
 
 def crossover(series1, series2) -> bool:
@@ -27,16 +49,54 @@ def crossover(series1, series2) -> bool:
     return series1[-2] < series2[-2] and series1[-1] > series2[-1]
 
 
-def read_file(filename):
+def crossover_vector(series1, series2) -> np.ndarray:
+    """
+    crossover的向量化版本，一次算出所有时刻的结果
+    :param series1:     序列1
+    :param series2:     序列2
+    :return:            bool数组，第i个元素等于crossover(series1[:i], series2[:i])
+    """
+    series1 = np.asarray(series1, dtype=float)
+    series2 = np.asarray(series2, dtype=float)
+    result = np.zeros(len(series1), dtype=bool)
+    result[2:] = (series1[:-2] < series2[:-2]) & (series1[1:-1] > series2[1:-1])
+    return result
+
+
+def read_file(filename, start=None, end=None, cache=False, cache_dir=None):
+    """
+    读取CSV行情，行的顺序和CSV文件中相同。
+    cache为True时第一次读取会转换成列存储（每列一个.npy文件），之后直接映射列存储，不再解析CSV；
+    CSV文件更新后会自动重新生成。列存储按时间升序保存，所以这时返回的行按时间升序排列。
+    :param start:       开始时间，只读取时间在[start, end]之间的行，两端都包含
+    :param end:         结束时间，'2019-01-31'表示2019-01-31 00:00:00
+    :param cache:       是否使用列存储
+    :param cache_dir:   列存储所在的目录，默认和CSV文件放在一起（文件名.columns）
+    :return:            pd.DataFrame
+    """
     # 获得文件绝对路径
     filepath = path.join(path.dirname(__file__), filename)
 
     # 判定文件是否存在
     assert_msg(path.exists(filepath), '文件不存在')
 
+    if cache:
+        # datastore依赖本模块的assert_msg，在这里导入避免循环导入
+        from datastore import load
+        return load(filepath, start, end, cache_dir=cache_dir)
+
     # 读取CSV文件并返回
-    return pd.read_csv(filepath,
+    data = pd.read_csv(filepath,
                        index_col=0,
                        parse_dates=True,
                        infer_datetime_format=True
                        )
+    # 行不一定按时间排序，不能用data.loc[start:end]切片
+    selected = np.ones(len(data), dtype=bool)
+    for bound, compare in [(start, np.greater_equal), (end, np.less_equal)]:
+        if bound is not None:
+            bound = pd.Timestamp(bound)
+            if getattr(data.index, 'tz', None) is not None and bound.tz is None:
+                bound = bound.tz_localize(data.index.tz)
+            selected &= compare(data.index, bound)
+    return data if selected.all() else data[selected]
@@ -0,0 +1,91 @@
+import numpy as np
+
+from orders import TRADE_DTYPE, BUY, SELL
+
+
+def simulate_signals(close, signal, cash, commission, start=0, end=None):
+    """
+    向量化的成交/仓位/市值模拟，结果和ExchangeAPI逐个tick执行buy/sell完全一致：
+    信号为+1时用全部现金按收盘价买入，为-1时卖出全部持仓，0不操作。
+    ExchangeAPI的几个边界行为也照原样保留：
+    空仓时卖出、连续卖出什么都不做；持仓时再次买入会用0现金重新计算仓位，账户清零。
+    :param close:       np.ndarray  收盘价
+    :param signal:      np.ndarray  和close等长的信号数组
+    :param cash:        float       初始资金
+    :param commission:  float       手续费率
+    :param start:       int         回测开始位置，之前的信号忽略
+    :param end:         int         回测结束位置（不含）
+    :return:            dict        每个时刻的cash、position、equity，实际成交的buys、sells位置，
+                                    以及和ExchangeAPI.trades相同的成交记录trades
+    """
+    close = np.asarray(close, dtype=float)
+    n = len(close)
+    end = n if end is None else end
+
+    sig = np.zeros(n, dtype=np.int8)
+    sig[start:end] = np.sign(np.nan_to_num(np.asarray(signal, dtype=float)[start:end]))
+
+    bars = np.flatnonzero(sig)
+    sides = sig[bars]
+
+    # 连续相同的信号只有第一个会改变账户状态，
+    # 唯一的例外是连续买入：第二次买入时现金为0，仓位被重新计算成0，账户从此清零
+    wipe_bar = n
+    if len(bars):
+        run_start = np.r_[True, sides[1:] != sides[:-1]]
+        repeated_buy = ~run_start & (sides == 1)
+        if repeated_buy.any():
+            wipe_bar = bars[np.argmax(repeated_buy)]
+
+        keep = run_start & (bars < wipe_bar)
+        bars, sides = bars[keep], sides[keep]
+
+        # 第一次买入之前的卖出不起作用
+        if len(sides) and sides[0] == -1:
+            bars, sides = bars[1:], sides[1:]
+
+    # 现在bars是严格交替的 买、卖、买、卖 ...
+    buys = bars[0::2]
+    sells = bars[1::2]
+    buy_prices = close[buys] * (1 + commission)
+    sell_prices = close[sells] * (1 - commission)
+
+    cash_after_sell = cash * np.cumprod(sell_prices / buy_prices[:len(sells)])
+    cash_before_buy = np.r_[cash, cash_after_sell][:len(buys)]
+    position_after_buy = cash_before_buy / buy_prices
+
+    # 事件k为偶数是买入，奇数是卖出；最后多放一个元素表示还没有任何事件时的初始状态
+    event_cash = np.zeros(len(bars) + 1)
+    event_position = np.zeros(len(bars) + 1)
+    event_cash[1:-1:2] = cash_after_sell
+    event_position[0:-1:2] = position_after_buy
+    event_cash[-1] = cash
+
+    # 每个时刻对应的最近一次事件，-1正好取到初始状态
+    last_event = np.full(n, -1)
+    last_event[bars] = np.arange(len(bars))
+    last_event = np.maximum.accumulate(last_event)
+
+    cash_curve = event_cash[last_event]
+    position_curve = event_position[last_event]
+    cash_curve[wipe_bar:] = 0.0
+    position_curve[wipe_bar:] = 0.0
+
+    # 成交记录按时间排列，买卖交替；ExchangeAPI没有订单，订单编号记为-1
+    trades = np.zeros(len(bars), dtype=TRADE_DTYPE)
+    trades['order'] = -1
+    trades['tick'] = bars
+    trades['side'] = np.where(sides > 0, BUY, SELL)
+    trades['size'][0::2] = position_after_buy
+    trades['size'][1::2] = position_after_buy[:len(sells)]
+    trades['price'] = close[bars]
+    trades['commission'] = trades['size'] * trades['price'] * commission
+
+    return {
+        'cash': cash_curve,
+        'position': position_curve,
+        'equity': cash_curve + position_curve * close,
+        'buys': buys,
+        'sells': sells,
+        'trades': trades,
+    }
@@ -0,0 +1,187 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import optimizer
+from utils import assert_msg
+from stats import periods_per_year
+
+# 蒙特卡洛模拟每个任务的模拟次数，任务之间用独立的随机数种子，结果和进程数无关
+_SIMULATIONS_PER_TASK = 100
+
+
+def rolling_windows(length, train, test, step=None, anchored=False):
+    """
+    切分滚动的样本内/样本外窗口
+    :param length:      int     数据长度
+    :param train:       int     样本内长度
+    :param test:        int     样本外长度
+    :param step:        int     窗口每次向后移动的长度，默认等于test，样本外窗口首尾相接；
+                                不能小于test，否则样本外窗口互相重叠，拼接的收益率中同一个时刻会出现多次
+    :param anchored:    bool    为True时样本内窗口的起点固定在0，长度逐渐增加
+    :return:            list    [(样本内开始, 样本内结束/样本外开始, 样本外结束)]
+    """
+    step = step or test
+    assert_msg(train > 0 and test > 0 and step > 0, '窗口长度必须大于0')
+    assert_msg(step >= test, 'step（{}）不能小于样本外长度test（{}），否则样本外窗口互相重叠'.format(step, test))
+    return [(0 if anchored else start, start + train, start + train + test)
+            for start in range(0, length - train - test + 1, step)]
+
+
+def _run_window(window, combinations, maximize, warmup):
+    """
+    在工作进程里处理一个窗口：用样本内数据回测所有参数组合，选出得分最高的一组，再用样本外数据回测。
+    样本外回测从样本外开始前warmup个时刻开始取数据，指标有足够的历史，交易正好从样本外第一个时刻开始。
+    :return:    (参数, 样本内得分, 样本外回测结果dict, 样本外每个时刻的收益率)
+    """
+    in_start, in_end, out_end = window
+    data = optimizer.worker_data()
+
+    best, best_score = None, -np.inf
+    in_sample = data.iloc[in_start:in_end]
+    for params in combinations:
+        _, result = optimizer.run_in_worker(in_sample, params)
+        score = optimizer.score_of(result, maximize)
+        if best is None or score > best_score:
+            best, best_score = params, score
+
+    backtest, result = optimizer.run_in_worker(data.iloc[in_end - warmup:out_end], best)
+    # 第warmup - 1个时刻还没有交易，市值就是初始资金
+    equity = backtest.equity.values[warmup - 1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.where(equity[:-1] > 0, equity[1:] / equity[:-1] - 1, 0.0)
+    return best, best_score, result.to_dict(), returns
+
+
+def walk_forward(backtest, param_ranges, train, test, step=None, anchored=False, maximize='收益', constraint=None,
+                 workers=None, mode='vectorized', cache_dir=None):
+    """
+    滚动窗口（walk-forward）回测：在每个样本内窗口上优化参数，用紧接着的样本外窗口检验。
+    所有窗口分给进程池并行处理，行情数据通过optimizer.worker_pool放在共享内存里，只复制一次。
+    :param backtest:        Backtest    提供数据、策略类型、交易所类型、初始资金和手续费
+    :param param_ranges:    dict        参数名 -> 候选值列表
+    :param train:           int         样本内长度
+    :param test:            int         样本外长度
+    :param step:            int         窗口移动的长度，默认等于test，不能小于test
+    :param anchored:        bool        样本内窗口是否固定从第0个时刻开始
+    :param maximize:        str         样本内选择参数的标准，同optimizer.optimize，workers大于1时函数必须能序列化
+    :param constraint:      callable    constraint(params) 返回False的组合不回测
+    :param workers:         int         进程数，默认为CPU数；为1时在当前进程中运行
+    :param mode:            str         Backtest.run的回测模式
+    :param cache_dir:       str         指标的磁盘缓存目录
+    :return:                (pd.DataFrame, pd.Series)   每个窗口一行的结果表，
+                                                        以及拼接起来的样本外每个时刻的收益率，可以传给monte_carlo
+    """
+    for name in param_ranges:
+        assert_msg(hasattr(backtest.strategy_type, name), '策略{}没有参数{}'.format(backtest.strategy_type.__name__, name))
+    warmup = type(backtest).warmup
+    assert_msg(train > warmup, '样本内长度必须大于warmup（{}）'.format(warmup))
+
+    data = backtest.data
+    windows = rolling_windows(len(data), train, test, step, anchored)
+    assert_msg(windows, '数据长度不够切分出一个样本内+样本外窗口')
+    combinations = optimizer.parameter_grid({name: list(values) for name, values in param_ranges.items()},
+                                            constraint)
+    assert_msg(combinations, '没有满足约束的参数组合')
+
+    workers = min(workers or os.cpu_count() or 1, len(windows))
+    optimizer.check_picklable(maximize, workers)
+    with optimizer.worker_pool(backtest, workers, mode, cache_dir) as executor:
+        outcomes = optimizer.pool_map(executor, _run_window, windows, [combinations] * len(windows),
+                                      [maximize] * len(windows), [warmup] * len(windows))
+
+    rows = []
+    for (in_start, in_end, out_end), (params, score, result, _) in zip(windows, outcomes):
+        row = {'样本内开始': data.index[in_start], '样本外开始': data.index[in_end],
+               '样本外结束': data.index[out_end - 1]}
+        row.update(params)
+        row['样本内得分'] = score
+        row.update(result)
+        rows.append(row)
+    table = pd.DataFrame(rows)
+
+    index = np.concatenate([np.arange(in_end, out_end) for _, in_end, out_end in windows])
+    returns = pd.Series(np.concatenate([outcome[3] for outcome in outcomes]), index=data.index[index])
+    return table, returns
+
+
+def _simulate(returns, simulations, block, seed, periods):
+    """
+    一批自助法（bootstrap）模拟：把收益率序列按长度为block的块有放回地重新抽样，拼成同样长度的新序列。
+    所有模拟放在一个 模拟次数 × 时刻数 的二维数组里一起计算。
+    :return:    np.ndarray  每次模拟的 总收益率、年化夏普比率、最大回撤
+    """
+    rng = np.random.default_rng(seed)
+    length = len(returns)
+    num_blocks = -(-length // block)
+    starts = rng.integers(0, length - block + 1, size=(simulations, num_blocks))
+    index = (starts[:, :, None] + np.arange(block)).reshape(simulations, -1)[:, :length]
+    sampled = returns[index]
+
+    equity = np.cumprod(1 + sampled, axis=1)
+    total = equity[:, -1] - 1
+    std = sampled.std(axis=1, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 0, sampled.mean(axis=1) / std * np.sqrt(periods), np.nan)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), 1.0)
+    drawdown = (equity / peak - 1).min(axis=1)
+    return np.column_stack([total, sharpe, np.minimum(drawdown, 0.0)])
+
+
+def monte_carlo(returns, simulations=1000, block=1, periods=None, workers=None, random_state=None):
+    """
+    对每个时刻的收益率做蒙特卡洛（自助法）重抽样，估计总收益、夏普比率和最大回撤的分布。
+    block大于1时按连续的块抽样，保留收益率的短期相关性。模拟分成多个任务在进程池中并行计算。
+    :param returns:         pd.Series   每个时刻的收益率，比如walk_forward返回的样本外收益率
+    :param simulations:     int         模拟次数
+    :param block:           int         抽样块的长度
+    :param periods:         float       每年的周期数，默认由returns的时间索引推断
+    :param workers:         int         进程数，默认为CPU数；为1时在当前进程中运行
+    :param random_state:    int         随机数种子，相同的种子得到相同的结果，和进程数无关
+    :return:                pd.DataFrame 每次模拟一行：总收益率、夏普比率、最大回撤
+    """
+    values = np.ascontiguousarray(np.asarray(returns, dtype=np.float64))
+    assert_msg(len(values) > 1, '至少需要两个收益率')
+    assert_msg(0 < block <= len(values), '块长度必须在[1, 收益率个数]之间')
+    if periods is None:
+        periods = periods_per_year(returns.index) if isinstance(returns, pd.Series) else 252.0
+
+    sizes = [_SIMULATIONS_PER_TASK] * (simulations // _SIMULATIONS_PER_TASK)
+    if simulations % _SIMULATIONS_PER_TASK:
+        sizes.append(simulations % _SIMULATIONS_PER_TASK)
+    seeds = np.random.SeedSequence(random_state).spawn(len(sizes))
+    args = ([values] * len(sizes), sizes, [block] * len(sizes), seeds, [periods] * len(sizes))
+
+    workers = min(workers or os.cpu_count() or 1, len(sizes))
+    if workers == 1:
+        results = optimizer.pool_map(None, _simulate, *args)
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            results = optimizer.pool_map(executor, _simulate, *args)
+    return pd.DataFrame(np.concatenate(results), columns=['总收益率', '夏普比率', '最大回撤'])
+
+
+def main():
+    from utils import read_file
+    from Lesson36_strategy_backtest import Backtest, SmaCross, ExchangeAPI
+
+    BTCUSD = read_file('BTCUSD_GEMINI.csv')
+    backtest = Backtest(BTCUSD, SmaCross, ExchangeAPI, 10000.0, 0.003)
+
+    start = time.perf_counter()
+    table, returns = walk_forward(backtest, {'fast': range(5, 50, 5), 'slow': range(10, 200, 10)},
+                                  train=5000, test=1000, constraint=lambda params: params['fast'] < params['slow'])
+    print(table[['样本外开始', 'fast', 'slow', '样本内得分', '收益', '夏普比率', '最大回撤']])
+    print('walk-forward: {} windows, {:.2f}s'.format(len(table), time.perf_counter() - start))
+
+    start = time.perf_counter()
+    simulations = monte_carlo(returns, simulations=2000, block=24, random_state=0)
+    print(simulations.quantile([0.05, 0.25, 0.5, 0.75, 0.95]))
+    print('monte carlo: {} simulations, {:.2f}s'.format(len(simulations), time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()